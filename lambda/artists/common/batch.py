@@ -0,0 +1,102 @@
+import os, time, random
+from concurrent.futures import ThreadPoolExecutor
+
+import boto3
+from botocore.config import Config
+from boto3.dynamodb.types import TypeDeserializer, TypeSerializer
+
+MAX_KEYS_PER_REQUEST = 100          # BatchGetItem hard limit
+MAX_WORKERS = int(os.environ.get("BATCH_GET_WORKERS", "8"))
+MAX_ATTEMPTS = int(os.environ.get("BATCH_GET_MAX_ATTEMPTS", "8"))
+BASE_DELAY = 0.05                   # seconds, doubled per retry
+MAX_DELAY = 2.0
+
+ddb = boto3.client("dynamodb", config=Config(max_pool_connections=max(10, MAX_WORKERS)))
+_deser = TypeDeserializer()
+_ser = TypeSerializer()
+
+# lives as long as the warm container, shared by every call
+_pool = ThreadPoolExecutor(max_workers=MAX_WORKERS)
+
+
+def _unmarshal(av_item: dict) -> dict:
+    return {k: _deser.deserialize(v) for k, v in av_item.items()}
+
+
+def _backoff(attempt: int):
+    # "full jitter": sleep somewhere in [0, base * 2^attempt]
+    time.sleep(random.uniform(0, min(MAX_DELAY, BASE_DELAY * (2 ** attempt))))
+
+
+def _get_chunk(table_name: str, keys: list[dict], projection: list[str] | None, consistent: bool) -> list[dict]:
+    """Fetch <= 100 keys, retrying UnprocessedKeys with jittered exponential backoff."""
+    request = {"Keys": [{k: _ser.serialize(v) for k, v in key.items()} for key in keys]}
+    if projection:
+        names = {f"#p{i}": attr for i, attr in enumerate(projection)}
+        request["ProjectionExpression"] = ",".join(names)
+        request["ExpressionAttributeNames"] = names
+    if consistent:
+        request["ConsistentRead"] = True
+
+    items = []
+    pending = {table_name: request}
+    for attempt in range(MAX_ATTEMPTS):
+        res = ddb.batch_get_item(RequestItems=pending)
+        items.extend(_unmarshal(av) for av in res.get("Responses", {}).get(table_name, []))
+
+        unprocessed = res.get("UnprocessedKeys", {})
+        if not unprocessed or not unprocessed.get(table_name, {}).get("Keys"):
+            return items
+        pending = unprocessed
+        _backoff(attempt)
+
+    print(f"batch_get: giving up on {len(pending[table_name]['Keys'])} unprocessed keys in {table_name}")
+    return items
+
+
+def batch_get(table_name: str, keys: list[dict], projection: list[str] | None = None,
+              consistent: bool = False) -> list[dict | None]:
+    """
+    BatchGetItem for any number of keys.
+
+    `keys` are plain python dicts (e.g. [{"musicId": "m1"}]). Chunks of 100 are
+    dispatched concurrently on a shared thread pool. The result is aligned with
+    `keys`: the item (or None if missing) at the same position. Key attributes are
+    always added to `projection` so results can be matched back to their keys.
+    """
+    if not keys:
+        return []
+
+    key_names = sorted(keys[0])
+    if projection:
+        projection = list(dict.fromkeys([*key_names, *projection]))
+
+    def ident(d):
+        return tuple(d.get(k) for k in key_names)
+
+    # dedupe while keeping the first position of every key
+    unique = list({ident(k): k for k in keys}.values())
+    chunks = [unique[i:i + MAX_KEYS_PER_REQUEST] for i in range(0, len(unique), MAX_KEYS_PER_REQUEST)]
+
+    if len(chunks) == 1:
+        results = [_get_chunk(table_name, chunks[0], projection, consistent)]
+    else:
+        results = _pool.map(lambda c: _get_chunk(table_name, c, projection, consistent), chunks)
+
+    found = {}
+    for items in results:
+        for it in items:
+            found[ident(it)] = it
+    return [found.get(ident(k)) for k in keys]
+
+
+def batch_get_by_id(table_name: str, key_name: str, ids, projection: list[str] | None = None,
+                    extra_key: dict | None = None, consistent: bool = False) -> dict:
+    """
+    Convenience wrapper: returns dict[id] = item for every id that exists.
+    `extra_key` is merged into each key, e.g. {"userId": uid} for a (userId, musicId) table.
+    """
+    ids = list(dict.fromkeys(i for i in ids if i))
+    keys = [{**(extra_key or {}), key_name: i} for i in ids]
+    items = batch_get(table_name, keys, projection=projection, consistent=consistent)
+    return {i: it for i, it in zip(ids, items) if it is not None}
@@ -3,6 +3,7 @@ import json
 import boto3
 from boto3.dynamodb.conditions import Key
 from decimal import Decimal
+from common.batch import batch_get_by_id
 
 def decimal_default(obj):
     if isinstance(obj, Decimal):
@@ -10,7 +11,6 @@ def decimal_default(obj):
     raise TypeError
 
 dynamodb = boto3.resource("dynamodb")
-client = boto3.client("dynamodb")
 
 artist_table = dynamodb.Table(os.environ["ARTISTS_TABLE"])
 info_table_name = os.environ["ARTIST_INFO_TABLE"]
@@ -47,29 +47,21 @@ def lambda_handler(event, context):
             return response(200, {"artists": []})
 
         # get artist profiles from ArtistInfoTable
-        def chunks(lst, n=100):
-            for i in range(0, len(lst), n):
-                yield lst[i:i+n]
+        profiles = batch_get_by_id(info_table_name, "artistId", artist_ids)
 
         artists = []
-        for chunk in chunks(artist_ids):
-            resp = client.batch_get_item(
-                RequestItems={
-                    info_table_name: {
-                        "Keys": [{"artistId": {"S": aid}} for aid in chunk]
-                    }
-                }
-            )
-            profiles = resp["Responses"].get(info_table_name, [])
-            for p in profiles:
-                artists.append({
-                    "artistId": p["artistId"]["S"],
-                    "name": p["name"]["S"],
-                    "lastname": p["lastname"]["S"],
-                    "age": int(p["age"]["N"]),
-                    "bio": p.get("bio", {}).get("S", ""),
-                    "genres": [g["S"] for g in p.get("genres", {}).get("L", [])]
-                })
+        for aid in artist_ids:
+            p = profiles.get(aid)
+            if not p:
+                continue
+            artists.append({
+                "artistId": p["artistId"],
+                "name": p["name"],
+                "lastname": p["lastname"],
+                "age": int(p["age"]),
+                "bio": p.get("bio", ""),
+                "genres": list(p.get("genres", []))
+            })
 
         return response(200, {"artists": artists})
 
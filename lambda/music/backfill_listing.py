@@ -0,0 +1,70 @@
+import os
+
+import boto3
+from boto3.dynamodb.conditions import Attr
+from botocore.exceptions import ClientError
+from common.scan import parallel_scan
+from common.song_records import LISTING_KEY, listing_key
+
+# One-off maintenance job: gives songs written before SongListingIndex existed a
+# listKey, so they show up in /music/all once get_songs reads the index (GSI_STAGE
+# 5 in projekat/config.py). Songs still under the unsharded LISTING_KEY ("songs",
+# written before the listing was sharded) are moved to their shard too.
+# Invoke it by hand; when the Lambda runs out of time it returns
+# {"done": false, "checkpoint": ...}, and invoking it again with that payload
+# continues. Safe to re-run: rows that already have a sharded listKey are left alone.
+
+dynamodb = boto3.resource("dynamodb")
+SONG_TABLE = os.environ["SONG_TABLE"]
+song_table = dynamodb.Table(SONG_TABLE)
+
+BACKFILL_SEGMENTS = int(os.environ.get("BACKFILL_SEGMENTS", "8"))
+# read capacity the scan may use, so the backfill doesn't starve the API
+BACKFILL_MAX_RCU = float(os.environ.get("BACKFILL_MAX_RCU", "200"))
+# stop scanning with this much time left, so the last updates still finish
+TIME_RESERVE_MS = 15000
+
+
+def assign_listing_key(music_id: str) -> bool:
+    """SET the song's sharded listKey. False if it was deleted or is already sharded."""
+    try:
+        song_table.update_item(
+            Key={"musicId": music_id},
+            UpdateExpression="SET listKey = :k",
+            ConditionExpression="attribute_exists(musicId) AND "
+                                "(attribute_not_exists(listKey) OR listKey = :legacy)",
+            ExpressionAttributeValues={":k": listing_key(music_id), ":legacy": LISTING_KEY},
+        )
+        return True
+    except ClientError as e:
+        if e.response["Error"]["Code"] != "ConditionalCheckFailedException":
+            raise
+        return False
+
+
+def lambda_handler(event, context):
+    event = event or {}
+    progress = {"checkpoint": event.get("checkpoint")}
+
+    def save(state):
+        progress["checkpoint"] = state
+
+    updated = 0
+    for it in parallel_scan(
+        SONG_TABLE,
+        segments=BACKFILL_SEGMENTS,
+        projection=["musicId"],
+        filter_expression=Attr("listKey").not_exists() | Attr("listKey").eq(LISTING_KEY),
+        max_rcu_per_second=BACKFILL_MAX_RCU,
+        checkpoint=progress["checkpoint"],
+        on_checkpoint=save,
+    ):
+        if assign_listing_key(it["musicId"]):
+            updated += 1
+        if context and context.get_remaining_time_in_millis() < TIME_RESERVE_MS:
+            # the checkpoint only covers fully handled pages, so this page is redone next run
+            print(f"⏸️ Listing backfill paused, {updated} songs updated in this run")
+            return {"done": False, "updated": updated, "checkpoint": progress["checkpoint"]}
+
+    print(f"✅ Listing backfill done, {updated} songs updated in this run")
+    return {"done": True, "updated": updated}
@@ -0,0 +1,49 @@
+import os, json, hmac, base64, hashlib
+from decimal import Decimal
+
+import boto3
+
+# Opaque pagination cursors: base64url(json payload) + "." + HMAC-SHA256 tag, so
+# clients can't forge ExclusiveStartKeys or read our key layout.
+# The key comes from LIST_CURSOR_SECRET_ARN (Secrets Manager, read once per
+# container) or, for local runs, LIST_CURSOR_SECRET.
+_key: bytes | None = None
+
+
+def _signing_key() -> bytes:
+    global _key
+    if _key is None:
+        arn = os.environ.get("LIST_CURSOR_SECRET_ARN")
+        if arn:
+            secret = boto3.client("secretsmanager").get_secret_value(SecretId=arn)["SecretString"]
+        else:
+            secret = os.environ["LIST_CURSOR_SECRET"]
+        _key = secret.encode()
+    return _key
+
+
+def _b64(data: bytes) -> str:
+    return base64.urlsafe_b64encode(data).decode().rstrip("=")
+
+
+def _unb64(text: str) -> bytes:
+    return base64.urlsafe_b64decode(text + "=" * (-len(text) % 4))
+
+
+def encode_cursor(payload) -> str:
+    body = json.dumps(payload, separators=(",", ":"), sort_keys=True, default=str).encode()
+    tag = hmac.new(_signing_key(), body, hashlib.sha256).digest()
+    return f"{_b64(body)}.{_b64(tag)}"
+
+
+def decode_cursor(cursor: str):
+    """Payload of a cursor made by encode_cursor. Raises ValueError if it was tampered with."""
+    try:
+        body_b64, tag_b64 = cursor.split(".", 1)
+        body, tag = _unb64(body_b64), _unb64(tag_b64)
+    except Exception:
+        raise ValueError("malformed cursor")
+    expected = hmac.new(_signing_key(), body, hashlib.sha256).digest()
+    if not hmac.compare_digest(tag, expected):
+        raise ValueError("invalid cursor signature")
+    return json.loads(body, parse_float=Decimal)
@@ -0,0 +1,117 @@
+import queue
+import threading
+import time
+
+import boto3
+
+# Parallel segmented Scan for catalog-wide maintenance (backfills, reindexing,
+# cleanups). TotalSegments workers scan their slice of the table concurrently and
+# hand pages to a single consuming generator, so callers just iterate items.
+
+DEFAULT_SEGMENTS = 8
+SEGMENT_DONE = "done"
+_END = object()
+
+
+class _CapacityLimiter:
+    """Keeps the consumed read capacity of all segments under `per_second` RCUs."""
+    def __init__(self, per_second: float, burst_seconds: float = 1.0):
+        self.rate = per_second
+        self.burst = burst_seconds
+        self.lock = threading.Lock()
+        self.free_at = time.monotonic()
+
+    def spend(self, units: float):
+        with self.lock:
+            now = time.monotonic()
+            self.free_at = max(self.free_at, now - self.burst) + units / self.rate
+            wait = self.free_at - now
+        if wait > 0:
+            time.sleep(wait)
+
+
+def parallel_scan(table_name: str, *, segments: int = DEFAULT_SEGMENTS, projection=None,
+                  filter_expression=None, consistent: bool = False, page_size: int | None = None,
+                  max_rcu_per_second: float | None = None, checkpoint: dict | None = None,
+                  on_checkpoint=None):
+    """
+    Yield every item of `table_name` (optionally filtered / projected), scanning
+    `segments` slices in parallel.
+
+    - filter_expression: a boto3.dynamodb.conditions expression (Attr(...)).
+    - max_rcu_per_second: throttle on ConsumedCapacity across all segments.
+    - checkpoint / on_checkpoint: resumable progress. The state is
+      {"segments": n, "<segment>": LastEvaluatedKey | "done"} (string keys, so
+      it survives a JSON round trip); on_checkpoint(state) is called after
+      every page whose items have all been yielded, and passing that state back
+      as `checkpoint` resumes from there (items are seen at least once).
+    Items come in no particular order.
+    """
+    state = dict(checkpoint or {})
+    if checkpoint and checkpoint.get("segments", segments) != segments:
+        raise ValueError("checkpoint was taken with a different number of segments")
+    state["segments"] = segments
+    pending = [s for s in range(segments) if state.get(str(s)) != SEGMENT_DONE]
+    if not pending:
+        return
+
+    limiter = _CapacityLimiter(max_rcu_per_second) if max_rcu_per_second else None
+    pages: queue.Queue = queue.Queue(maxsize=segments * 2)   # backpressure on slow consumers
+    stop = threading.Event()
+
+    def worker(segment: int):
+        try:
+            # sessions/resources are not shared across threads
+            table = boto3.session.Session().resource("dynamodb").Table(table_name)
+            kwargs = {"Segment": segment, "TotalSegments": segments, "ConsistentRead": consistent,
+                      "ReturnConsumedCapacity": "TOTAL"}
+            if projection:
+                names = {f"#p{i}": a for i, a in enumerate(projection)}
+                kwargs["ProjectionExpression"] = ",".join(names)
+                kwargs["ExpressionAttributeNames"] = names
+            if filter_expression is not None:
+                kwargs["FilterExpression"] = filter_expression
+            if page_size:
+                kwargs["Limit"] = page_size
+            if state.get(str(segment)):
+                kwargs["ExclusiveStartKey"] = state[str(segment)]
+
+            while not stop.is_set():
+                resp = table.scan(**kwargs)
+                if limiter:
+                    limiter.spend(resp.get("ConsumedCapacity", {}).get("CapacityUnits", 0))
+                last = resp.get("LastEvaluatedKey")
+                pages.put((segment, resp.get("Items", []), last or SEGMENT_DONE))
+                if not last:
+                    break
+                kwargs["ExclusiveStartKey"] = last
+        except Exception as e:
+            pages.put((segment, e, None))
+        finally:
+            pages.put((segment, _END, None))
+
+    threads = [threading.Thread(target=worker, args=(s,), daemon=True) for s in pending]
+    for t in threads:
+        t.start()
+
+    running = len(threads)
+    try:
+        while running:
+            segment, items, position = pages.get()
+            if items is _END:
+                running -= 1
+                continue
+            if isinstance(items, Exception):
+                raise items
+            yield from items
+            state[str(segment)] = position
+            if on_checkpoint:
+                on_checkpoint(dict(state))
+    finally:
+        stop.set()
+        # unblock workers waiting on a full queue so they can exit
+        while any(t.is_alive() for t in threads):
+            try:
+                pages.get(timeout=0.1)
+            except queue.Empty:
+                pass
@@ -0,0 +1,45 @@
+import os, json
+
+import boto3
+
+# Song lifecycle events for the feed fan-out. Request handlers only drop one
+# message per song on SONG_EVENT_QUEUE_URL; the song_fanout worker resolves the
+# affected users (subscribers, feed holders) and queues their recomputes, so a
+# genre with 50k subscribers costs the upload/update/delete request one SQS call.
+NEW_SONG = "new_song"
+UPDATE_SONG = "update_song"
+DELETE_SONG = "delete_song"
+
+SEND_BATCH_SIZE = 10    # SendMessageBatch limit
+
+sqs = boto3.client("sqs")
+
+
+def song_event(kind: str, music_id: str, artist_ids=(), genres=(), **extra) -> dict:
+    return {
+        "event": kind,
+        "musicId": music_id,
+        "artistIds": list(artist_ids or []),
+        "genres": list(genres or []),
+        **extra,
+    }
+
+
+def publish_song_events(events: list[dict]) -> int:
+    """Send events in SendMessageBatch calls, retrying failed entries once. Returns how many failed."""
+    failed_total = 0
+    for i in range(0, len(events), SEND_BATCH_SIZE):
+        entries = [
+            {"Id": str(n), "MessageBody": json.dumps(ev, default=str)}
+            for n, ev in enumerate(events[i:i + SEND_BATCH_SIZE])
+        ]
+        for attempt in range(2):
+            resp = sqs.send_message_batch(QueueUrl=os.environ["SONG_EVENT_QUEUE_URL"], Entries=entries)
+            failed = {f["Id"] for f in resp.get("Failed", [])}
+            entries = [e for e in entries if e["Id"] in failed]
+            if not entries:
+                break
+        failed_total += len(entries)
+    if failed_total:
+        print(f"⚠️ {failed_total} song events could not be sent")
+    return failed_total
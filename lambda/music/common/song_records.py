@@ -0,0 +1,110 @@
+import os
+import zlib
+import boto3
+
+dynamo_client = boto3.client("dynamodb")
+
+SONG_TABLE = os.environ["SONG_TABLE"]
+MUSIC_BY_GENRE_TABLE = os.environ["MUSIC_BY_GENRE_TABLE"]
+ARTIST_INFO_TABLE = os.environ["ARTIST_INFO_TABLE"]
+
+# catalog listing is write-sharded over LISTING_SHARDS partitions of SongListingIndex
+# (same constants in get_songs.py; changing the count needs a re-shard)
+LISTING_KEY = "songs"
+LISTING_SHARDS = 8
+
+
+def listing_key(music_id: str) -> str:
+    """Listing partition for a song: stable, evenly spread over the shards."""
+    return f"{LISTING_KEY}#{zlib.crc32(music_id.encode()) % LISTING_SHARDS}"
+
+
+def _chunked(iterable, size):
+    """Yield lists of length <= size from iterable."""
+    chunk = []
+    for item in iterable:
+        chunk.append(item)
+        if len(chunk) == size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+def build_song_actions(*, music_id, title, file_name, file_key, file_url, file_size,
+                       artist_ids, genres, album_id, cover_url, now):
+    """TransactWriteItems actions for SONG_TABLE, MUSIC_BY_GENRE_TABLE and ARTIST_INFO_TABLE."""
+    file_ext = (file_name.rsplit(".", 1)[-1] if "." in file_name else "").lower()
+
+    actions = []
+
+    # 1) SONG_TABLE
+    actions.append({
+        "Put": {
+            "TableName": SONG_TABLE,
+            "Item": {
+                "musicId": {"S": music_id},
+                "title": {"S": title},
+                "fileName": {"S": file_name},
+                "fileType": {"S": file_ext or "unknown"},
+                "fileSize": {"N": str(file_size)},
+                "createdAt": {"S": now},
+                "updatedAt": {"S": now},
+                "artistIds": {"L": [{"S": a} for a in artist_ids]},
+                "albumId": {"S": album_id} if album_id else {"NULL": True},
+                "fileUrl": {"S": file_url},
+                "fileKey": {"S": file_key},
+                "coverUrl": {"S": cover_url} if cover_url else {"NULL": True},
+                "genres": {"L": [{"S": g} for g in genres]},
+                # catalog listing (get_songs, SongListingIndex)
+                "listKey": {"S": listing_key(music_id)},
+            },
+            "ConditionExpression": "attribute_not_exists(musicId)",
+        }
+    })
+
+    # 2) MUSIC_BY_GENRE_TABLE
+    for genre in genres:
+        item = {
+            "genre": {"S": genre},
+            "musicId": {"S": music_id},
+            "createdAt": {"S": now},
+        }
+        if album_id:
+            item["albumId"] = {"S": album_id}
+        actions.append({"Put": {"TableName": MUSIC_BY_GENRE_TABLE, "Item": item}})
+
+    # 3) For each artist, append musicId to their songs list
+    for artist_id in artist_ids:
+        actions.append({
+            "Update": {
+                "TableName": ARTIST_INFO_TABLE,
+                "Key": {
+                    "artistId": {"S": artist_id}
+                },
+                "UpdateExpression": "SET #songs = list_append(if_not_exists(#songs, :empty_list), :new_song)",
+                "ExpressionAttributeNames": {
+                    "#songs": "songs"
+                },
+                "ExpressionAttributeValues": {
+                    ":new_song": {"L": [{"S": music_id}]},
+                    ":empty_list": {"L": []}
+                }
+            }
+        })
+
+    return actions
+
+
+def write_song_records(actions):
+    """
+    DynamoDB TransactWriteItems has a limit of 25 actions per request.
+    If we exceed it (rare—only with many genres+artists), we split into chunks.
+    We always write the SONG_TABLE put first to ensure ID existence.
+    """
+    if len(actions) <= 25:
+        dynamo_client.transact_write_items(TransactItems=actions)
+    else:
+        dynamo_client.transact_write_items(TransactItems=[actions[0]])
+        for batch in _chunked(actions[1:], 25):
+            dynamo_client.transact_write_items(TransactItems=batch)
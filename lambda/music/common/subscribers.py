@@ -0,0 +1,33 @@
+from boto3.dynamodb.conditions import Key
+
+SUBSCRIBERS_INDEX = "SubscriptionTypeTargetIdIndex"    # PK=subscriptionType, SK=targetId
+
+
+def iter_subscribers(subs_table, subscription_type: str, target_id: str,
+                     attributes=("userId",), page_size: int = 1000):
+    """
+    Lazily yield subscription rows (only `attributes`) for an artist or genre,
+    following LastEvaluatedKey so large audiences are never truncated at 1 MB.
+    Only one page is held in memory at a time.
+    """
+    names = {f"#a{i}": a for i, a in enumerate(attributes)}
+    kwargs = {
+        "IndexName": SUBSCRIBERS_INDEX,
+        "KeyConditionExpression": Key("subscriptionType").eq(subscription_type) & Key("targetId").eq(target_id),
+        "ProjectionExpression": ",".join(names),
+        "ExpressionAttributeNames": names,
+        "Limit": page_size,
+    }
+    while True:
+        resp = subs_table.query(**kwargs)
+        yield from resp.get("Items", [])
+        last = resp.get("LastEvaluatedKey")
+        if not last:
+            return
+        kwargs["ExclusiveStartKey"] = last
+
+
+def iter_subscriber_ids(subs_table, subscription_type: str, target_id: str):
+    """Lazily yield the userIds subscribed to an artist or genre."""
+    for item in iter_subscribers(subs_table, subscription_type, target_id):
+        yield item["userId"]
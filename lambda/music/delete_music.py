@@ -2,14 +2,14 @@ import json
 import os
 import boto3
 from botocore.exceptions import ClientError
-from boto3.dynamodb.conditions import Attr
+from boto3.dynamodb.conditions import Key
 from urllib.parse import urlparse
 from typing import List, Dict, Any
-from common.queue import enqueue_recompute
-from boto3.dynamodb.conditions import Key
+from common.song_events import DELETE_SONG, song_event, publish_song_events
 
 SONG_TABLE = os.environ.get("SONG_TABLE", "SongTable")
 MUSIC_BY_GENRE_TABLE = os.environ.get("MUSIC_BY_GENRE_TABLE", "MusicByGenre")
+MUSIC_ID_INDEX = os.environ.get("MUSIC_ID_INDEX", "MusicIdIndex")   # PK: musicId, SK: genre
 S3_BUCKET = os.environ["S3_BUCKET"]
 ARTIST_INFO_TABLE = os.environ["ARTIST_INFO_TABLE"]
 
@@ -20,7 +20,6 @@ s3 = boto3.client("s3")
 song_table = dynamodb.Table(SONG_TABLE)
 genre_table = dynamodb.Table(MUSIC_BY_GENRE_TABLE)
 artist_info_table = dynamodb.Table(ARTIST_INFO_TABLE)
-subs_table = dynamodb.Table(os.environ["USER_SUBSCRIPTIONS_TABLE"])
 
 
 
@@ -50,24 +49,22 @@ def _extract_s3_key(u: str | None) -> str | None:
     return path
 
 
-def _scan_index_rows_for_music(music_id: str) -> List[Dict[str, Any]]:
+def _index_rows_for_music(music_id: str) -> List[Dict[str, Any]]:
     """
-    Fallback: return all rows from MUSIC_BY_GENRE_TABLE with the given musicId.
-    Uses Scan + FilterExpression (no GSI required). Paginates until done.
+    Fallback: return all rows from MUSIC_BY_GENRE_TABLE with the given musicId,
+    via MUSIC_ID_INDEX (PK=musicId, SK=genre). Paginates until done.
     """
     items: List[Dict[str, Any]] = []
-    scan_kwargs = {
-        "FilterExpression": Attr("musicId").eq(music_id),
-        "ProjectionExpression": "#g,#m",
-        "ExpressionAttributeNames": {"#g": "genre", "#m": "musicId"},
-        "ConsistentRead": True,
+    query_kwargs = {
+        "IndexName": MUSIC_ID_INDEX,
+        "KeyConditionExpression": Key("musicId").eq(music_id),
     }
-    res = genre_table.scan(**scan_kwargs)
-    items.extend(res.get("Items", []))
-    while "LastEvaluatedKey" in res:
-        res = genre_table.scan(ExclusiveStartKey=res["LastEvaluatedKey"], **scan_kwargs)
+    while True:
+        res = genre_table.query(**query_kwargs)
         items.extend(res.get("Items", []))
-    return items
+        if "LastEvaluatedKey" not in res:
+            return items
+        query_kwargs["ExclusiveStartKey"] = res["LastEvaluatedKey"]
 
 
 def _build_txn_deletes(music_id: str, genres: List[str], include_song_delete: bool, max_per_batch: int = 25) -> List[List[Dict[str, Any]]]:
@@ -148,12 +145,12 @@ def lambda_handler(event, context):
 
         if genres_from_song:
             index_rows_count = len(set([s.strip() for s in genres_from_song if str(s).strip()]))
-            used_fallback_scan = False
+            used_index_query = False
         else:
-            idx_rows = _scan_index_rows_for_music(music_id)
+            idx_rows = _index_rows_for_music(music_id)
             genres_from_song = [it.get("genre") for it in idx_rows if it.get("genre")]
             index_rows_count = len(idx_rows)
-            used_fallback_scan = True
+            used_index_query = True
 
         if not song_item and index_rows_count == 0:
             return response(404, {"error": f"No records found for musicId: {music_id}"})
@@ -206,28 +203,9 @@ def lambda_handler(event, context):
                     pass
 
 
-        # --- Recompute feed for subscribed users ---
+        # --- Recompute feed for subscribed users (fanned out asynchronously by song_fanout) ---
         try:
-            # notify users subscribed by genre
-            for g in genres_from_song:
-                resp = subs_table.query(
-                    IndexName="SubscriptionTypeTargetIdIndex",
-                    KeyConditionExpression=Key("subscriptionType").eq("genre") & Key("targetId").eq(g)
-                )
-                for item in resp.get("Items", []):
-                    user_id = item["userId"]
-                    enqueue_recompute(user_id, "delete_song_genre", music_id)
-
-            # notify users subscribed by artist
-            for artist_id in artist_ids:
-                resp = subs_table.query(
-                    IndexName="SubscriptionTypeTargetIdIndex",
-                    KeyConditionExpression=Key("subscriptionType").eq("artist") & Key("targetId").eq(artist_id)
-                )
-                for item in resp.get("Items", []):
-                    user_id = item["userId"]
-                    enqueue_recompute(user_id, "delete_song_artist", music_id)
-
+            publish_song_events([song_event(DELETE_SONG, music_id, artist_ids, genres_from_song)])
         except Exception as e:
             print(f"⚠️ Failed to enqueue recompute jobs on delete: {e}")
 
@@ -236,7 +214,7 @@ def lambda_handler(event, context):
             "musicId": music_id,
             "deletedSong": bool(song_item),
             "deletedIndexRows": index_rows_count,
-            "indexDeletionSource": "song.genres" if not used_fallback_scan else "scan",
+            "indexDeletionSource": "song.genres" if not used_index_query else "musicIdIndex",
             "deletedS3Files": deleted_files,
             "deletedCoverImages": deleted_covers,
         })
@@ -1,17 +1,28 @@
 import json
 import os
+from collections import defaultdict
 from typing import List, Dict, Any
+from urllib.parse import urlparse
 import boto3
 from botocore.exceptions import ClientError
+from boto3.dynamodb.conditions import Key
+from common.batch import batch_get_by_id
+from common.song_events import DELETE_SONG, song_event, publish_song_events
 
 # ---- Env ----
 SONG_TABLE = os.environ["SONG_TABLE"]                 # PK: musicId
 MUSIC_BY_GENRE_TABLE = os.environ["MUSIC_BY_GENRE_TABLE"]  # PK: genre, SK: musicId
+MUSIC_ID_INDEX = os.environ.get("MUSIC_ID_INDEX", "MusicIdIndex")   # PK: musicId, SK: genre
 ARTIST_INFO_TABLE = os.environ["ARTIST_INFO_TABLE"]   # PK: artistId
+S3_BUCKET = os.environ["S3_BUCKET"]
+
+S3_DELETE_BATCH = 1000          # DeleteObjects limit
+ARTIST_UPDATE_ATTEMPTS = 3      # re-read + retry when the songs list changed under us
+SONG_FIELDS = ["genres", "artistIds", "fileKey", "fileUrl", "coverUrl"]
 
 # ---- AWS ----
 dynamodb = boto3.resource("dynamodb")
-ddb = boto3.client("dynamodb")
+s3 = boto3.client("s3")
 
 song_table = dynamodb.Table(SONG_TABLE)
 music_by_genre_table = dynamodb.Table(MUSIC_BY_GENRE_TABLE)
@@ -38,49 +49,107 @@ def _chunked(seq, n):
     if buf:
         yield buf
 
-def _load_song(music_id: str) -> Dict[str, Any] | None:
-    return song_table.get_item(Key={"musicId": music_id}).get("Item")
-
-def _delete_song_and_index(music_id: str, genres: List[str]) -> int:
-    """Delete the SONG_TABLE row and all (genre, musicId) rows in MUSIC_BY_GENRE_TABLE.
-       Returns how many index rows were deleted.
+def _str_list(value) -> List[str]:
+    return [v for v in value if isinstance(v, str) and v] if isinstance(value, list) else []
+
+def _extract_s3_key(u: str | None) -> str | None:
+    if not u:
+        return None
+    path = (urlparse(u).path or "").lstrip("/")
+    if path.startswith(f"{S3_BUCKET}/"):
+        path = path.split("/", 1)[1]
+    return path or None
+
+def _song_object_keys(song: Dict[str, Any]) -> List[str]:
+    keys = [song.get("fileKey") or _extract_s3_key(song.get("fileUrl")), _extract_s3_key(song.get("coverUrl"))]
+    return [k for k in keys if k]
+
+def _index_genres(music_id: str) -> List[str]:
+    """Genres of the music's MUSIC_BY_GENRE_TABLE rows, via MUSIC_ID_INDEX (for songs without a genres list)."""
+    genres: List[str] = []
+    query_kwargs = {
+        "IndexName": MUSIC_ID_INDEX,
+        "KeyConditionExpression": Key("musicId").eq(music_id),
+    }
+    while True:
+        res = music_by_genre_table.query(**query_kwargs)
+        genres.extend(it["genre"] for it in res.get("Items", []) if it.get("genre"))
+        if "LastEvaluatedKey" not in res:
+            return genres
+        query_kwargs["ExclusiveStartKey"] = res["LastEvaluatedKey"]
+
+def _delete_index_rows(genres_by_id: Dict[str, List[str]]) -> int:
+    """Delete every (genre, musicId) row with BatchWriteItem (25 per call)."""
+    deleted = 0
+    with music_by_genre_table.batch_writer() as batch:
+        for mid, genres in genres_by_id.items():
+            for g in genres:
+                batch.delete_item(Key={"genre": g, "musicId": mid})
+                deleted += 1
+    return deleted
+
+def _delete_song_rows(music_ids) -> None:
+    with song_table.batch_writer() as batch:
+        for mid in music_ids:
+            batch.delete_item(Key={"musicId": mid})
+
+def _remove_music_from_artist(aid: str, music_ids: set) -> Dict[str, Any]:
     """
-    # delete song row
-    song_table.delete_item(Key={"musicId": music_id})
-
-    deleted_idx = 0
-    for g in genres or []:
-        if not g:
-            continue
-        music_by_genre_table.delete_item(Key={"genre": g, "musicId": music_id})
-        deleted_idx += 1
-    return deleted_idx
-
-def _remove_music_from_artists(artist_ids: List[str], music_id: str) -> List[Dict[str, Any]]:
-    """For each artistId, read ARTIST_INFO_TABLE and remove music_id from 'songs' list."""
+    Remove all of `music_ids` from one artist's 'songs' list in a single write.
+    The write is conditioned on the list it was computed from, so a concurrent
+    upload/delete for the same artist is not lost; on conflict it re-reads.
+    """
+    for _ in range(ARTIST_UPDATE_ATTEMPTS):
+        doc = artist_info_table.get_item(Key={"artistId": aid}, ConsistentRead=True).get("Item")
+        if not doc:
+            return {"artistId": aid, "removed": 0, "newSongCount": 0}
+        songs = doc.get("songs") or []
+        if not isinstance(songs, list):
+            songs = []
+        new_songs = [m for m in songs if m not in music_ids]
+        if len(new_songs) == len(songs):
+            return {"artistId": aid, "removed": 0, "newSongCount": len(songs)}
+        try:
+            artist_info_table.update_item(
+                Key={"artistId": aid},
+                UpdateExpression="SET #s = :ns",
+                ConditionExpression="#s = :old",
+                ExpressionAttributeNames={"#s": "songs"},
+                ExpressionAttributeValues={":ns": new_songs, ":old": songs},
+            )
+            return {"artistId": aid, "removed": len(songs) - len(new_songs), "newSongCount": len(new_songs),
+                    "removedMusicIds": [m for m in songs if m in music_ids]}
+        except ClientError as e:
+            if e.response["Error"]["Code"] != "ConditionalCheckFailedException":
+                raise
+    return {"artistId": aid, "error": "songs list kept changing, giving up"}
+
+def _remove_music_from_artists(removed_by_artist: Dict[str, set]) -> List[Dict[str, Any]]:
+    """One aggregated 'songs' update per artist instead of one per (artist, song)."""
     results = []
-    for aid in set([a for a in (artist_ids or []) if a]):
+    for aid, music_ids in removed_by_artist.items():
         try:
-            doc = artist_info_table.get_item(Key={"artistId": aid}).get("Item") or {}
-            songs = doc.get("songs") or []
-            if not isinstance(songs, list):
-                songs = []
-
-            if music_id in songs:
-                new_songs = [m for m in songs if m != music_id]
-                artist_info_table.update_item(
-                    Key={"artistId": aid},
-                    UpdateExpression="SET #s = :ns",
-                    ExpressionAttributeNames={"#s": "songs"},
-                    ExpressionAttributeValues={":ns": new_songs},
-                )
-                results.append({"artistId": aid, "removed": 1, "newSongCount": len(new_songs)})
-            else:
-                results.append({"artistId": aid, "removed": 0, "newSongCount": len(songs)})
+            results.append(_remove_music_from_artist(aid, music_ids))
         except Exception as e:
             results.append({"artistId": aid, "error": str(e)})
     return results
 
+def _delete_objects(keys: List[str]) -> tuple[int, List[Dict[str, Any]]]:
+    """S3 DeleteObjects in batches of 1000. Returns (deleted count, errors)."""
+    deleted, errors = 0, []
+    for chunk in _chunked(list(dict.fromkeys(keys)), S3_DELETE_BATCH):
+        try:
+            res = s3.delete_objects(
+                Bucket=S3_BUCKET,
+                Delete={"Objects": [{"Key": k} for k in chunk], "Quiet": True},
+            )
+            failed = res.get("Errors", [])
+            errors.extend({"key": f.get("Key"), "error": f.get("Message")} for f in failed)
+            deleted += len(chunk) - len(failed)
+        except Exception as e:
+            errors.extend({"key": k, "error": str(e)} for k in chunk)
+    return deleted, errors
+
 def lambda_handler(event, context):
     # CORS preflight
     if event.get("httpMethod") == "OPTIONS":
@@ -103,50 +172,79 @@ def lambda_handler(event, context):
                 seen.add(s)
                 ids.append(s)
 
-        per_song_results = []
-        total_deleted_songs = 0
-        total_deleted_index = 0
-        artists_touched: Dict[str, int] = {}
-        artist_updates_detail: List[Dict[str, Any]] = []
+        # 1) read every song up front (BatchGetItem, 100 keys per call)
+        songs = batch_get_by_id(SONG_TABLE, "musicId", ids, projection=SONG_FIELDS, consistent=True)
 
+        # songs written before they carried a genres list may still have index rows;
+        # like delete_music, find those through MUSIC_ID_INDEX (only for those songs,
+        # ids without a song row are reported as not_found)
+        genres_by_id = {}
         for mid in ids:
-            song = _load_song(mid)
-            if not song:
-                per_song_results.append({"musicId": mid, "status": "not_found"})
+            if mid not in songs:
                 continue
+            genres = _str_list(songs[mid].get("genres")) or _index_genres(mid)
+            genres_by_id[mid] = sorted(set(genres))
 
-            genres = song.get("genres") or []
-            if not isinstance(genres, list):
-                genres = []
-            artist_ids = song.get("artistIds") or []
-            if not isinstance(artist_ids, list):
-                artist_ids = []
-
-            deleted_idx = _delete_song_and_index(mid, genres)
-            total_deleted_index += deleted_idx
-            total_deleted_songs += 1
-
-            # Update artist_info.songs for all referenced artists
-            updates = _remove_music_from_artists(artist_ids, mid)
-            artist_updates_detail.extend(updates)
-            for u in updates:
-                aid = u.get("artistId")
-                if aid and not u.get("error"):
-                    artists_touched[aid] = artists_touched.get(aid, 0) + (u.get("removed", 0) or 0)
+        # 2) index rows, artist lists and S3 objects first, song rows last: if the
+        #    call dies midway the song rows are still there and a retry finishes the job
+        total_deleted_index = _delete_index_rows(genres_by_id)
 
+        removed_by_artist: Dict[str, set] = defaultdict(set)
+        for mid, song in songs.items():
+            for aid in _str_list(song.get("artistIds")):
+                removed_by_artist[aid].add(mid)
+        artist_updates = _remove_music_from_artists(removed_by_artist)
+        artists_touched = {u["artistId"]: u["removed"] for u in artist_updates if not u.get("error")}
+        updates_by_artist = {u["artistId"]: u for u in artist_updates}
+
+        object_keys = [k for song in songs.values() for k in _song_object_keys(song)]
+        deleted_objects, s3_errors = _delete_objects(object_keys)
+
+        _delete_song_rows(songs)
+
+        # 3) feed recomputes for subscribers and feed holders (fanned out asynchronously by song_fanout)
+        try:
+            publish_song_events([
+                song_event(DELETE_SONG, mid, _str_list((songs.get(mid) or {}).get("artistIds")), genres)
+                for mid, genres in genres_by_id.items()
+            ])
+        except Exception as e:
+            print(f"⚠️ Failed to enqueue recompute jobs on batch delete: {e}")
+
+        per_song_results = []
+        for mid in ids:
+            if mid not in genres_by_id:
+                per_song_results.append({"musicId": mid, "status": "not_found"})
+                continue
+            song = songs.get(mid) or {}
+            # same per-song shape as before the artist updates were aggregated
+            updates = []
+            for aid in _str_list(song.get("artistIds")):
+                u = updates_by_artist.get(aid, {})
+                if u.get("error"):
+                    updates.append({"artistId": aid, "error": u["error"]})
+                else:
+                    updates.append({
+                        "artistId": aid,
+                        "removed": 1 if mid in u.get("removedMusicIds", []) else 0,
+                        "newSongCount": u.get("newSongCount", 0),
+                    })
             per_song_results.append({
                 "musicId": mid,
-                "deletedSong": True,
-                "deletedIndexRows": deleted_idx,
+                "deletedSong": mid in songs,
+                "deletedIndexRows": len(genres_by_id[mid]),
                 "artistUpdates": updates,
             })
 
         return response(200, {
             "message": "Batch delete complete.",
             "requested": len(ids),
-            "deletedSongs": total_deleted_songs,
+            "deletedSongs": len(songs),
             "deletedIndexRows": total_deleted_index,
             "artistsUpdated": artists_touched,
+            "artistUpdates": artist_updates,
+            "deletedObjects": deleted_objects,
+            "s3Errors": s3_errors,
             "results": per_song_results,
         })
 
@@ -2,14 +2,12 @@ import json
 import os
 import boto3
 from boto3.dynamodb.conditions import Key
-from boto3.dynamodb.types import TypeDeserializer
 from decimal import Decimal
 from botocore.exceptions import ClientError
-from urllib.parse import urlparse
+from common.batch import batch_get_by_id
+from common.presign import presign_from_full_url
 
 dynamodb = boto3.resource("dynamodb")
-ddb = boto3.client("dynamodb")  # client for batch_get_item
-s3c = boto3.client("s3")
 
 MUSIC_BY_GENRE_TABLE = os.environ.get("MUSIC_BY_GENRE_TABLE", "MusicByGenre")  # PK: genre, SK: musicId
 SONG_TABLE = os.environ.get("SONG_TABLE", "SongTable")                          # PK: musicId
@@ -17,7 +15,6 @@ S3_BUCKET = os.environ["S3_BUCKET"]
 
 genre_table = dynamodb.Table(MUSIC_BY_GENRE_TABLE)
 song_table = dynamodb.Table(SONG_TABLE)
-_deser = TypeDeserializer()
 
 def decimal_default(obj):
     if isinstance(obj, Decimal):
@@ -35,67 +32,12 @@ def response(status_code, body):
         "body": json.dumps(body, default=decimal_default, ensure_ascii=False)
     }
 
-def _unmarshal(av_item: dict) -> dict:
-    return {k: _deser.deserialize(v) for k, v in av_item.items()}
-
-def _extract_key_from_url(u: str | None) -> str | None:
-    if not u:
-        return None
-    p = urlparse(u)
-    path = (p.path or "").lstrip("/")
-    # Virtual-hosted or path-style
-    if p.netloc.startswith(f"{S3_BUCKET}.") or p.netloc == S3_BUCKET:
-        return path or None
-    if path.startswith(f"{S3_BUCKET}/"):
-        return path.split("/", 1)[1] or None
-    return path or None
-
-def _presign_from_full_url(u: str | None, expires: int = 3600) -> str | None:
-    key = _extract_key_from_url(u)
-    if not key:
-        return None
-    return s3c.generate_presigned_url(
-        "get_object", Params={"Bucket": S3_BUCKET, "Key": key}, ExpiresIn=expires
-    )
-
 def _batch_get_songs_by_ids(ids):
-    """BatchGet from SONG_TABLE (client API); returns dict[mid] = item with title/cover/album."""
-    found = {}
-    if not ids:
-        return found
-    CHUNK = 100
-    proj_expr = "#mid,#title,#curl,#alb,#genre,#genres"
-    expr_names = {
-        "#mid": "musicId",
-        "#title": "title",
-        "#curl": "coverUrl",
-        "#alb": "albumId",
-        "#genre": "genre",
-        "#genres": "genres",
-    }
-
-    for i in range(0, len(ids), CHUNK):
-        keys = [{"musicId": {"S": mid}} for mid in ids[i:i+CHUNK]]
-        req = {
-            song_table.name: {
-                "Keys": keys,
-                "ProjectionExpression": proj_expr,
-                "ExpressionAttributeNames": expr_names,
-            }
-        }
-        for _ in range(5):
-            res = ddb.batch_get_item(RequestItems=req)
-            items = res.get("Responses", {}).get(song_table.name, [])
-            for av in items:
-                it = _unmarshal(av)
-                mid = it.get("musicId")
-                if mid:
-                    found[mid] = it
-            unp = res.get("UnprocessedKeys", {})
-            if not unp or not unp.get(song_table.name, {}).get("Keys"):
-                break
-            req = unp
-    return found
+    """BatchGet from SONG_TABLE; returns dict[mid] = item with title/cover/album."""
+    return batch_get_by_id(
+        song_table.name, "musicId", ids,
+        projection=["title", "coverUrl", "albumId", "genre", "genres"],
+    )
 
 def lambda_handler(event, context):
     # CORS preflight
@@ -153,7 +95,7 @@ def lambda_handler(event, context):
             for mid in data["musicIds"]:
                 song = songs_by_id.get(mid, {})
                 if not cover and song.get("coverUrl"):
-                    cover = _presign_from_full_url(song["coverUrl"]) or song["coverUrl"]
+                    cover = presign_from_full_url(song["coverUrl"]) or song["coverUrl"]
 
                 genre_value = song.get("genres") or song.get("genre")
                 if isinstance(genre_value, list):
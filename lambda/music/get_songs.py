@@ -1,13 +1,16 @@
 import os
 import json
+import heapq
 import boto3
 import decimal
-from urllib.parse import urlparse
+from concurrent.futures import ThreadPoolExecutor
 from boto3.dynamodb.types import TypeDeserializer
+from boto3.dynamodb.conditions import Key
 from botocore.exceptions import ClientError
+from common.cursors import encode_cursor, decode_cursor
+from common.presign import presign_from_full_url
 
 # --- AWS setup ---
-s3c = boto3.client("s3")
 dynamodb = boto3.resource("dynamodb")
 ddb = boto3.client("dynamodb")
 
@@ -17,6 +20,22 @@ S3_BUCKET = os.environ["S3_BUCKET"]
 song_table = dynamodb.Table(SONG_TABLE)
 _deser = TypeDeserializer()
 
+# Newest-first catalog listing: SONG_LISTING_INDEX (PK=listKey, SK=createdAt) holds
+# every song, with the display fields projected, under one of LISTING_SHARDS
+# partitions "songs#<n>" (assigned at upload, common/song_records.py) so browsing
+# doesn't pile onto one key. A page queries all shards in parallel and k-way
+# merges them; the cursor keeps a position per shard. Never reads transcriptText.
+SONG_LISTING_INDEX = os.environ.get("SONG_LISTING_INDEX", "SongListingIndex")
+# "scan" until the listing backfill has given every older song a sharded listKey
+# (GSI_STAGE in projekat/config.py): pages then come from a projected table scan
+SONG_LISTING_SOURCE = os.environ.get("SONG_LISTING_SOURCE", "index")
+LISTING_KEY = "songs"
+LISTING_SHARDS = 8
+LISTING_FIELDS = ["musicId", "title", "artistIds", "albumId", "fileUrl", "coverUrl",
+                  "fileName", "fileType", "fileSize", "createdAt", "updatedAt", "genres"]
+DEFAULT_PAGE_SIZE = 50
+MAX_PAGE_SIZE = 100
+
 
 # --- Helpers ---
 class DecimalEncoder(json.JSONEncoder):
@@ -40,71 +59,137 @@ def response(status, body):
     }
 
 
-def _extract_key_from_url(u: str | None) -> str | None:
-    if not u:
-        return None
-    p = urlparse(u)
-    path = (p.path or "").lstrip("/")
-    if p.netloc.startswith(f"{S3_BUCKET}.") or p.netloc == S3_BUCKET:
-        return path or None
-    if path.startswith(f"{S3_BUCKET}/"):
-        return path.split("/", 1)[1] or None
-    return path or None
-
-
-def _presign_from_full_url(u: str | None, expires: int = 3600) -> str | None:
-    key = _extract_key_from_url(u)
-    if not key:
-        return None
-    return s3c.generate_presigned_url(
-        "get_object", Params={"Bucket": S3_BUCKET, "Key": key}, ExpiresIn=expires
-    )
-
-
 def _unmarshal(av_item: dict) -> dict:
     return {k: _deser.deserialize(v) for k, v in av_item.items()}
 
 
+def _query_shard(shard: int, after, limit: int):
+    """
+    Up to `limit` listable songs of one shard after `after` ([createdAt, musicId]).
+    Returns (songs, exhausted): exhausted means nothing follows the returned songs.
+    """
+    names = {f"#f{i}": f for i, f in enumerate(LISTING_FIELDS)}
+    key = f"{LISTING_KEY}#{shard}"
+    kwargs = {
+        "IndexName": SONG_LISTING_INDEX,
+        "KeyConditionExpression": Key("listKey").eq(key),
+        "ScanIndexForward": False,
+        "ProjectionExpression": ",".join(names),
+        "ExpressionAttributeNames": names,
+        "Limit": limit,
+    }
+    if after:
+        kwargs["ExclusiveStartKey"] = {"listKey": key, "createdAt": after[0], "musicId": after[1]}
+
+    songs = []
+    while True:
+        resp = song_table.query(**kwargs)
+        # half-written songs (no title / file yet) are skipped without shortening the page
+        songs.extend(it for it in resp.get("Items", []) if it.get("title") and it.get("fileUrl"))
+        last = resp.get("LastEvaluatedKey")
+        if not last:
+            return songs, True
+        if len(songs) >= limit:
+            return songs[:limit], False
+        kwargs["ExclusiveStartKey"] = last
+
+
+def list_songs(limit: int, after: dict | None):
+    """
+    Exactly `limit` listable songs (fewer only at the end of the catalog),
+    newest first, after the cursor position. Returns (songs, next cursor payload or None).
+
+    Cursor payload: {"p": {shard: [createdAt, musicId]}, "d": [finished shards]}.
+    """
+    positions = {int(k): v for k, v in (after or {}).get("p", {}).items()}
+    done = set((after or {}).get("d", []))
+    shards = [s for s in range(LISTING_SHARDS) if s not in done]
+    if not shards:
+        return [], None
+
+    with ThreadPoolExecutor(max_workers=len(shards)) as pool:
+        results = dict(zip(shards, pool.map(lambda s: _query_shard(s, positions.get(s), limit), shards)))
+
+    # k-way merge of the per-shard (already newest-first) runs
+    runs = [[(it["createdAt"], it["musicId"], shard, it) for it in results[shard][0]] for shard in shards]
+    page = []
+    for created_at, music_id, shard, it in heapq.merge(*runs, reverse=True):
+        if len(page) == limit:
+            break
+        page.append(it)
+        positions[shard] = [created_at, music_id]
+
+    for shard in shards:
+        songs, exhausted = results[shard]
+        consumed = bool(songs) and positions.get(shard) == [songs[-1]["createdAt"], songs[-1]["musicId"]]
+        if exhausted and (consumed or not songs):
+            done.add(shard)
+
+    if len(done) == LISTING_SHARDS:
+        return page, None
+    return page, {"p": {str(k): v for k, v in positions.items() if k not in done}, "d": sorted(done)}
+
+
+def scan_songs(limit: int, after: dict | None):
+    """
+    Fallback for list_songs before the backfill: `limit` listable songs in table
+    order (not by createdAt). Cursor payload: {"s": key of the last song returned}.
+    """
+    names = {f"#f{i}": f for i, f in enumerate(LISTING_FIELDS)}
+    kwargs = {
+        "ProjectionExpression": ",".join(names),
+        "ExpressionAttributeNames": names,
+        "Limit": limit,
+    }
+    if after and after.get("s"):
+        kwargs["ExclusiveStartKey"] = after["s"]
+
+    page = []
+    while True:
+        resp = song_table.scan(**kwargs)
+        for it in resp.get("Items", []):
+            if it.get("title") and it.get("fileUrl"):
+                page.append(it)
+                if len(page) == limit:
+                    return page, {"s": {"musicId": it["musicId"]}}
+        last = resp.get("LastEvaluatedKey")
+        if not last:
+            return page, None
+        kwargs["ExclusiveStartKey"] = last
+
+
 # --- Lambda handler ---
 def lambda_handler(event, context):
     # Handle CORS preflight
     if event.get("httpMethod") == "OPTIONS":
         return response(200, {})
 
+    params = event.get("queryStringParameters") or {}
+    try:
+        limit = int(params.get("limit", DEFAULT_PAGE_SIZE))
+        if limit <= 0:
+            raise ValueError("limit must be positive")
+        limit = min(limit, MAX_PAGE_SIZE)
+        after = decode_cursor(params["cursor"]) if params.get("cursor") else None
+    except Exception as e:
+        return response(400, {"error": f"Invalid limit or cursor: {str(e)}"})
+
     try:
-        params = event.get("queryStringParameters") or {}
-        limit = int(params.get("limit", 50))
-        last_key_raw = params.get("lastKey")
-
-        scan_kwargs = {"Limit": limit}
-
-        # Handle pagination key
-        if last_key_raw:
-            try:
-                last_key = json.loads(last_key_raw)
-                if not isinstance(last_key, dict):
-                    raise ValueError("lastKey must be a dict")
-                scan_kwargs["ExclusiveStartKey"] = last_key
-            except Exception as e:
-                return response(400, {"error": f"Invalid lastKey format: {str(e)}"})
-
-        # --- Scan the table ---
-        result = song_table.scan(**scan_kwargs)
-        raw_items = result.get("Items", [])
-        last_evaluated_key = result.get("LastEvaluatedKey")
-
-        # --- Parse and presign data ---
+        if SONG_LISTING_SOURCE == "scan":
+            page, next_after = scan_songs(limit, after)
+        else:
+            page, next_after = list_songs(limit, after)
+
+        # --- Presign data ---
         songs = []
-        for it in raw_items:
-            if not it.get("musicId") or not it.get("title") or not it.get("fileUrl"):
-                continue
+        for it in page:
             songs.append({
                 "musicId": it.get("musicId"),
                 "title": it.get("title"),
                 "artistIds": it.get("artistIds", []),
                 "albumId": it.get("albumId"),
-                "fileUrl": _presign_from_full_url(it.get("fileUrl")),
-                "coverUrl": _presign_from_full_url(it.get("coverUrl")) or it.get("coverUrl"),
+                "fileUrl": presign_from_full_url(it.get("fileUrl")),
+                "coverUrl": presign_from_full_url(it.get("coverUrl")) or it.get("coverUrl"),
                 "fileName": it.get("fileName"),
                 "fileType": it.get("fileType"),
                 "fileSize": it.get("fileSize"),
@@ -115,7 +200,7 @@ def lambda_handler(event, context):
 
         return response(200, {
             "songs": songs,
-            "lastKey": json.dumps(last_evaluated_key, cls=DecimalEncoder) if last_evaluated_key else None
+            "nextCursor": encode_cursor(next_after) if next_after else None,
         })
 
     except ClientError as e:
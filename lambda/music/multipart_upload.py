@@ -0,0 +1,240 @@
+import json
+import os
+import math
+import uuid
+import mimetypes
+from datetime import datetime
+
+import boto3
+from botocore.exceptions import ClientError
+from common.song_records import build_song_actions, write_song_records
+
+# Two-phase upload: the client gets presigned part URLs, PUTs the audio straight
+# to S3 (in parallel), then calls complete to stitch the parts together and
+# write the song records. Audio bytes never pass through API Gateway / Lambda.
+
+s3 = boto3.client("s3")
+
+S3_BUCKET = os.environ["S3_BUCKET"]
+MUSIC_FOLDER = os.environ.get("MUSIC_FOLDER", "music")
+COVERS_FOLDER = os.environ.get("COVERS_FOLDER", "covers")
+UPLOAD_URL_TTL_SECONDS = int(os.environ.get("UPLOAD_URL_TTL_SECONDS", "3600"))
+
+MIN_PART_SIZE = 5 * 1024 * 1024       # S3 minimum for every part but the last
+DEFAULT_PART_SIZE = 8 * 1024 * 1024
+MAX_PARTS = 10000
+
+
+def response(status_code, body):
+    """Uniform CORS + JSON response."""
+    return {
+        "statusCode": status_code,
+        "headers": {
+            "Access-Control-Allow-Origin": "*",
+            "Access-Control-Allow-Headers": "Content-Type",
+            "Access-Control-Allow-Methods": "OPTIONS,POST",
+        },
+        "body": json.dumps(body),
+    }
+
+
+def _parse_body(event):
+    body_raw = event.get("body", "{}")
+    return json.loads(body_raw) if isinstance(body_raw, str) else (body_raw or {})
+
+
+def _part_size_for(file_size: int, requested: int | None) -> int:
+    part_size = max(MIN_PART_SIZE, int(requested or DEFAULT_PART_SIZE))
+    # grow parts until the file fits in MAX_PARTS
+    return max(part_size, math.ceil(file_size / MAX_PARTS))
+
+
+def _song_already_written(e: ClientError) -> bool:
+    """True if the transaction was cancelled only because the song row (first action) exists."""
+    if e.response["Error"]["Code"] != "TransactionCanceledException":
+        return False
+    reasons = e.response.get("CancellationReasons") or []
+    return bool(reasons) and reasons[0].get("Code") == "ConditionalCheckFailed" and all(
+        r.get("Code") in (None, "None") for r in reasons[1:]
+    )
+
+
+# --- Phase 1: POST /music/upload/start ---
+def start_handler(event, context):
+    if event.get("httpMethod") == "OPTIONS":
+        return response(200, {})
+
+    try:
+        body = _parse_body(event)
+        file_name = body.get("fileName")
+        file_size = body.get("fileSize")
+
+        if not file_name or not isinstance(file_size, int) or file_size <= 0:
+            return response(400, {"error": "fileName and a positive integer fileSize are required"})
+
+        music_id = str(uuid.uuid4())
+        music_key = f"{MUSIC_FOLDER}/{uuid.uuid4()}-{file_name}"
+        content_type = mimetypes.guess_type(file_name)[0] or "application/octet-stream"
+        part_size = _part_size_for(file_size, body.get("partSize"))
+        part_count = max(1, math.ceil(file_size / part_size))
+
+        mpu = s3.create_multipart_upload(
+            Bucket=S3_BUCKET,
+            Key=music_key,
+            ContentType=content_type,
+            Metadata={"music-id": music_id},
+        )
+        upload_id = mpu["UploadId"]
+
+        parts = [
+            {
+                "partNumber": n,
+                "url": s3.generate_presigned_url(
+                    "upload_part",
+                    Params={"Bucket": S3_BUCKET, "Key": music_key, "UploadId": upload_id, "PartNumber": n},
+                    ExpiresIn=UPLOAD_URL_TTL_SECONDS,
+                ),
+            }
+            for n in range(1, part_count + 1)
+        ]
+
+        # covers are small: a single presigned PUT is enough
+        cover = None
+        if body.get("withCover"):
+            cover_key = f"{COVERS_FOLDER}/{uuid.uuid4()}-cover.jpg"
+            cover = {
+                "key": cover_key,
+                "url": s3.generate_presigned_url(
+                    "put_object",
+                    Params={"Bucket": S3_BUCKET, "Key": cover_key, "ContentType": "image/jpeg"},
+                    ExpiresIn=UPLOAD_URL_TTL_SECONDS,
+                ),
+            }
+
+        return response(200, {
+            "musicId": music_id,
+            "uploadId": upload_id,
+            "key": music_key,
+            "partSize": part_size,
+            "parts": parts,
+            "cover": cover,
+        })
+
+    except ClientError as e:
+        return response(500, {"error": str(e)})
+    except Exception as e:
+        return response(500, {"error": str(e)})
+
+
+# --- Phase 2: POST /music/upload/complete ---
+def complete_handler(event, context):
+    if event.get("httpMethod") == "OPTIONS":
+        return response(200, {})
+
+    try:
+        body = _parse_body(event)
+
+        music_id = body.get("musicId")
+        music_key = body.get("key")
+        upload_id = body.get("uploadId")
+        parts = body.get("parts")
+        title = body.get("title")
+        genres = body.get("genres", [])
+        artist_ids = body.get("artistIds", [])
+        album_id = body.get("albumId")
+        cover_key = body.get("coverKey")
+
+        # --- Validation ---
+        if not music_id or not music_key or not upload_id or not parts or not title or not artist_ids or not genres:
+            return response(400, {
+                "error": "musicId, key, uploadId, parts, title, artistIds, and genres are required"
+            })
+        if not music_key.startswith(f"{MUSIC_FOLDER}/"):
+            return response(400, {"error": "key is not a music upload"})
+        if cover_key and not cover_key.startswith(f"{COVERS_FOLDER}/"):
+            return response(400, {"error": "coverKey is not a cover upload"})
+        if not isinstance(parts, list) or not all(isinstance(p, dict) and p.get("partNumber") and p.get("eTag") for p in parts):
+            return response(400, {"error": "parts must be a list of {partNumber, eTag}"})
+        if not isinstance(genres, list) or not all(isinstance(g, str) and g.strip() for g in genres):
+            return response(400, {"error": "genres must be a non-empty list of strings"})
+        if not isinstance(artist_ids, list) or not all(isinstance(a, str) and a.strip() for a in artist_ids):
+            return response(400, {"error": "artistIds must be a non-empty list of strings"})
+
+        # --- Stitch the parts together ---
+        # Failures leave the upload open so the client can retry with the right
+        # parts; abandoned uploads are cleaned up by the bucket's lifecycle rule.
+        try:
+            s3.complete_multipart_upload(
+                Bucket=S3_BUCKET,
+                Key=music_key,
+                UploadId=upload_id,
+                MultipartUpload={"Parts": [
+                    {"PartNumber": int(p["partNumber"]), "ETag": p["eTag"]}
+                    for p in sorted(parts, key=lambda p: int(p["partNumber"]))
+                ]},
+            )
+        except ClientError as e:
+            # NoSuchUpload on a retried call: an earlier call already completed it
+            # (checked against the object's music-id below)
+            if e.response["Error"]["Code"] != "NoSuchUpload":
+                return response(400, {"error": f"Could not complete upload: {e}"})
+
+        # the object must belong to the musicId handed out by start_handler
+        try:
+            head = s3.head_object(Bucket=S3_BUCKET, Key=music_key)
+        except ClientError as e:
+            if e.response["Error"]["Code"] not in ("404", "NoSuchKey", "NotFound"):
+                raise
+            return response(400, {"error": "Upload not found; start a new upload"})
+        if head.get("Metadata", {}).get("music-id") != music_id:
+            return response(400, {"error": "musicId does not match the uploaded object"})
+
+        music_url = f"https://{S3_BUCKET}.s3.amazonaws.com/{music_key}"
+        cover_url = None
+        if cover_key:
+            s3.head_object(Bucket=S3_BUCKET, Key=cover_key)
+            cover_url = f"https://{S3_BUCKET}.s3.amazonaws.com/{cover_key}"
+
+        # --- Song, genre index and artist records in one transaction ---
+        # key is "<MUSIC_FOLDER>/<uuid4>-<fileName>"
+        file_name = music_key.split("/", 1)[1][37:]
+        actions = build_song_actions(
+            music_id=music_id,
+            title=title,
+            file_name=file_name,
+            file_key=music_key,
+            file_url=music_url,
+            file_size=head["ContentLength"],
+            artist_ids=artist_ids,
+            genres=genres,
+            album_id=album_id,
+            cover_url=cover_url,
+            now=datetime.utcnow().isoformat(),
+        )
+        try:
+            write_song_records(actions)
+        except ClientError as e:
+            if not _song_already_written(e):
+                raise
+            # a retried call whose records were written before it failed: finish the notify step
+            print(f"Song {music_id} already written, continuing")
+
+        # imported here: upload_music needs the event/notification queue URLs,
+        # which only the complete lambda has
+        from upload_music import notify_new_song
+        notify_new_song(music_id, title, artist_ids, genres)
+
+        return response(201, {
+            "message": "Music content uploaded successfully (normalized)",
+            "musicId": music_id,
+            "title": title,
+            "genres": genres,
+            "albumId": album_id,
+            "fileUrl": music_url,
+            "coverUrl": cover_url,
+        })
+
+    except ClientError as e:
+        return response(500, {"error": str(e)})
+    except Exception as e:
+        return response(500, {"error": str(e)})
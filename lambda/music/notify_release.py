@@ -0,0 +1,104 @@
+import json
+import os
+import time
+
+import boto3
+from common.subscribers import iter_subscriber_ids
+
+# Async fan-out for "new song" notifications. upload_music drops one message per
+# release on the notification queue; this worker resolves the audience and
+# publishes ONE SNS message per AUDIENCE_PER_PUBLISH subscribers. Every email
+# subscription on the topic carries a {"userId": [<sub>]} filter policy, set when
+# the user subscribes (subscriptions/subscription.py, migrate_release_filters.py
+# for older ones), so SNS delivers each message only to the userIds listed in
+# its `userId` attribute. The worker makes no per-user SNS or Cognito calls.
+#
+# SQS may deliver a release more than once (retries after a partial failure), so
+# every published audience chunk is recorded in RELEASE_NOTIFICATION_TABLE and
+# skipped on redelivery. Chunks are cut from the subscriber stream in index
+# order; if subscriptions change between deliveries the boundaries shift, so a
+# user near a boundary can be skipped or emailed twice by the retry.
+
+dynamodb = boto3.resource("dynamodb")
+sns = boto3.client("sns")
+
+TOPIC_ARN = os.environ["NOTIFICATIONS_TOPIC_ARN"]
+subs_table = dynamodb.Table(os.environ["SUBSCRIPTIONS_TABLE"])
+sent_table = dynamodb.Table(os.environ["RELEASE_NOTIFICATION_TABLE"])
+
+# userIds per publish: keeps the String.Array attribute well under the 256 KB message limit
+AUDIENCE_PER_PUBLISH = 5000
+SENT_MARKER_TTL_SECONDS = 7 * 86400
+
+
+def iter_audience(artist_ids, genres):
+    """
+    Yield each subscriber of the release's artists and genres once. A user
+    repeated in a later chunk would get a second email, so `seen` holds the
+    whole audience: memory is O(audience), a few tens of bytes per userId.
+    """
+    seen = set()
+    targets = [("artist", a) for a in artist_ids] + [("genre", g) for g in genres]
+    for subscription_type, target_id in targets:
+        for user_id in iter_subscriber_ids(subs_table, subscription_type, target_id):
+            if user_id not in seen:
+                seen.add(user_id)
+                yield user_id
+
+
+def sent_chunks(music_id) -> set:
+    item = sent_table.get_item(Key={"musicId": music_id}, ConsistentRead=True).get("Item")
+    return {int(i) for i in (item or {}).get("sentChunks", set())}
+
+
+def mark_chunk_sent(music_id, index):
+    sent_table.update_item(
+        Key={"musicId": music_id},
+        UpdateExpression="ADD sentChunks :i SET expiresAt = :exp",
+        ExpressionAttributeValues={":i": {index}, ":exp": int(time.time()) + SENT_MARKER_TTL_SECONDS},
+    )
+
+
+def publish_release(release):
+    music_id = release["musicId"]
+    title = release["title"]
+    artist_ids = release.get("artistIds", [])
+    genres = release.get("genres", [])
+
+    message = f"🎵 New song released!\n\nTitle: {title}\nGenres: {', '.join(genres)}\nArtists: {', '.join(artist_ids)}"
+    already_sent = sent_chunks(music_id)
+
+    def publish(index, audience) -> int:
+        if index in already_sent:
+            return 0
+        sns.publish(
+            TopicArn=TOPIC_ARN,
+            Subject="New Song Released!",
+            Message=message,
+            MessageAttributes={
+                "userId": {"DataType": "String.Array", "StringValue": json.dumps(audience)},
+            },
+        )
+        mark_chunk_sent(music_id, index)
+        return len(audience)
+
+    chunk, index, total = [], 0, 0
+    for user_id in iter_audience(artist_ids, genres):
+        chunk.append(user_id)
+        if len(chunk) == AUDIENCE_PER_PUBLISH:
+            total += publish(index, chunk)
+            chunk, index = [], index + 1
+    if chunk:
+        total += publish(index, chunk)
+    print(f"Notified {total} subscribers about '{title}' ({len(already_sent)} chunks sent earlier)")
+
+
+def lambda_handler(event, context):
+    failures = []
+    for rec in event.get("Records", []):
+        try:
+            publish_release(json.loads(rec["body"]))
+        except Exception as e:
+            print(f"❌ Release notification failed for message {rec.get('messageId')}: {e}")
+            failures.append({"itemIdentifier": rec["messageId"]})
+    return {"batchItemFailures": failures}
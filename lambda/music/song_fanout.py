@@ -0,0 +1,166 @@
+import json
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+import boto3
+from boto3.dynamodb.conditions import Key
+from boto3.dynamodb.types import TypeSerializer
+from botocore.config import Config
+from botocore.exceptions import ClientError
+from common.queue import RecomputeBatch
+from common.song_events import NEW_SONG, UPDATE_SONG, DELETE_SONG
+from common.subscribers import iter_subscriber_ids
+
+# Worker for SONG_EVENT_QUEUE (see common/song_events.py): turns one song event
+# into feed recompute requests for every affected user. RecomputeBatch merges
+# requests into per-user debounce markers, so a redelivered event is harmless.
+
+dynamodb = boto3.resource("dynamodb")
+subs_table = dynamodb.Table(os.environ["SUBSCRIPTIONS_TABLE"])
+song_table = dynamodb.Table(os.environ["SONG_TABLE"])
+USER_FEED_TABLE = os.environ["USER_FEED_TABLE"]
+feed_table = dynamodb.Table(USER_FEED_TABLE)
+
+# Feed entries carry a copy of these song fields (same list in user/feed.py)
+SONG_DISPLAY_FIELDS = ["title", "artistIds", "genres", "albumId", "fileUrl", "coverUrl",
+                       "fileName", "fileType", "fileSize", "createdAt"]
+FEED_STORAGE_MODE = os.environ.get("FEED_STORAGE_MODE", "rows")
+# PK=songRef, SK=userId; empty while the index is not deployed yet (config.GSI_STAGE)
+FEED_MUSIC_INDEX = os.environ.get("FEED_MUSIC_INDEX", "FeedMusicIndex")
+
+# feed rows are patched concurrently through the (thread-safe) low-level client
+FEED_WRITE_WORKERS = 16
+ddb = boto3.client("dynamodb", config=Config(max_pool_connections=FEED_WRITE_WORKERS))
+_ser = TypeSerializer()
+
+
+def fan_out_to_subscribers(batch, event, genre_reason, artist_reason):
+    music_id = event["musicId"]
+    for g in event.get("genres") or []:
+        for user_id in iter_subscriber_ids(subs_table, "genre", g):
+            batch.add(user_id, genre_reason, music_id)
+    for artist_id in event.get("artistIds") or []:
+        for user_id in iter_subscriber_ids(subs_table, "artist", artist_id):
+            batch.add(user_id, artist_reason, music_id)
+
+
+def feed_holders(music_id: str):
+    """userIds whose stored feed rows include the song (rows storage only)."""
+    kwargs = {
+        "IndexName": FEED_MUSIC_INDEX,
+        "KeyConditionExpression": Key("songRef").eq(music_id),
+    }
+    while True:
+        resp = feed_table.query(**kwargs)
+        for it in resp.get("Items", []):
+            yield it["userId"]
+        last = resp.get("LastEvaluatedKey")
+        if not last:
+            return
+        kwargs["ExclusiveStartKey"] = last
+
+
+def patch_feed_row(user_id: str, music_id: str, summary: dict) -> bool:
+    """Overwrite the song summary on one feed row; False if the row left the feed meanwhile."""
+    try:
+        ddb.update_item(
+            TableName=USER_FEED_TABLE,
+            Key={"userId": {"S": user_id}, "musicId": {"S": music_id}},
+            UpdateExpression="SET song = :s",
+            ConditionExpression="attribute_exists(musicId)",
+            ExpressionAttributeValues={":s": _ser.serialize(summary)},
+        )
+        return True
+    except ClientError as e:
+        if e.response["Error"]["Code"] != "ConditionalCheckFailedException":
+            raise
+        return False
+
+
+def on_new_song(event):
+    with RecomputeBatch() as batch:
+        fan_out_to_subscribers(batch, event, "new_song_genre", "new_song_artist")
+
+
+def remove_from_feeds(music_id: str) -> list:
+    """Delete the song's row from every feed holding it (rows storage). Returns the holders."""
+    if FEED_STORAGE_MODE != "rows" or not FEED_MUSIC_INDEX:
+        return []
+    holders = list(feed_holders(music_id))
+    with feed_table.batch_writer() as batch:
+        for user_id in holders:
+            batch.delete_item(Key={"userId": user_id, "musicId": music_id})
+    return holders
+
+
+def on_deleted_song(event):
+    music_id = event["musicId"]
+    holders = remove_from_feeds(music_id)
+    with RecomputeBatch() as batch:
+        # the row is already gone: a full rebuild refills the holder's feed
+        for user_id in holders:
+            batch.add(user_id, "delete_song_holder", music_id)
+        fan_out_to_subscribers(batch, event, "delete_song_genre", "delete_song_artist")
+    print(f"🗑️ Removed song {music_id} from {len(holders)} feeds")
+
+
+def on_updated_song(event):
+    """
+    Keep the song summary stored in feed entries in sync after an update.
+
+    With per-song rows the holders are known (FeedMusicIndex): their rows are
+    patched in place and, if genres/artists changed, rescored. Single-item
+    feeds can't be patched per song, so the song's genre/artist subscribers
+    (before and after the update) get an "update_song" recompute instead.
+    """
+    music_id = event["musicId"]
+    song = song_table.get_item(Key={"musicId": music_id}, ConsistentRead=True).get("Item")
+    if not song:
+        return      # deleted since; the delete event cleans up
+    summary = {k: song[k] for k in SONG_DISPLAY_FIELDS if song.get(k) is not None}
+
+    touched = 0
+    with RecomputeBatch() as batch:
+        if FEED_STORAGE_MODE == "rows" and FEED_MUSIC_INDEX:
+            holders = list(feed_holders(music_id))
+            with ThreadPoolExecutor(max_workers=FEED_WRITE_WORKERS) as pool:
+                patched = list(pool.map(lambda u: patch_feed_row(u, music_id, summary), holders))
+            for user_id, ok in zip(holders, patched):
+                if not ok:
+                    continue
+                touched += 1
+                if event.get("rescore"):
+                    batch.add(user_id, "update_song", music_id)
+        else:
+            genres = set(event.get("previousGenres") or []) | set(song.get("genres") or [])
+            artists = set(event.get("previousArtistIds") or []) | set(song.get("artistIds") or [])
+            for kind, targets in (("genre", genres), ("artist", artists)):
+                for target_id in targets:
+                    for user_id in iter_subscriber_ids(subs_table, kind, target_id):
+                        batch.add(user_id, "update_song", music_id)
+                        touched += 1
+    print(f"🔄 Refreshed song {music_id} in {touched} feeds")
+
+
+HANDLERS = {
+    NEW_SONG: on_new_song,
+    UPDATE_SONG: on_updated_song,
+    DELETE_SONG: on_deleted_song,
+}
+
+
+def lambda_handler(event, context):
+    failures = []
+    for rec in event.get("Records", []):
+        try:
+            song_event = json.loads(rec["body"])
+            handler = HANDLERS.get(song_event.get("event"))
+            if handler is None:
+                print(f"⚠️ Unknown song event: {song_event.get('event')}")
+                continue
+            handler(song_event)
+            print(f"✅ Fanned out {song_event['event']} for {song_event['musicId']}")
+        except Exception as e:
+            print(f"❌ Song event {rec.get('messageId')} failed: {e}")
+            failures.append({"itemIdentifier": rec["messageId"]})
+    return {"batchItemFailures": failures}
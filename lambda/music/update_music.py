@@ -9,6 +9,7 @@ from urllib.parse import urlparse
 
 import boto3
 from botocore.exceptions import ClientError
+from common.song_events import UPDATE_SONG, song_event, publish_song_events
 
 # --- AWS clients/resources ---
 dynamodb = boto3.resource('dynamodb')
@@ -68,8 +69,8 @@ def response(status_code, body):
         "body": json.dumps(body, cls=DecimalEncoder)
     }
 
-def _put_object_to_s3(bucket: str, key: str, data: bytes, content_type: str) -> str:
-    s3.put_object(Bucket=bucket, Key=key, Body=data, ContentType=content_type)
+def _put_object_to_s3(bucket: str, key: str, data: bytes, content_type: str, metadata: dict | None = None) -> str:
+    s3.put_object(Bucket=bucket, Key=key, Body=data, ContentType=content_type, Metadata=metadata or {})
     return f"https://{bucket}.s3.amazonaws.com/{key}"
 
 def _chunked(iterable, size):
@@ -166,16 +167,17 @@ def lambda_handler(event, context):
             file_bytes = base64.b64decode(file_content_b64)
             audio_ct = _guess_mime_for_audio(file_name)
             music_key = f"{MUSIC_FOLDER}/{uuid.uuid4()}-{file_name}"
-            file_url = _put_object_to_s3(S3_BUCKET, music_key, file_bytes, audio_ct)
+            file_url = _put_object_to_s3(S3_BUCKET, music_key, file_bytes, audio_ct, {"music-id": music_id})
             file_ext = (file_name.rsplit('.', 1)[-1] if '.' in file_name else '').lower()
 
-            expr_attr_names.update({"#fileUrl": "fileUrl", "#fileType": "fileType", "#fileSize": "fileSize"})
+            expr_attr_names.update({"#fileUrl": "fileUrl", "#fileKey": "fileKey", "#fileType": "fileType", "#fileSize": "fileSize"})
             expr_attr_vals.update({
                 ":fileUrl": file_url,
+                ":fileKey": music_key,
                 ":fileType": file_ext or "unknown",
                 ":fileSize": len(file_bytes)
             })
-            set_clauses += ["#fileUrl = :fileUrl", "#fileType = :fileType", "#fileSize = :fileSize"]
+            set_clauses += ["#fileUrl = :fileUrl", "#fileKey = :fileKey", "#fileType = :fileType", "#fileSize = :fileSize"]
 
         # Cover update
         if cover_image_b64:
@@ -337,6 +339,17 @@ def lambda_handler(event, context):
 
         cover_signed = _presign_from_full_url(updated.get("coverUrl"))
 
+        # --- Feed entries hold a copy of the song fields (refreshed by song_fanout) ---
+        try:
+            publish_song_events([song_event(
+                UPDATE_SONG, music_id, updated.get("artistIds"), updated.get("genres"),
+                previousArtistIds=list(current.get("artistIds") or []),
+                previousGenres=sorted(current_genres),
+                rescore=artist_ids is not None or desired_genres is not None,
+            )])
+        except Exception as e:
+            print(f"⚠️ Could not queue the feed refresh for {music_id}: {e}")
+
         if file_signed:
             updated["fileUrlSigned"] = file_signed
         if cover_signed:
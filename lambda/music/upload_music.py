@@ -6,28 +6,23 @@ import mimetypes
 from datetime import datetime
 
 import boto3
-from boto3.dynamodb.conditions import Key
 from botocore.exceptions import ClientError
-from common.queue import enqueue_recompute
-from boto3.dynamodb.conditions import Key
+from common.song_events import NEW_SONG, song_event, publish_song_events
+from common.song_records import build_song_actions, write_song_records
 
 # --- AWS Clients ---
 dynamodb = boto3.resource("dynamodb")
 dynamo_client = boto3.client("dynamodb")
 s3 = boto3.client("s3")
-sns = boto3.client("sns")
-cognito_client = boto3.client("cognito-idp")
+sqs = boto3.client("sqs")
 
 SONG_TABLE = os.environ["SONG_TABLE"]
 MUSIC_BY_GENRE_TABLE = os.environ["MUSIC_BY_GENRE_TABLE"]
 S3_BUCKET = os.environ["S3_BUCKET"]
-TOPIC_ARN = os.environ["NOTIFICATIONS_TOPIC_ARN"]
-USER_POOL_ID = os.environ["USER_POOL_ID"]
+NOTIFICATION_QUEUE_URL = os.environ["NOTIFICATION_QUEUE_URL"]
 MUSIC_FOLDER = os.environ.get("MUSIC_FOLDER", "music")
 COVERS_FOLDER = os.environ.get("COVERS_FOLDER", "covers")
-SUBS_TABLE = os.environ["SUBSCRIPTIONS_TABLE"]
 song_table = dynamodb.Table(SONG_TABLE)
-subs_table = dynamodb.Table(SUBS_TABLE)
 
 
 
@@ -44,99 +39,31 @@ def response(status_code, body):
     }
 
 
-def _put_object_to_s3(bucket, key, data, content_type):
+def _put_object_to_s3(bucket, key, data, content_type, metadata=None):
     """Upload a binary object to S3 and return public URL."""
-    s3.put_object(Bucket=bucket, Key=key, Body=data, ContentType=content_type)
+    s3.put_object(Bucket=bucket, Key=key, Body=data, ContentType=content_type, Metadata=metadata or {})
     return f"https://{bucket}.s3.amazonaws.com/{key}"
 
 
-def _chunked(iterable, size):
-    """Yield lists of length <= size from iterable."""
-    chunk = []
-    for item in iterable:
-        chunk.append(item)
-        if len(chunk) == size:
-            yield chunk
-            chunk = []
-    if chunk:
-        yield chunk
-
-# --- Get user email from Cognito ---
-def get_user_email(user_id):
-    resp = cognito_client.list_users(
-        UserPoolId=os.environ["USER_POOL_ID"],
-        Filter=f'sub = "{user_id}"'
-    )
-    if resp['Users']:
-        for attr in resp['Users'][0]['Attributes']:
-            if attr['Name'] == 'email':
-                return attr['Value']
-    return None
-
-
-def get_subscribed_user_ids(subscription_type, target_id):
-    """
-    Returns a list of userIds who are subscribed to a given artist or genre.
-    """
-    print(f"Fetching subscribers for {subscription_type} {target_id}")
+def notify_new_song(music_id, title, artist_ids, genres):
+    """Queue feed recomputes and notify subscribers about a freshly written song."""
+    # --- Recompute feed for subscribed users (fanned out asynchronously by song_fanout) ---
     try:
-        resp = subs_table.query(
-            IndexName="SubscriptionTypeTargetIdIndex",
-            KeyConditionExpression=(
-                Key("subscriptionType").eq(subscription_type) &
-                Key("targetId").eq(target_id)
-            )
-        )
-        return [item["userId"] for item in resp.get("Items", [])]
+        publish_song_events([song_event(NEW_SONG, music_id, artist_ids, genres)])
     except Exception as e:
-        print(f"Error fetching subscribers for {subscription_type} {target_id}: {e}")
-        return []
-
-def send_notification(title, artist_ids, genres):
-    message = (
-        f"🎵 New song released!\n\n"
-        f"Title: {title}\n"
-        f"Genres: {', '.join(genres)}\n"
-        f"Artists: {', '.join(artist_ids)}"
-    )
+        print(f"⚠️ Failed to enqueue recompute jobs on upload: {e}")
 
-    sns.publish(
-        TopicArn=os.environ["NOTIFICATIONS_TOPIC_ARN"],
-        Subject="New Song Released!",
-        Message=message
+    # --- Publish notification (fanned out asynchronously by notify_release) ---
+    sqs.send_message(
+        QueueUrl=NOTIFICATION_QUEUE_URL,
+        MessageBody=json.dumps({
+            "musicId": music_id,
+            "title": title,
+            "artistIds": artist_ids,
+            "genres": genres,
+        }),
     )
 
-# --- Send notifications to subscribed users ---
-def send_notifications(artist_ids, genres, title):
-    notified_emails = set()
-    print(f"Sending notifications for new song '{title}' to subscribers of artists {artist_ids} and genres {genres}")
-    
-    # Collect user IDs
-    user_ids = set()
-    for artist_id in artist_ids:
-        user_ids.update(get_subscribed_user_ids("artist", artist_id))
-    for genre in genres:
-        user_ids.update(get_subscribed_user_ids("genre", genre))
-    print(f"Total unique subscribers to notify: {len(user_ids)}", user_ids)
-
-    # Send SNS message to each email
-    for user_id in user_ids:
-        email = get_user_email(user_id)
-        if email and email not in notified_emails:
-            # Subscribe user to the topic (if not already subscribed)
-            try:
-                sns.subscribe(TopicArn=TOPIC_ARN, Protocol='email', Endpoint=email)
-            except Exception as e:
-                print(f"Could not subscribe {email}: {e}")
-
-            # Publish the message
-            sns.publish(
-                TopicArn=TOPIC_ARN,
-                Subject="New Song Released!",
-                Message=f"🎵 New song released!\n\nTitle: {title}\nGenres: {', '.join(genres)}\nArtists: {', '.join(artist_ids)}"
-            )
-            notified_emails.add(email)
-
 def lambda_handler(event, context):
     # --- Handle CORS preflight ---
     if event.get("httpMethod") == "OPTIONS":
@@ -166,11 +93,15 @@ def lambda_handler(event, context):
         if not isinstance(artist_ids, list) or not all(isinstance(a, str) and a.strip() for a in artist_ids):
             return response(400, {"error": "artistIds must be a non-empty list of strings"})
 
+        music_id = str(uuid.uuid4())
+
         # --- Upload audio to S3 ---
+        # musicId travels as object metadata so S3-triggered lambdas
+        # (transcription) can resolve the song without touching SongTable
         content_type = mimetypes.guess_type(file_name)[0] or "application/octet-stream"
         file_bytes = base64.b64decode(file_content_base64)
         music_key = f"{MUSIC_FOLDER}/{uuid.uuid4()}-{file_name}"
-        music_url = _put_object_to_s3(S3_BUCKET, music_key, file_bytes, content_type)
+        music_url = _put_object_to_s3(S3_BUCKET, music_key, file_bytes, content_type, {"music-id": music_id})
 
         # --- Optional cover upload ---
         cover_url = None
@@ -180,106 +111,23 @@ def lambda_handler(event, context):
             cover_url = _put_object_to_s3(S3_BUCKET, cover_key, cover_bytes, "image/jpeg")
 
         # --- Canonical song record ---
-        music_id = str(uuid.uuid4())
         now = datetime.utcnow().isoformat()
-        file_ext = (file_name.rsplit(".", 1)[-1] if "." in file_name else "").lower()
-
-        actions = []
-
-        # 1) SONG_TABLE
-        actions.append({
-            "Put": {
-                "TableName": SONG_TABLE,
-                "Item": {
-                    "musicId": {"S": music_id},
-                    "title": {"S": title},
-                    "fileName": {"S": file_name},
-                    "fileType": {"S": file_ext or "unknown"},
-                    "fileSize": {"N": str(len(file_bytes))},
-                    "createdAt": {"S": now},
-                    "updatedAt": {"S": now},
-                    "artistIds": {"L": [{"S": a} for a in artist_ids]},
-                    "albumId": {"S": album_id} if album_id else {"NULL": True},
-                    "fileUrl": {"S": music_url},
-                    "coverUrl": {"S": cover_url} if cover_url else {"NULL": True},
-                    "genres": {"L": [{"S": g} for g in genres]},
-                },
-                "ConditionExpression": "attribute_not_exists(musicId)",
-            }
-        })
-
-        # 2) MUSIC_BY_GENRE_TABLE
-        for genre in genres:
-            item = {
-                "genre": {"S": genre},
-                "musicId": {"S": music_id},
-                "createdAt": {"S": now},
-            }
-            if album_id:
-                item["albumId"] = {"S": album_id}
-            actions.append({"Put": {"TableName": MUSIC_BY_GENRE_TABLE, "Item": item}})
-
-        ARTIST_INFO_TABLE = os.environ['ARTIST_INFO_TABLE']
-
-        # 3) For each artist, append musicId to their songs list
-        for artist_id in artist_ids:
-            actions.append({
-                "Update": {
-                    "TableName": ARTIST_INFO_TABLE,
-                    "Key": {
-                        "artistId": {"S": artist_id}
-                    },
-                    "UpdateExpression": "SET #songs = list_append(if_not_exists(#songs, :empty_list), :new_song)",
-                    "ExpressionAttributeNames": {
-                        "#songs": "songs"
-                    },
-                    "ExpressionAttributeValues": {
-                        ":new_song": {"L": [{"S": music_id}]},
-                        ":empty_list": {"L": []}
-                    }
-                }
-            })
-
-        # DynamoDB TransactWriteItems has a limit of 25 actions per request.
-        # If we exceed it (rare—only with many genres+artists), we split into chunks.
-        # We always write the SONG_TABLE put first to ensure ID existence.
-        # --- Write to DynamoDB (chunk if >25) ---
-        if len(actions) <= 25:
-            dynamo_client.transact_write_items(TransactItems=actions)
-        else:
-            dynamo_client.transact_write_items(TransactItems=[actions[0]])
-            for batch in _chunked(actions[1:], 25):
-                dynamo_client.transact_write_items(TransactItems=batch)
-
-        # --- Recompute feed for subscribed users ---
-        try:
-            # notify users subscribed by genre
-            for g in genres:
-                resp = subs_table.query(
-                    IndexName="SubscriptionTypeTargetIdIndex",
-                    KeyConditionExpression=Key("subscriptionType").eq("genre") & Key("targetId").eq(g)
-                )
-                for item in resp.get("Items", []):
-                    user_id = item["userId"]
-                    enqueue_recompute(user_id, "new_song_genre", music_id)
-
-            # notify users subscribed by artist
-            for artist_id in artist_ids:
-                resp = subs_table.query(
-                    IndexName="SubscriptionTypeTargetIdIndex",
-                    KeyConditionExpression=Key("subscriptionType").eq("artist") & Key("targetId").eq(artist_id)
-                )
-                for item in resp.get("Items", []):
-                    user_id = item["userId"]
-                    print("U music upload reloaduje feed za korisnika ",user_id," jer je subscribed na artista nove pesme ",artist_id)
-                    enqueue_recompute(user_id, "new_song_artist", music_id)
-
-        except Exception as e:
-            pass
+        actions = build_song_actions(
+            music_id=music_id,
+            title=title,
+            file_name=file_name,
+            file_key=music_key,
+            file_url=music_url,
+            file_size=len(file_bytes),
+            artist_ids=artist_ids,
+            genres=genres,
+            album_id=album_id,
+            cover_url=cover_url,
+            now=now,
+        )
+        write_song_records(actions)
 
-        # Success
-        # --- Publish notification ---
-        send_notifications(artist_ids, genres, title)
+        notify_new_song(music_id, title, artist_ids, genres)
 
         return response(201, {
             "message": "Music content uploaded successfully (normalized)",
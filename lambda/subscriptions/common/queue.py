@@ -1,18 +1,170 @@
-import os, json, time
+import os, json, time, hashlib, threading
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+
 import boto3
+from botocore.config import Config
+from botocore.exceptions import ClientError
 
-sqs = boto3.client("sqs")
 QUEUE_URL = os.environ["RECOMPUTE_QUEUE_URL"]
 
+# Debounce: every request is merged into the user's marker in PENDING_RECOMPUTE_TABLE
+# and only the request that opens a marker sends an SQS message. The queue holds
+# messages for the debounce window (delivery delay), so by the time the worker
+# runs, the marker carries every request made in between and the user is rebuilt once.
+PENDING_RECOMPUTE_TABLE = os.environ["PENDING_RECOMPUTE_TABLE"]
+DEBOUNCE_SECONDS = int(os.environ.get("RECOMPUTE_DEBOUNCE_SECONDS", "30"))
+# a marker whose message never made it (failed send) is re-armed after this long
+STALE_MARKER_SECONDS = DEBOUNCE_SECONDS + 600
+MARKER_TTL_SECONDS = 86400
+
+SEND_BATCH_SIZE = 10    # SendMessageBatch limit
+# marker writes are one UpdateItem per user, so big audiences need wide fan-out
+# (large ones are only produced by the song_fanout worker, off the request path)
+SEND_WORKERS = int(os.environ.get("RECOMPUTE_SEND_WORKERS", "32"))
+MAX_BUFFERED = 500      # flush early so huge audiences don't pile up in memory
+
+sqs = boto3.client("sqs", config=Config(max_pool_connections=SEND_WORKERS))
+_local = threading.local()
+
+
+def _pending_table():
+    # boto3 resources aren't thread-safe and markers are written from a pool
+    if not hasattr(_local, "table"):
+        _local.table = boto3.session.Session().resource("dynamodb").Table(PENDING_RECOMPUTE_TABLE)
+    return _local.table
+
+
+def _entry(user_id: str, reason: str, music_id: str | None, now: int) -> dict:
+    body = {
+        "userId": user_id,
+        "reason": reason,   # "subscribe" | "unsubscribe" | "rate" | "new_song_genre" | ...
+        "musicId": music_id,
+        "ts": now
+    }
+    # musicId is part of the dedup id: two different songs for the same user and
+    # reason inside one 10s window are two different deltas
+    dedup = hashlib.sha256(f"{user_id}-{reason}-{music_id}-{now // 10}".encode()).hexdigest()
+    return {
+        "MessageBody": json.dumps(body),
+        "MessageGroupId": user_id,
+        "MessageDeduplicationId": dedup,
+    }
+
+
+def _send_batch(entries: list[dict]) -> int:
+    """Send <= 10 entries, retrying the failed ones once. Returns how many still failed."""
+    for attempt in range(2):
+        resp = sqs.send_message_batch(
+            QueueUrl=QUEUE_URL,
+            Entries=[{"Id": str(i), **e} for i, e in enumerate(entries)],
+        )
+        failed = {int(f["Id"]) for f in resp.get("Failed", [])}
+        if not failed:
+            return 0
+        entries = [e for i, e in enumerate(entries) if i in failed]
+    print(f"⚠️ {len(entries)} recompute messages could not be sent")
+    return len(entries)
+
+
+def _item_too_large(e: ClientError) -> bool:
+    err = e.response["Error"]
+    return err["Code"] == "ValidationException" and "Item size has exceeded" in err.get("Message", "")
+
+
+def _mark_pending(user_id: str, msgs: list[tuple], now: int) -> bool:
+    """
+    Merge the user's requests into their pending marker.
+    Returns True when this call opened the window and must send the SQS message.
+    """
+    key = {"userId": user_id}
+    values = {":one": 1, ":now": now, ":exp": now + MARKER_TTL_SECONDS}
+    try:
+        resp = _pending_table().update_item(
+            Key=key,
+            UpdateExpression="ADD deltas :d, version :one SET openedAt = if_not_exists(openedAt, :now), expiresAt = :exp",
+            ExpressionAttributeValues={**values, ":d": {json.dumps([reason, music_id]) for _, reason, music_id in msgs}},
+            ReturnValues="UPDATED_OLD",
+        )
+    except ClientError as e:
+        if not _item_too_large(e):
+            raise
+        # marker hit the item size limit: stop tracking deltas, rebuild from scratch
+        resp = _pending_table().update_item(
+            Key=key,
+            UpdateExpression="ADD version :one SET fullRebuild = :t, openedAt = if_not_exists(openedAt, :now), expiresAt = :exp REMOVE deltas",
+            ExpressionAttributeValues={**values, ":t": True},
+            ReturnValues="UPDATED_OLD",
+        )
+
+    opened_at = resp.get("Attributes", {}).get("openedAt")
+    if opened_at is None:
+        return True
+    if now - int(opened_at) > STALE_MARKER_SECONDS:
+        _pending_table().update_item(
+            Key=key, UpdateExpression="SET openedAt = :now", ExpressionAttributeValues={":now": now},
+        )
+        return True
+    return False
+
+
+class RecomputeBatch:
+    """
+    Buffers recompute requests for one invocation, merges them into each
+    user's pending marker and sends one SQS message per newly opened window
+    with SendMessageBatch (10 per call), across a small thread pool.
+    Requests for the same (userId, musicId) are coalesced, first reason wins.
+    The buffer is flushed every MAX_BUFFERED messages and on exit; a repeat
+    after a flush only merges into the marker the first one opened (deltas are
+    a set), so memory stays bounded by MAX_BUFFERED, not by the audience.
+
+        with RecomputeBatch() as batch:
+            for uid in subscribers:
+                batch.add(uid, "new_song_genre", music_id)
+    """
+    def __init__(self):
+        self._pending: dict[tuple, tuple] = {}
+
+    def add(self, user_id: str, reason: str, music_id: str | None = None):
+        key = (user_id, music_id)
+        if key in self._pending:
+            return
+        self._pending[key] = (user_id, reason, music_id)
+        if len(self._pending) >= MAX_BUFFERED:
+            self.flush()
+
+    def flush(self) -> int:
+        """Send everything buffered so far. Returns the number of messages sent."""
+        now = int(time.time())
+        by_user = defaultdict(list)
+        for msg in self._pending.values():
+            by_user[msg[0]].append(msg)
+        self._pending.clear()
+        if not by_user:
+            return 0
+
+        users = list(by_user)
+        with ThreadPoolExecutor(max_workers=min(SEND_WORKERS, len(users))) as pool:
+            opened = list(pool.map(lambda u: _mark_pending(u, by_user[u], now), users))
+        entries = [_entry(*by_user[u][0], now) for u, is_new in zip(users, opened) if is_new]
+        if not entries:
+            print(f"⏳ {len(users)} users already have a recompute pending")
+            return 0
+
+        chunks = [entries[i:i + SEND_BATCH_SIZE] for i in range(0, len(entries), SEND_BATCH_SIZE)]
+        with ThreadPoolExecutor(max_workers=min(SEND_WORKERS, len(chunks))) as pool:
+            failed = sum(pool.map(_send_batch, chunks))
+        print(f"📨 Sent {len(entries) - failed} recompute messages to SQS")
+        return len(entries) - failed
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.flush()
+        return False
+
+
 def enqueue_recompute(user_id: str, reason: str, music_id: str | None = None):
-    sqs.send_message(
-        QueueUrl=QUEUE_URL,
-        MessageBody=json.dumps({
-            "userId": user_id,
-            "reason": reason,   # "subscribe" | "unsubscribe" | "rate" | "play"
-            "musicId": music_id,
-            "ts": int(time.time())
-        }),
-        MessageGroupId=user_id,
-        MessageDeduplicationId=f"{user_id}-{reason}-{int(time.time())//10}"
-    )
+    with RecomputeBatch() as batch:
+        batch.add(user_id, reason, music_id)
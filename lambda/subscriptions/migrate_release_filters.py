@@ -0,0 +1,68 @@
+import os
+import json
+import boto3
+
+# One-off migration: release notifications are addressed with a `userId` message
+# attribute, and only subscriptions with a {"userId": [<sub>]} filter policy are
+# targeted. Email subscriptions created before that (no filter) would receive
+# every release, so this sets the policy on each of them, looking the owner up
+# in Cognito by email. Invoke it by hand; when the Lambda runs low on time it
+# returns {"done": false, "nextToken": ...} to pass back in. Subscriptions still
+# pending confirmation are skipped and counted: run it again once they confirm.
+
+sns = boto3.client("sns")
+cognito = boto3.client("cognito-idp")
+
+NOTIFICATIONS_TOPIC_ARN = os.environ["NOTIFICATIONS_TOPIC_ARN"]
+USER_POOL_ID = os.environ["USER_POOL_ID"]
+
+# a value no release is ever addressed to: mutes subscriptions without a Cognito user
+UNMATCHED_USER = "unmatched"
+TIME_RESERVE_MS = 10000
+
+
+def find_user_sub(email: str):
+    resp = cognito.list_users(UserPoolId=USER_POOL_ID, Filter=f'email = "{email}"', Limit=1)
+    for user in resp.get("Users", []):
+        for attr in user.get("Attributes", []):
+            if attr["Name"] == "sub":
+                return attr["Value"]
+    return None
+
+
+def migrate_subscription(sub: dict) -> str:
+    """Set the user filter on one email subscription. Returns what happened to it."""
+    arn = sub["SubscriptionArn"]
+    if not arn.startswith("arn:"):
+        return "pending"
+    attrs = sns.get_subscription_attributes(SubscriptionArn=arn).get("Attributes", {})
+    if attrs.get("FilterPolicy"):
+        return "filtered"
+    user_sub = find_user_sub(sub["Endpoint"])
+    sns.set_subscription_attributes(
+        SubscriptionArn=arn, AttributeName="FilterPolicy",
+        AttributeValue=json.dumps({"userId": [user_sub or UNMATCHED_USER]}),
+    )
+    return "migrated" if user_sub else "unmatched"
+
+
+def handler(event, context):
+    event = event or {}
+    counts = {"migrated": 0, "unmatched": 0, "filtered": 0, "pending": 0}
+    kwargs = {"TopicArn": NOTIFICATIONS_TOPIC_ARN}
+    if event.get("nextToken"):
+        kwargs["NextToken"] = event["nextToken"]
+
+    while True:
+        resp = sns.list_subscriptions_by_topic(**kwargs)
+        for sub in resp.get("Subscriptions", []):
+            if sub.get("Protocol") == "email":
+                counts[migrate_subscription(sub)] += 1
+        token = resp.get("NextToken")
+        if not token:
+            print(f"✅ Release filter migration done: {counts}")
+            return {"done": True, **counts}
+        kwargs["NextToken"] = token
+        if context and context.get_remaining_time_in_millis() < TIME_RESERVE_MS:
+            print(f"⏸️ Release filter migration paused: {counts}")
+            return {"done": False, "nextToken": token, **counts}
@@ -67,6 +67,33 @@ def get_user_email(sub: str):
     return attrs.get("email")
 
 
+def subscribe_to_releases(user_id: str, email: str):
+    """
+    Subscribe the user's email to the notifications topic with a filter policy,
+    so release notifications (published with a `userId` String.Array attribute)
+    reach only the subscribers they are addressed to.
+    """
+    policy = json.dumps({"userId": [user_id]})
+    try:
+        sns.subscribe(
+            TopicArn=NOTIFICATIONS_TOPIC_ARN, Protocol="email", Endpoint=email,
+            Attributes={"FilterPolicy": policy}, ReturnSubscriptionArn=True,
+        )
+    except sns.exceptions.InvalidParameterException:
+        # existing subscription from before filter policies were used
+        arn = sns.subscribe(
+            TopicArn=NOTIFICATIONS_TOPIC_ARN, Protocol="email", Endpoint=email,
+            ReturnSubscriptionArn=True,
+        )["SubscriptionArn"]
+        if not arn.startswith("arn:"):
+            # still pending confirmation: migrate_release_filters sets the policy once confirmed
+            print(f"Subscription for {email} is pending confirmation, filter policy not set yet")
+            return
+        sns.set_subscription_attributes(
+            SubscriptionArn=arn, AttributeName="FilterPolicy", AttributeValue=policy,
+        )
+
+
 # --- Handlers ---
 def handle_post(event):
     user_sub = get_user_sub(event)
@@ -125,13 +152,9 @@ def handle_post(event):
         table.put_item(Item=item)
 
         # Send SQS message to recompute feed
-        enqueue_recompute(user_id, "subscribe", target_id)
+        enqueue_recompute(user_id, "subscribe", subscription_key)
 
-        sns.subscribe(
-            TopicArn=NOTIFICATIONS_TOPIC_ARN,
-            Protocol="email",
-            Endpoint=email
-        )
+        subscribe_to_releases(user_id, email)
     except Exception as e:
         print(f"Failed to subscribe {email} to SNS: {e}")
 
@@ -4,6 +4,7 @@ import uuid
 import re
 import json
 from urllib.parse import quote, unquote_plus
+from botocore.exceptions import ClientError
 
 # --- AWS clients ---
 ddb = boto3.client("dynamodb")
@@ -13,6 +14,11 @@ s3 = boto3.client("s3")
 # --- Environment variables ---
 SONG_TABLE = os.environ["SONG_TABLE"]
 SONG_BUCKET = os.environ["SONG_BUCKET"]
+FILE_KEY_INDEX = os.environ.get("FILE_KEY_INDEX", "FileKeyIndex")
+
+class SongNotWrittenYet(Exception):
+    """The object landed before the upload wrote its SongTable row."""
+
 
 # --- Helpers ---
 def sanitize_transcribe_key(name: str) -> str:
@@ -20,32 +26,31 @@ def sanitize_transcribe_key(name: str) -> str:
 
 def find_original_music_id(s3_key):
     """
-    Find the original musicId in DynamoDB that matches this S3 key
+    Resolve the musicId for an uploaded S3 key.
+    Uploads carry it as `music-id` object metadata; songs written without it
+    are looked up through the FileKeyIndex GSI on SongTable (PK=fileKey).
     """
-    print(f"🔍 Looking for original music ID for S3 key: {s3_key}")
-    
     try:
-        scan_response = ddb.scan(TableName=SONG_TABLE)
-        all_songs = scan_response.get('Items', [])
-        print(f"📊 Found {len(all_songs)} songs in DynamoDB")
-        
-        for song in all_songs:
-            file_url = song.get('fileUrl', {}).get('S', '')
-            music_id = song.get('musicId', {}).get('S', '')
-            file_name = song.get('fileName', {}).get('S', '')
-            
-            print(f"🎵 Checking song: {music_id}")
-            print(f"   File URL: {file_url}")
-            print(f"   File Name: {file_name}")
-            
-            # Check if this S3 key is part of the fileUrl OR matches the filename
-            if s3_key in file_url or os.path.basename(s3_key) in file_url:
-                print(f"✅ FOUND MATCH! Original music_id: {music_id}")
-                return music_id
-        
+        head = s3.head_object(Bucket=SONG_BUCKET, Key=s3_key)
+        music_id = head.get("Metadata", {}).get("music-id")
+        if music_id:
+            return music_id
+
+        resp = ddb.query(
+            TableName=SONG_TABLE,
+            IndexName=FILE_KEY_INDEX,
+            KeyConditionExpression="fileKey = :k",
+            ExpressionAttributeValues={":k": {"S": s3_key}},
+            ProjectionExpression="musicId",
+            Limit=1,
+        )
+        items = resp.get("Items", [])
+        if items:
+            return items[0]["musicId"]["S"]
+
         print(f"❌ No DynamoDB item found for S3 key: {s3_key}")
         return None
-        
+
     except Exception as e:
         print(f"❌ Error finding original music_id: {e}")
         return None
@@ -58,6 +63,7 @@ def handler(event, context):
     if "Records" not in event:
         return {"ok": False, "reason": "No S3 records"}
 
+    deferred = []
     for rec in event["Records"]:
         raw_key = rec.get("s3", {}).get("object", {}).get("key")
         if not raw_key:
@@ -88,6 +94,27 @@ def handler(event, context):
         file_uri = f"s3://{SONG_BUCKET}/{key}"
         job_name = f"transcribe-{safe_music_id}-{uuid.uuid4()}"
 
+        # Mark transcript as pending in DynamoDB with ORIGINAL ID. The object is
+        # written before the upload's SongTable transaction, so the row may not
+        # exist yet: never create a stub (it would make the upload's
+        # attribute_not_exists(musicId) put fail), retry the event later instead.
+        try:
+            ddb.update_item(
+                TableName=SONG_TABLE,
+                Key={"musicId": {"S": original_music_id}},
+                UpdateExpression="SET hasTranscript = :p",
+                ConditionExpression="attribute_exists(musicId)",
+                ExpressionAttributeValues={":p": {"BOOL": False}},
+            )
+            print(f"🟡 Marked transcript as pending for {original_music_id}")
+        except ClientError as e:
+            if e.response["Error"]["Code"] != "ConditionalCheckFailedException":
+                print(f"❌ Failed to mark transcript as pending: {e}")
+                continue
+            print(f"⏳ Song row for {original_music_id} not written yet, deferring {key}")
+            deferred.append(key)
+            continue
+
         try:
             transcribe.start_transcription_job(
                 TranscriptionJobName=job_name,
@@ -98,19 +125,16 @@ def handler(event, context):
                 OutputKey=output_key,
             )
             print(f"✅ Transcription job started: {job_name}")
-            
-            # Mark transcript as pending in DynamoDB with ORIGINAL ID
-            ddb.update_item(
-                TableName=SONG_TABLE,
-                Key={"musicId": {"S": original_music_id}},
-                UpdateExpression="SET hasTranscript = :p",
-                ExpressionAttributeValues={":p": {"BOOL": False}},
-            )
-            print(f"🟡 Marked transcript as pending for {original_music_id}")
-            
+
         except Exception as e:
             print(f"❌ Failed to start transcription: {e}")
             continue
 
+    if deferred:
+        # S3 invokes this function asynchronously: raising makes Lambda retry the
+        # event (with backoff), by which time the upload transaction has committed.
+        # If the upload failed for good, the retries run out and nothing is left behind.
+        raise SongNotWrittenYet(f"SongTable rows missing for: {', '.join(deferred)}")
+
     print("=== END START TRANSCRIPTION LAMBDA ===")
     return {"ok": True}
\ No newline at end of file
@@ -0,0 +1,290 @@
+import os, json, time, zlib
+from decimal import Decimal
+
+from boto3.dynamodb.conditions import Key
+from botocore.exceptions import ClientError
+
+from common.tables import table
+
+# How a user's ranked feed is kept in USER_FEED_TABLE (PK=userId, SK=musicId):
+#   "rows"     one row per song (SK=musicId), read in score order via FEED_SCORE_INDEX
+#   "snapshot" every recompute writes one immutable compressed item (SK="#v#<version>")
+#              and then flips the user's "#current" pointer with a conditional write;
+#              the replaced snapshot expires via TTL
+#   "packed"   the whole ranked feed is one item (SK="#feed") holding a compact list of
+#              [musicId, score, {display fields}?]: one GetItem to read, one PutItem to write
+# Marker items use "#"-prefixed sort keys, which no musicId has.
+MODE_ROWS = "rows"
+MODE_SNAPSHOT = "snapshot"
+MODE_PACKED = "packed"
+FEED_STORAGE_MODE = os.environ.get("FEED_STORAGE_MODE", MODE_ROWS)
+
+FEED_SCORE_INDEX = os.environ.get("FEED_SCORE_INDEX", "UserFeedScoreSongIndex")    # PK=userId, SK=score, + song
+# rows also carry songRef (= musicId) for FeedMusicIndex (songRef -> userId), which
+# update_music uses to refresh the denormalized song fields in place
+POINTER_KEY = "#current"
+SNAPSHOT_PREFIX = "#v#"
+# readers that resolved the old pointer can still fetch the old snapshot this long
+SNAPSHOT_GRACE_SECONDS = 3600
+PACKED_KEY = "#feed"
+# headroom under DynamoDB's 400 KB item limit
+MAX_PACKED_BYTES = 350 * 1024
+# row attributes that are not display fields
+ROW_BOOKKEEPING = {"userId", "musicId", "score", "reason", "createdAt", "feedVersion", "songRef"}
+
+FEED_TABLE_NAME = os.environ.get("USER_FEED_TABLE", "UserFeedTable")
+
+
+def _feed_table():
+    # per-thread handle: the feed worker saves several users concurrently
+    return table(FEED_TABLE_NAME)
+
+
+def _is_marker(music_id: str) -> bool:
+    return music_id.startswith("#")
+
+
+# ---------- rows ----------
+
+def _load_rows(user_id):
+    entries = {}
+    kwargs = {
+        "KeyConditionExpression": Key("userId").eq(user_id),
+        "ProjectionExpression": "musicId, score",
+    }
+    while True:
+        resp = _feed_table().query(**kwargs)
+        for it in resp.get("Items", []):
+            if not _is_marker(it["musicId"]):
+                entries[it["musicId"]] = {"score": it.get("score", Decimal(0))}
+        last = resp.get("LastEvaluatedKey")
+        if not last:
+            return entries
+        kwargs["ExclusiveStartKey"] = last
+
+
+def _save_rows(user_id, stored, top_rows, version):
+    """
+    Put new rows and rows whose score changed, then delete the rows that fell
+    out. Puts go first, so a reader never sees a half-cleared feed; unchanged
+    rows are not touched. Rows without a userId are stored rows carried over as-is.
+    """
+    keep = {row["musicId"] for row in top_rows}
+    puts = [
+        {**row, "feedVersion": version, "songRef": row["musicId"]}
+        for row in top_rows
+        if "userId" in row and stored.get(row["musicId"], {}).get("score") != row["score"]
+    ]
+    deletes = [mid for mid in stored if mid not in keep]
+
+    with _feed_table().batch_writer() as batch:
+        for row in puts:
+            batch.put_item(Item=row)
+    with _feed_table().batch_writer() as batch:
+        for mid in deletes:
+            batch.delete_item(Key={"userId": user_id, "musicId": mid})
+    print(f"Feed diff for {user_id}: {len(puts)} written, {len(deletes)} removed, {len(keep) - len(puts)} unchanged")
+
+
+def _read_rows(user_id, after, limit):
+    kwargs = {
+        "IndexName": FEED_SCORE_INDEX,
+        "KeyConditionExpression": Key("userId").eq(user_id),
+        "ScanIndexForward": False,
+        "Limit": limit + 1,
+    }
+    if after:
+        score, music_id = after
+        kwargs["ExclusiveStartKey"] = {"userId": user_id, "musicId": music_id, "score": score}
+
+    items = []
+    while len(items) <= limit:
+        resp = _feed_table().query(**kwargs)
+        items.extend(resp.get("Items", []))
+        last = resp.get("LastEvaluatedKey")
+        if not last:
+            break
+        kwargs["ExclusiveStartKey"] = last
+        kwargs["Limit"] = limit + 1 - len(items)
+    return items[:limit], len(items) > limit
+
+
+# ---------- snapshot ----------
+
+def _pack(entries) -> bytes:
+    # Decimals go out as JSON numbers and come back as Decimals in _unpack
+    return zlib.compress(json.dumps(entries, separators=(",", ":"), default=float).encode())
+
+
+def _unpack(blob) -> list:
+    return json.loads(zlib.decompress(bytes(blob)), parse_float=Decimal, parse_int=Decimal)
+
+
+def _entry(row) -> dict:
+    """Stored form of a feed row: everything but the keys and bookkeeping."""
+    drop = {"userId", "createdAt", "feedVersion"}
+    return {k: v for k, v in row.items() if k not in drop}
+
+
+def _load_snapshot_entries(user_id, consistent=False):
+    pointer = _feed_table().get_item(
+        Key={"userId": user_id, "musicId": POINTER_KEY},
+        ConsistentRead=consistent,
+    ).get("Item")
+    if not pointer:
+        return []
+    snap = _feed_table().get_item(
+        Key={"userId": user_id, "musicId": pointer["snapshotKey"]},
+        ConsistentRead=True,
+    ).get("Item")
+    return _unpack(snap["entries"]) if snap else []
+
+
+def _load_snapshot(user_id):
+    # the writer patches the latest snapshot, so resolve the pointer strongly
+    return {e.pop("musicId"): e for e in _load_snapshot_entries(user_id, consistent=True)}
+
+
+def _save_snapshot(user_id, stored, top_rows, version):
+    now = int(time.time())
+    ranked = sorted(top_rows, key=lambda r: (-r["score"], r["musicId"]))
+    snapshot_key = f"{SNAPSHOT_PREFIX}{version}"
+    _feed_table().put_item(Item={
+        "userId": user_id,
+        "musicId": snapshot_key,
+        "entries": _pack([_entry(r) for r in ranked]),
+        "count": len(ranked),
+        "createdAt": now,
+    })
+
+    # flip the pointer unless a newer recompute already did
+    try:
+        old = _feed_table().put_item(
+            Item={"userId": user_id, "musicId": POINTER_KEY, "version": version, "snapshotKey": snapshot_key},
+            ConditionExpression="attribute_not_exists(version) OR version < :v",
+            ExpressionAttributeValues={":v": version},
+            ReturnValues="ALL_OLD",
+        ).get("Attributes")
+        retired = old["snapshotKey"] if old else None
+    except ClientError as e:
+        if e.response["Error"]["Code"] != "ConditionalCheckFailedException":
+            raise
+        retired = snapshot_key
+
+    if retired:
+        _feed_table().update_item(
+            Key={"userId": user_id, "musicId": retired},
+            UpdateExpression="SET expiresAt = :exp",
+            ExpressionAttributeValues={":exp": now + SNAPSHOT_GRACE_SECONDS},
+        )
+    print(f"Feed snapshot for {user_id}: {snapshot_key} ({len(ranked)} items)")
+
+
+def _read_snapshot(user_id, after, limit):
+    entries = _load_snapshot_entries(user_id)
+    if after:
+        score, music_id = after
+        entries = [e for e in entries if (-e["score"], e["musicId"]) > (-score, music_id)]
+    return entries[:limit], len(entries) > limit
+
+
+# ---------- packed ----------
+
+PACKED_ITEM_OVERHEAD = 256     # keys, attribute names and type markers
+
+
+def _json_len(value) -> int:
+    return len(json.dumps(value, separators=(",", ":"), default=str))
+
+
+def _packed_size(entries) -> int:
+    """Close upper bound of the item size: attribute payloads are about their JSON length."""
+    return _json_len(entries) + PACKED_ITEM_OVERHEAD
+
+
+def _fit_packed(entries) -> list:
+    """Drop display fields from the bottom up, then whole entries, until the item fits."""
+    size = _packed_size(entries)
+    for e in reversed(entries):
+        if size <= MAX_PACKED_BYTES:
+            return entries
+        if len(e) > 2:
+            # the display fields plus the comma before them
+            size -= _json_len(e[2]) + 1
+            del e[2:]
+    while entries and _packed_size(entries) > MAX_PACKED_BYTES:
+        entries.pop()
+    return entries
+
+
+def _load_packed_item(user_id, consistent=False):
+    item = _feed_table().get_item(
+        Key={"userId": user_id, "musicId": PACKED_KEY},
+        ConsistentRead=consistent,
+    ).get("Item")
+    return item.get("entries", []) if item else []
+
+
+def _load_packed(user_id):
+    return {
+        e[0]: {"score": e[1], **(e[2] if len(e) > 2 else {})}
+        for e in _load_packed_item(user_id, consistent=True)
+    }
+
+
+def _save_packed(user_id, stored, top_rows, version):
+    ranked = sorted(top_rows, key=lambda r: (-r["score"], r["musicId"]))
+    entries = []
+    for r in ranked:
+        fields = {k: v for k, v in r.items() if k not in ROW_BOOKKEEPING}
+        entries.append([r["musicId"], r["score"], fields] if fields else [r["musicId"], r["score"]])
+    entries = _fit_packed(entries)
+    if len(entries) < len(ranked):
+        print(f"⚠️ Packed feed for {user_id} truncated to {len(entries)} of {len(ranked)} items")
+
+    try:
+        _feed_table().put_item(
+            Item={"userId": user_id, "musicId": PACKED_KEY, "entries": entries, "feedVersion": version},
+            ConditionExpression="attribute_not_exists(feedVersion) OR feedVersion < :v",
+            ExpressionAttributeValues={":v": version},
+        )
+    except ClientError as e:
+        if e.response["Error"]["Code"] != "ConditionalCheckFailedException":
+            raise
+        print(f"Packed feed for {user_id} already has a newer version")
+
+
+def _read_packed(user_id, after, limit):
+    entries = [
+        {"musicId": e[0], "score": e[1], **(e[2] if len(e) > 2 else {})}
+        for e in _load_packed_item(user_id)
+    ]
+    if after:
+        score, music_id = after
+        entries = [e for e in entries if (-e["score"], e["musicId"]) > (-score, music_id)]
+    return entries[:limit], len(entries) > limit
+
+
+# ---------- dispatch ----------
+
+_LOAD = {MODE_ROWS: _load_rows, MODE_SNAPSHOT: _load_snapshot, MODE_PACKED: _load_packed}
+_SAVE = {MODE_ROWS: _save_rows, MODE_SNAPSHOT: _save_snapshot, MODE_PACKED: _save_packed}
+_READ = {MODE_ROWS: _read_rows, MODE_SNAPSHOT: _read_snapshot, MODE_PACKED: _read_packed}
+
+
+def load_feed(user_id: str) -> dict:
+    """dict[musicId] = stored entry ({"score": ..., plus whatever the mode keeps})."""
+    return _LOAD[FEED_STORAGE_MODE](user_id)
+
+
+def save_feed(user_id: str, stored: dict, top_rows, version: int):
+    """Replace the user's feed (`stored`, as returned by load_feed) with `top_rows`."""
+    _SAVE[FEED_STORAGE_MODE](user_id, stored, top_rows, version)
+
+
+def read_feed_page(user_id: str, after, limit: int):
+    """
+    Up to `limit` entries (dicts with at least musicId and score), best first,
+    following the (score, musicId) position `after`. Returns (entries, has_more).
+    """
+    return _READ[FEED_STORAGE_MODE](user_id, after, limit)
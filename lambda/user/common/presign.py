@@ -0,0 +1,58 @@
+import os, time
+from urllib.parse import urlparse
+
+import boto3
+
+S3_BUCKET = os.environ["S3_BUCKET"]
+URL_TTL_SECONDS = int(os.environ.get("LIST_URL_TTL_SECONDS", "3600"))
+# reissue a cached URL once less than this much of its lifetime is left
+REFRESH_MARGIN_SECONDS = int(os.environ.get("PRESIGN_REFRESH_MARGIN_SECONDS", "600"))
+MAX_CACHED_URLS = 5000
+
+s3c = boto3.client("s3")
+
+# S3 key -> (presigned url, expires at); lives as long as the warm container
+_cache: dict[str, tuple[str, float]] = {}
+
+
+def extract_key_from_url(u: str | None) -> str | None:
+    if not u:
+        return None
+    p = urlparse(u)
+    path = (p.path or "").lstrip("/")
+
+    # virtual-hosted or path-style
+    if p.netloc.startswith(f"{S3_BUCKET}.") or p.netloc == S3_BUCKET:
+        return path or None
+    if path.startswith(f"{S3_BUCKET}/"):
+        return path.split("/", 1)[1] or None
+    return path or None
+
+
+def presign_key(key: str, expires: int = URL_TTL_SECONDS) -> str:
+    """
+    Presigned GET for `key`, reusing the cached URL while it still has more than
+    REFRESH_MARGIN_SECONDS to live. Songs of one album share a cover key, so a
+    response signs every distinct key once.
+    """
+    now = time.time()
+    hit = _cache.get(key)
+    if hit and hit[1] - now > min(REFRESH_MARGIN_SECONDS, expires // 2):
+        return hit[0]
+
+    url = s3c.generate_presigned_url(
+        "get_object", Params={"Bucket": S3_BUCKET, "Key": key}, ExpiresIn=expires
+    )
+    if len(_cache) >= MAX_CACHED_URLS:
+        # drop the oldest entry (dicts keep insertion order)
+        _cache.pop(next(iter(_cache)))
+    _cache.pop(key, None)
+    _cache[key] = (url, now + expires)
+    return url
+
+
+def presign_from_full_url(u: str | None, expires: int = URL_TTL_SECONDS) -> str | None:
+    key = extract_key_from_url(u)
+    if not key:
+        return None
+    return presign_key(key, expires)
@@ -0,0 +1,18 @@
+import threading
+
+import boto3
+
+# boto3 resources (and their Table objects) are not thread-safe, so code that
+# runs on a thread pool (the feed worker) gets one resource per thread.
+_local = threading.local()
+
+
+def table(name: str):
+    """DynamoDB Table handle for `name`, private to the calling thread."""
+    tables = getattr(_local, "tables", None)
+    if tables is None:
+        _local.resource = boto3.session.Session().resource("dynamodb")
+        _local.tables = tables = {}
+    if name not in tables:
+        tables[name] = _local.resource.Table(name)
+    return tables[name]
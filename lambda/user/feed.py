@@ -1,13 +1,13 @@
 from collections import Counter, defaultdict
 from decimal import Decimal
-from itertools import islice
-import boto3, json, os, time
-from boto3.dynamodb.conditions import Key
+import heapq, json, os, threading, time
+from concurrent.futures import ThreadPoolExecutor
+from boto3.dynamodb.conditions import Attr, Key
+from botocore.exceptions import ClientError
+from common.batch import batch_get_by_id
+from common.feed_store import load_feed, save_feed
+from common.tables import table
 
-dynamodb = boto3.resource("dynamodb")
-ddbc = dynamodb.meta.client
-
-FEED_TABLE_NAME        = os.environ.get("USER_FEED_TABLE",        "UserFeedTable")
 HISTORY_TABLE_NAME     = os.environ.get("USER_HISTORY_TABLE",     "UserHistoryTable")
 REACTIONS_TABLE_NAME   = os.environ.get("USER_REACTIONS_TABLE",   "UserReactionsTable")
 SUBS_TABLE_NAME        = os.environ.get("USER_SUBSCRIPTIONS_TABLE","UserSubscriptionsTable")
@@ -15,13 +15,41 @@ GENRE_INDEX_TABLE_NAME = os.environ.get("MUSIC_TABLE",            "MusicTable")
 SONG_TABLE_NAME        = os.environ.get("SONG_TABLE",             "SongTable")    # PK=musicId
 ARTIST_INFO_TABLE_NAME = os.environ.get("ARTIST_INFO_TABLE",      "ArtistInfoTable")
 
-feed_table        = dynamodb.Table(FEED_TABLE_NAME)
-history_table     = dynamodb.Table(HISTORY_TABLE_NAME)
-reactions_table   = dynamodb.Table(REACTIONS_TABLE_NAME)
-subs_table        = dynamodb.Table(SUBS_TABLE_NAME)
-genre_index_table = dynamodb.Table(GENRE_INDEX_TABLE_NAME)
-song_table        = dynamodb.Table(SONG_TABLE_NAME)
-artist_info_table = dynamodb.Table(ARTIST_INFO_TABLE_NAME)
+
+FEED_SIZE = 50
+
+# song attributes denormalized into each feed entry (same list in music/update_music.py)
+SONG_DISPLAY_FIELDS = ["title", "artistIds", "genres", "albumId", "fileUrl", "coverUrl",
+                       "fileName", "fileType", "fileSize", "createdAt"]
+
+# reasons that only change the score of the message's musicId
+SONG_DELTA_REASONS = {"rate", "unsubscribe_rate", "new_song_genre", "new_song_artist", "update_song"}
+# reasons that only drop the message's musicId from the feed
+SONG_REMOVAL_REASONS = {"delete_song_genre", "delete_song_artist"}
+
+# decayed per-genre play counts on the history item, relative to its affinityEpoch (see record_play)
+AFFINITY_PREFIX = "affinity#"
+AFFINITY_EPOCH = 1735689600
+AFFINITY_HALF_LIFE_DAYS = float(os.environ.get("AFFINITY_HALF_LIFE_DAYS", "14"))
+MIN_AFFINITY = 0.05     # below this a genre no longer pulls in candidates
+HISTORY_WINDOW = 40
+
+# genre/artist -> candidate musicIds, shared by every user recomputed in this container
+CANDIDATE_CACHE_TTL_SECONDS = int(os.environ.get("CANDIDATE_CACHE_TTL_SECONDS", "300"))
+MAX_CACHED_TARGETS = 1000
+GENRE_CANDIDATES = 200
+SONG_EVENT_REASONS = {"new_song_genre", "new_song_artist", "delete_song_genre", "delete_song_artist",
+                      "delete_song_holder"}
+_candidates: dict[tuple[str, str], tuple[tuple, float]] = {}
+_candidates_lock = threading.Lock()
+
+# users recomputed concurrently per SQS batch; every worker thread uses its own
+# Table handles (common/tables.py), BatchGetItem goes through the thread-safe client
+RECOMPUTE_WORKERS = int(os.environ.get("RECOMPUTE_WORKERS", "5"))
+
+# debounce markers written by the producers' RecomputeBatch (common/queue.py)
+PENDING_TABLE_NAME = os.environ.get("PENDING_RECOMPUTE_TABLE")
+MAX_DRAIN_ROUNDS = 3
 
 class DecimalEncoder(json.JSONEncoder):
     def default(self, obj):
@@ -31,7 +59,7 @@ class DecimalEncoder(json.JSONEncoder):
 
 def load_subscriptions(user_id: str):
     # Your SubscriptionsTable stores one row per subscription (query, not get_item)
-    items = subs_table.query(
+    items = table(SUBS_TABLE_NAME).query(
         KeyConditionExpression=Key("userId").eq(user_id)
     ).get("Items", [])
     artists = {it["targetId"] for it in items if it.get("subscriptionType") == "artist"}
@@ -39,17 +67,32 @@ def load_subscriptions(user_id: str):
     return artists, genres
 
 def load_reactions(user_id: str):
-    items = reactions_table.query(
+    items = table(REACTIONS_TABLE_NAME).query(
         KeyConditionExpression=Key("userId").eq(user_id)
     ).get("Items", [])
     # map[musicId] = "love" | "like" | "dislike"
     return {it["musicId"]: it.get("rate") for it in items}
 
-def load_history(user_id: str):
-    item = history_table.get_item(Key={"userId": user_id}).get("Item") or {}
-    recent = item.get("recentPlays", []) or []
-    genre_counts = Counter([p.get("genre") for p in recent if p.get("genre")])
-    return recent, genre_counts
+def load_genre_affinity(user_id: str, now: int):
+    """
+    Decayed per-genre play counts as of `now`, scaled so they sum to at most
+    HISTORY_WINDOW (the boost keeps the range it had with the last 40 plays).
+    """
+    item = table(HISTORY_TABLE_NAME).get_item(Key={"userId": user_id}).get("Item") or {}
+    epoch = int(item.get("affinityEpoch", AFFINITY_EPOCH))
+    decay = 2 ** (-(now - epoch) / (AFFINITY_HALF_LIFE_DAYS * 86400))
+    affinity = {
+        k[len(AFFINITY_PREFIX):]: float(v) * decay
+        for k, v in item.items() if k.startswith(AFFINITY_PREFIX)
+    }
+    if not affinity:
+        # items written before affinity tracking keep their raw recent plays
+        affinity = Counter([p.get("genre") for p in item.get("recentPlays") or [] if p.get("genre")])
+    affinity = {g: a for g, a in affinity.items() if a >= MIN_AFFINITY}
+    total = sum(affinity.values())
+    if total <= HISTORY_WINDOW:
+        return dict(affinity)
+    return {g: a * HISTORY_WINDOW / total for g, a in affinity.items()}
 
 def paginate_genre(genre: str, per_page=200, max_items=1000):
     """Yield musicIds from the genre index table (PK=genre, SK=musicId)."""
@@ -62,7 +105,7 @@ def paginate_genre(genre: str, per_page=200, max_items=1000):
         }
         if last:
             kwargs["ExclusiveStartKey"] = last
-        resp = genre_index_table.query(**kwargs)
+        resp = table(GENRE_INDEX_TABLE_NAME).query(**kwargs)
         for it in resp.get("Items", []):
             mid = it.get("musicId")
             if mid:
@@ -74,48 +117,72 @@ def paginate_genre(genre: str, per_page=200, max_items=1000):
         if not last:
             break
 
-def batch_get_songs(music_ids, chunk=100):
-    """BatchGetItem from SONG_TABLE (PK=musicId). Returns dict[musicId] = song_item."""
-    out = {}
-    it = iter(set(music_ids))
-    while True:
-        batch = list(islice(it, chunk))
-        if not batch:
-            break
-
-        req = {
-            SONG_TABLE_NAME: {
-                "Keys": [{"musicId": mid} for mid in batch]
-            }
-        }
+def cached_candidates(kind: str, target_id: str, load):
+    """Cached musicIds for ("genre"|"artist", id); `load` runs on a miss or after the TTL."""
+    now = time.time()
+    key = (kind, target_id)
+    hit = _candidates.get(key)
+    if hit and hit[1] > now:
+        return hit[0]
+
+    ids = tuple(load())
+    with _candidates_lock:
+        if len(_candidates) >= MAX_CACHED_TARGETS:
+            # drop the oldest entry (dicts keep insertion order)
+            _candidates.pop(next(iter(_candidates)))
+        _candidates.pop(key, None)
+        _candidates[key] = (ids, now + CANDIDATE_CACHE_TTL_SECONDS)
+    return ids
 
-        resp = ddbc.batch_get_item(RequestItems=req)
+def genre_song_ids(genre: str):
+    return cached_candidates("genre", genre, lambda: paginate_genre(genre, per_page=200, max_items=GENRE_CANDIDATES))
 
-        for item in resp.get("Responses", {}).get(SONG_TABLE_NAME, []):
-            mid = item["musicId"]
-            out[mid] = {
-                "musicId": mid,
-                "artistIds": item.get("artistIds", []),
-                "genres": item.get("genres", []),
-            }
+def artist_song_ids(artist_id: str):
+    return cached_candidates("artist", artist_id, lambda: get_artist_song_ids(artist_id))
 
-        retries = 0
-        while resp.get("UnprocessedKeys") and retries < 5:
-            retries += 1
-            resp = ddbc.batch_get_item(RequestItems=resp["UnprocessedKeys"])
-            for item in resp.get("Responses", {}).get(SONG_TABLE_NAME, []):
-                mid = item["musicId"]
-                out[mid] = {
-                    "musicId": mid,
-                    "artistIds": item.get("artistIds", []),
-                    "genres": item.get("genres", []),
-                }
+def invalidate_songs(music_ids):
+    """
+    Drop cached candidate lists an uploaded or deleted song belongs to. Uploads
+    are looked up for their genres/artists; deleted songs are no longer in
+    SONG_TABLE, so any list that contains them is dropped. Other warm
+    containers pick the change up when their entries expire.
+    """
+    music_ids = set(music_ids)
+    if not music_ids or not _candidates:
+        return
+    songs = batch_get_songs(music_ids)
+    with _candidates_lock:
+        for song in songs.values():
+            for g in song.get("genres") or []:
+                _candidates.pop(("genre", g), None)
+            for a in song.get("artistIds") or []:
+                _candidates.pop(("artist", a), None)
+        for key in [k for k, (ids, _) in _candidates.items() if music_ids.intersection(ids)]:
+            del _candidates[key]
+
+def batch_get_songs(music_ids):
+    """
+    BatchGetItem from SONG_TABLE (PK=musicId). Returns dict[musicId] = song_item
+    with the scoring fields plus the display fields copied into feed entries.
+    """
+    found = batch_get_by_id(SONG_TABLE_NAME, "musicId", music_ids, projection=SONG_DISPLAY_FIELDS)
+    return {
+        mid: {
+            **item,
+            "musicId": mid,
+            "artistIds": item.get("artistIds", []),
+            "genres": item.get("genres", []),
+        }
+        for mid, item in found.items()
+    }
 
-    return out
+def song_summary(song) -> dict:
+    """Display fields stored with a feed entry, so GET /feed needs no SongTable read."""
+    return {k: song[k] for k in SONG_DISPLAY_FIELDS if song.get(k) is not None}
 
 
 def get_artist_song_ids(artist_id: str):
-    artist = artist_info_table.get_item(Key={"artistId": artist_id}).get("Item")
+    artist = table(ARTIST_INFO_TABLE_NAME).get_item(Key={"artistId": artist_id}).get("Item")
     if not artist:
         return []
     songs = artist.get("songs", [])
@@ -164,102 +231,284 @@ def calculate_score(song, sub_artists, sub_genres, reactions_map, genre_counts):
         "genres": list(song_genres),
     }
 
-def lambda_handler(event, context):
-    try:
-        user_id = event["userId"]
-        now = int(time.time())
+def build_feed_rows(user_id, songs, sub_artists, sub_genres, reactions_map, genre_counts, now):
+    """Score songs and return feed rows keyed by musicId."""
+    rows = {}
+    for song in songs.values():
+        s, details = calculate_score(song, sub_artists, sub_genres, reactions_map, genre_counts)
+        rows[song["musicId"]] = {
+            "userId": user_id,
+            "musicId": song["musicId"],
+            "score": Decimal(str(round(s, 4))),
+            "reason": details,
+            "song": song_summary(song),
+            "createdAt": now
+        }
+    return rows
 
-        sub_artists, sub_genres = load_subscriptions(user_id)
-        reactions_map = load_reactions(user_id)
-        recent_plays, genre_counts = load_history(user_id)
+REACTION_POINTS = {"love": 20, "like": 10, "dislike": -200}
+ARTIST_POINTS = 15
 
-        sub_genres = set(sub_genres or [])
-        sub_artists = set(sub_artists or [])
+def score_top_rows(user_id, songs, sub_artists, sub_genres, reactions_map, genre_counts, now, limit=FEED_SIZE):
+    """
+    Same scores as calculate_score, computed for every candidate at once, with
+    feed rows (Decimals, reason details) built only for the top `limit`.
 
-        # Candidate musicIds
-        candidate_ids = set()
+    Genres are folded into one weight each (7 if subscribed + 0.7 per play), so a
+    song's score is the sum of its genres' weights, 15 per subscribed artist and
+    its reaction points.
+    """
+    song_list = list(songs.values())
+    if len(song_list) <= limit:
+        return top_feed_rows(build_feed_rows(user_id, songs, sub_artists, sub_genres, reactions_map, genre_counts, now), limit)
 
-        #genres user is interested in (subscribed to or listened to recently)
-        merged_genres = sub_genres | {g for g in genre_counts.keys() if g}
+    genre_weight = {g: 0.7 * c for g, c in genre_counts.items()}
+    for g in sub_genres:
+        genre_weight[g] = genre_weight.get(g, 0.0) + 7
 
-        # 1) songs from genres user is interested in
-        for g in merged_genres:
-            for mid in paginate_genre(g, per_page=200, max_items=200):
-                candidate_ids.add(mid)
+    scores = [
+        sum(genre_weight.get(g, 0.0) for g in set(song.get("genres") or []))
+        + ARTIST_POINTS * len(sub_artists.intersection(song.get("artistIds", [])))
+        + REACTION_POINTS.get(reactions_map.get(song["musicId"]), 0)
+        for song in song_list
+    ]
+    top = heapq.nlargest(limit, range(len(song_list)), key=scores.__getitem__)
 
-        # 2) songs from artists user subscribed to
-        for aid in sub_artists:
-            candidate_ids.update(get_artist_song_ids(aid))
+    survivors = {song_list[i]["musicId"]: song_list[i] for i in top}
+    rows = build_feed_rows(user_id, survivors, sub_artists, sub_genres, reactions_map, genre_counts, now)
+    return top_feed_rows(rows, limit)
 
-        # 3) songs with reactions from user
-        candidate_ids.update(reactions_map.keys())
+def top_feed_rows(rows, limit=FEED_SIZE):
+    # bounded heap: O(n log limit) instead of sorting every candidate
+    return heapq.nlargest(limit, rows.values(), key=lambda x: x["score"])
 
-        if not candidate_ids:
-            return {"statusCode": 200, "body": json.dumps({"feedCount": 0})}
+def split_target(target):
+    """'genre#rock' -> ('genre', 'rock'); returns (None, None) for legacy messages."""
+    if not target or "#" not in target:
+        return None, None
+    return tuple(target.split("#", 1))
 
-        # fetch full song info for candidate songs
-        songs = batch_get_songs(candidate_ids)
+def is_incremental(msg) -> bool:
+    """True if the message can be applied as a delta instead of a full rebuild."""
+    reason = msg.get("reason")
+    if reason in SONG_DELTA_REASONS or reason in SONG_REMOVAL_REASONS:
+        return bool(msg.get("musicId"))
+    if reason == "subscribe":
+        kind, target = split_target(msg.get("musicId"))
+        return kind in ("artist", "genre") and bool(target)
+    return False
 
-        # score
-        # scoring loop (use the tuple returned by calculate_score)
-        scored = []
-        for song in songs.values():
-            s, details = calculate_score(song, sub_artists, sub_genres, reactions_map, genre_counts)
-            scored.append({
-                "userId": user_id,
-                "musicId": song["musicId"],
-                "score": Decimal(str(round(s, 4))),
-                "reason": details,
-                "createdAt": now
-            })
-
-        scored.sort(key=lambda x: float(x["score"]), reverse=True)
-        top50 = scored[:50]
-
-        # delete old feed before writing new
-        clear_old_feed(user_id)
-        # save top 50 songs to users feed
-        with feed_table.batch_writer() as batch:
-            for item in top50:
-                batch.put_item(Item=item)
-
-        return {"statusCode": 200, "body": json.dumps({"feedCount": len(top50)}, cls=DecimalEncoder)}
+def full_recompute(user_id: str) -> int:
+    now = int(time.time())
+
+    sub_artists, sub_genres = load_subscriptions(user_id)
+    reactions_map = load_reactions(user_id)
+    genre_counts = load_genre_affinity(user_id, now)
+
+    sub_genres = set(sub_genres or [])
+    sub_artists = set(sub_artists or [])
+
+    # Candidate musicIds
+    candidate_ids = set()
+
+    #genres user is interested in (subscribed to or listened to recently)
+    merged_genres = sub_genres | {g for g in genre_counts.keys() if g}
+
+    # 1) songs from genres user is interested in
+    for g in merged_genres:
+        candidate_ids.update(genre_song_ids(g))
+
+    # 2) songs from artists user subscribed to
+    for aid in sub_artists:
+        candidate_ids.update(artist_song_ids(aid))
+
+    # 3) songs with reactions from user
+    candidate_ids.update(reactions_map.keys())
+
+    if not candidate_ids:
+        return 0
+
+    # fetch full song info for candidate songs
+    songs = batch_get_songs(candidate_ids)
+
+    top50 = score_top_rows(user_id, songs, sub_artists, sub_genres, reactions_map, genre_counts, now)
+
+    save_feed(user_id, load_feed(user_id), top50, int(time.time() * 1000))
+
+    return len(top50)
+
+def incremental_recompute(user_id: str, messages) -> int | None:
+    """
+    Patch the stored feed using only the songs touched by the messages.
+
+    Returns the new feed size, or None when the delta cannot be applied exactly
+    and the caller has to fall back to a full rebuild. That happens when there is
+    no stored feed yet, or when a row would leave a full feed (its replacement
+    is somewhere in the candidate set we are not loading).
+    """
+    now = int(time.time())
+
+    stored_entries = load_feed(user_id)
+    stored = {mid: e["score"] for mid, e in stored_entries.items()}
+    if not stored:
+        return None
+    feed_full = len(stored) >= FEED_SIZE
+    floor = min(stored.values())
+
+    removed_ids = {m["musicId"] for m in messages if m.get("reason") in SONG_REMOVAL_REASONS}
+    touched_ids = {m["musicId"] for m in messages if m.get("reason") in SONG_DELTA_REASONS}
+    subscribed = [split_target(m["musicId"]) for m in messages if m.get("reason") == "subscribe"]
+
+    # deleted songs that are not in the feed don't change anything
+    removed_ids &= set(stored)
+    if removed_ids and feed_full:
+        return None
+
+    if subscribed:
+        # subscribing only raises scores: rescore the stored rows plus the new target's songs
+        touched_ids.update(stored)
+        for kind, target in subscribed:
+            if kind == "genre":
+                touched_ids.update(genre_song_ids(target))
+            else:
+                touched_ids.update(artist_song_ids(target))
+    touched_ids -= removed_ids
+
+    rows = {}
+    if touched_ids:
+        sub_artists, sub_genres = load_subscriptions(user_id)
+        reactions_map = load_reactions(user_id)
+        genre_counts = load_genre_affinity(user_id, now)
+
+        songs = batch_get_songs(touched_ids)
+        rows = build_feed_rows(user_id, songs, set(sub_artists), set(sub_genres), reactions_map, genre_counts, now)
+
+        # touched songs that no longer exist leave the feed like deleted ones
+        gone = (touched_ids - set(songs)) & set(stored)
+        if gone and feed_full:
+            return None
+        removed_ids |= gone
+
+        # a stored row whose score dropped below the old floor may now rank under
+        # songs that are not loaded here
+        if feed_full and any(
+            mid in stored and row["score"] < floor for mid, row in rows.items()
+        ):
+            return None
+
+    # merge: stored rows keep their scores unless they were rescored
+    merged = {mid: {"musicId": mid, **e} for mid, e in stored_entries.items() if mid not in removed_ids}
+    merged.update(rows)
+    keep = {row["musicId"] for row in top_feed_rows(merged)}
+
+    save_feed(user_id, stored_entries, [merged[mid] for mid in keep], int(time.time() * 1000))
+
+    return len(keep)
+
+def recompute_user(user_id: str, messages) -> int:
+    """Apply the user's messages as a delta when possible, otherwise rebuild. Raises on failure."""
+    feed_count = None
+    if messages and all(is_incremental(m) for m in messages):
+        feed_count = incremental_recompute(user_id, messages)
+    if feed_count is None:
+        feed_count = full_recompute(user_id)
+    return feed_count
+
+def marker_messages(user_id: str, marker) -> list:
+    """Recompute messages collected in a pending marker (the union of the window's requests)."""
+    if not marker:
+        return []
+    if marker.get("fullRebuild"):
+        return [{"userId": user_id, "reason": "debounced_full", "musicId": None}]
+    msgs = []
+    for delta in marker.get("deltas") or []:
+        reason, music_id = json.loads(delta)
+        msgs.append({"userId": user_id, "reason": reason, "musicId": music_id})
+    return msgs
+
+def recompute_pending(user_id: str, messages) -> int:
+    """
+    Rebuild the user once for everything requested during the debounce window.
+    The marker is deleted only if nothing was added while we were recomputing
+    (same version); otherwise the newer requests are drained in another round.
+    """
+    if not PENDING_TABLE_NAME:
+        return recompute_user(user_id, messages)
+
+    for _ in range(MAX_DRAIN_ROUNDS):
+        marker = table(PENDING_TABLE_NAME).get_item(Key={"userId": user_id}, ConsistentRead=True).get("Item")
+        pending = marker_messages(user_id, marker)
+        invalidate_songs(m["musicId"] for m in pending if m["reason"] in SONG_EVENT_REASONS and m["musicId"])
+
+        count = recompute_user(user_id, messages + pending)
+        if not marker:
+            return count
+        try:
+            table(PENDING_TABLE_NAME).delete_item(
+                Key={"userId": user_id},
+                ConditionExpression=Attr("version").eq(marker["version"]),
+            )
+            return count
+        except ClientError as e:
+            if e.response["Error"]["Code"] != "ConditionalCheckFailedException":
+                raise
+            # more requests arrived mid-rebuild: their producers saw the marker and sent nothing
+            messages = []
+    raise RuntimeError(f"Pending recompute for {user_id} kept changing, retrying later")
+
+def lambda_handler(event, context):
+    try:
+        feed_count = recompute_user(event["userId"], event.get("messages") or [])
+        return {"statusCode": 200, "body": json.dumps({"feedCount": feed_count}, cls=DecimalEncoder)}
 
     except Exception as e:
         return {"statusCode": 500, "body": json.dumps({"error": str(e)})}
 
 def lambda_sqs_handler(event, context):
+    """
+    Recompute every user in the batch on a bounded pool and report partial
+    failures: only the failed users' messages go back to the queue (and to the
+    DLQ after max_receive_count). Each user is one FIFO message group, so
+    failing all of a user's messages keeps their order intact.
+    """
+    failures = []
 
     # groups messages by user
     by_user = defaultdict(list)
+    record_ids = defaultdict(list)
     for rec in event.get("Records", []):
-
         try:
             msg = json.loads(rec["body"])
+        except Exception as e:
+            print(f"⚠️ Unreadable recompute message {rec.get('messageId')}: {e}")
+            failures.append({"itemIdentifier": rec["messageId"]})
+            continue
+
+        uid = msg.get("userId")
+        if uid:
+            by_user[uid].append(msg)
+            record_ids[uid].append(rec["messageId"])
+
+    # new or deleted songs change the candidate lists cached for their genres/artists
+    invalidate_songs(
+        m["musicId"] for msgs in by_user.values() for m in msgs
+        if m.get("reason") in SONG_EVENT_REASONS and m.get("musicId")
+    )
 
-            uid = msg.get("userId")
-            if uid:
-                by_user[uid].append(msg)
+    def run(user_id):
+        try:
+            count = recompute_pending(user_id, by_user[user_id])
+            print(f"✅ Recomputed feed for {user_id} ({count} items)")
+            return None
         except Exception as e:
-            raise
+            print(f"❌ Feed recompute failed for {user_id}: {e}")
+            return user_id
 
     # recompute for each user once
-    for user_id in by_user.keys():
-        print(f"Call recompute for {user_id}")
-        result = lambda_handler({"userId": user_id}, context)
-
-
-
-def clear_old_feed(user_id: str):
-    """
-    Delete all existing feed items for a user before recomputing.
-    """
-    resp = feed_table.query(
-        KeyConditionExpression=Key("userId").eq(user_id),
-        ProjectionExpression="userId, musicId"
-    )
-    items = resp.get("Items", [])
+    if by_user:
+        with ThreadPoolExecutor(max_workers=min(RECOMPUTE_WORKERS, len(by_user))) as pool:
+            for failed in pool.map(run, list(by_user)):
+                if failed:
+                    failures.extend({"itemIdentifier": mid} for mid in record_ids[failed])
 
-    with feed_table.batch_writer() as batch:
-        for it in items:
-            batch.delete_item(Key={"userId": it["userId"], "musicId": it["musicId"]})
+    return {"batchItemFailures": failures}
@@ -1,13 +1,21 @@
-import os, json, boto3, decimal
-from boto3.dynamodb.conditions import Key
-from urllib.parse import urlparse
+import os, json, boto3, decimal, base64
+from common.batch import batch_get_by_id
+from common.feed_store import FEED_STORAGE_MODE, MODE_ROWS, read_feed_page
+from common.presign import presign_from_full_url
 
 dynamodb = boto3.resource("dynamodb")
-feed_table = dynamodb.Table(os.environ["USER_FEED_TABLE"])
 song_table = dynamodb.Table(os.environ["SONG_TABLE"])
 S3_BUCKET  = os.environ["S3_BUCKET"]
 
-s3c = boto3.client("s3")
+# Deleted songs leave row feeds through FeedMusicIndex (song_fanout). Snapshot and
+# packed feeds can't be cleaned per song, and neither can rows before the index is
+# deployed, so those pages check that their songs still exist.
+FEED_MUSIC_INDEX = os.environ.get("FEED_MUSIC_INDEX", "FeedMusicIndex")
+VERIFY_SONGS_EXIST = FEED_STORAGE_MODE != MODE_ROWS or not FEED_MUSIC_INDEX
+
+DEFAULT_PAGE_SIZE = 20
+MAX_PAGE_SIZE = 100
+
 
 def get_user_id(event):
     rc = event.get("requestContext", {})
@@ -35,26 +43,16 @@ def response(status, body):
         "body": json.dumps(body, cls=DecimalEncoder),
     }
 
-def _extract_key_from_url(u: str | None) -> str | None:
-    if not u:
-        return None
-    p = urlparse(u)
-    path = (p.path or "").lstrip("/")
-
-    # virtual-hosted or path-style
-    if p.netloc.startswith(f"{S3_BUCKET}.") or p.netloc == S3_BUCKET:
-        return path or None
-    if path.startswith(f"{S3_BUCKET}/"):
-        return path.split("/", 1)[1] or None
-    return path or None
-
-def _presign_from_full_url(u: str | None, expires: int = 3600) -> str | None:
-    key = _extract_key_from_url(u)
-    if not key:
-        return None
-    return s3c.generate_presigned_url(
-        "get_object", Params={"Bucket": S3_BUCKET, "Key": key}, ExpiresIn=expires
-    )
+def encode_cursor(entry):
+    """Opaque cursor: position of the last entry returned, in (score desc, musicId) order."""
+    raw = json.dumps({"s": str(entry["score"]), "m": entry["musicId"]})
+    return base64.urlsafe_b64encode(raw.encode()).decode()
+
+
+def decode_cursor(cursor):
+    raw = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+    return decimal.Decimal(raw["s"]), raw["m"]
+
 
 def lambda_handler(event, context):
     print("DEBUG - incoming event:", json.dumps(event))
@@ -63,23 +61,37 @@ def lambda_handler(event, context):
     if not user_id:
         return response(401, {"error": "Unauthorized"})
 
+    params = event.get("queryStringParameters") or {}
+    try:
+        limit = int(params.get("limit", DEFAULT_PAGE_SIZE))
+        if limit <= 0:
+            raise ValueError("limit must be positive")
+        limit = min(limit, MAX_PAGE_SIZE)
+        cursor = decode_cursor(params["cursor"]) if params.get("cursor") else None
+    except Exception as e:
+        return response(400, {"error": f"Invalid limit or cursor: {str(e)}"})
+
     try:
-        # 1. Get all musicIds for the user
-        feed_result = feed_table.query(
-            KeyConditionExpression=Key("userId").eq(user_id)
-        )
-        feed_items = feed_result.get("Items", [])
-        if not feed_items:
-            return response(200, {"songs": [], "albums": []})
-
-        music_ids = [item["musicId"] for item in feed_items]
-
-        # 2. BatchGet all songs
-        keys = [{"musicId": mid} for mid in music_ids]
-        songs_resp = dynamodb.batch_get_item(
-            RequestItems={song_table.name: {"Keys": keys}}
-        )
-        songs = songs_resp["Responses"].get(song_table.name, [])
+        # 1. Score-ordered page of musicIds for the user
+        page, has_more = read_feed_page(user_id, cursor, limit)
+        next_cursor = encode_cursor(page[-1]) if has_more else None
+        if not page:
+            return response(200, {"songs": [], "albums": [], "nextCursor": None})
+
+        # 2. Song fields are stored with the feed entries; only entries written
+        #    before that need a SongTable read
+        music_ids = [item["musicId"] for item in page]
+        found = {item["musicId"]: {"musicId": item["musicId"], **item["song"]} for item in page if item.get("song")}
+        missing = [mid for mid in music_ids if mid not in found]
+        if missing:
+            found.update(batch_get_by_id(song_table.name, "musicId", missing))
+        if VERIFY_SONGS_EXIST:
+            summarized = [mid for mid in music_ids if mid in found and mid not in missing]
+            existing = batch_get_by_id(song_table.name, "musicId", summarized, projection=["musicId"])
+            for mid in summarized:
+                if mid not in existing:
+                    del found[mid]
+        songs = [found[mid] for mid in music_ids if mid in found]
 
         for song in songs:
             genres = song.get("genres")
@@ -91,8 +103,8 @@ def lambda_handler(event, context):
             file_url = song.get("fileUrl")
             cover_url = song.get("coverUrl")
 
-            song["fileUrl"] = _presign_from_full_url(file_url) if file_url else None
-            song["coverUrl"] = _presign_from_full_url(cover_url) or cover_url
+            song["fileUrl"] = presign_from_full_url(file_url) if file_url else None
+            song["coverUrl"] = presign_from_full_url(cover_url) or cover_url
 
         # 3. Group by albumId
         albums_map = {}
@@ -125,7 +137,7 @@ def lambda_handler(event, context):
             album_data["genres"] = sorted(list(album_data["genres"]))
             albums.append(album_data)
 
-        return response(200, {"songs": songs, "albums": albums})
+        return response(200, {"songs": songs, "albums": albums, "nextCursor": next_cursor})
 
     except Exception as e:
         print("ERROR:", str(e))
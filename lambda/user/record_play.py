@@ -3,11 +3,147 @@ import os
 import json
 import time
 import boto3
+from botocore.exceptions import ClientError
 
-dynamodb = boto3.resource("dynamodb")
-history_table = dynamodb.Table(os.environ["USER_HISTORY_TABLE"])
+dynamo_client = boto3.client("dynamodb")
 
+USER_HISTORY_TABLE = os.environ["USER_HISTORY_TABLE"]
+
+# Genre affinity lives on the user's USER_HISTORY_TABLE item as top-level
+# "affinity#<genre>" numbers (ADD creates them on first play). A play at time t
+# adds 2 ** ((t - epoch) / half_life), where `epoch` is the item's affinityEpoch,
+# so the stored value multiplied by 2 ** (-(now - epoch) / half_life) is the
+# exponentially decayed play count and concurrent plays just ADD.
+# Epochs advance every REBASE_HALF_LIVES half-lives (aligned to AFFINITY_EPOCH, so
+# every writer agrees on the current one). The first play in a new epoch rescales
+# the stored values to it, which keeps them below 2 ** REBASE_HALF_LIVES per play.
+AFFINITY_PREFIX = "affinity#"
+AFFINITY_EPOCH = 1735689600    # 2025-01-01T00:00:00Z, shared with feed.py
+AFFINITY_HALF_LIFE_DAYS = float(os.environ.get("AFFINITY_HALF_LIFE_DAYS", "14"))
+HALF_LIFE_SECONDS = AFFINITY_HALF_LIFE_DAYS * 86400
+REBASE_HALF_LIVES = 4
+MAX_WRITE_ATTEMPTS = 3
+
+# Bounded play history (recentPlays, returned as "history"): appended in the same
+# UpdateItem; once it is HISTORY_TRIM_SLACK entries over MAX_HISTORY, one extra
+# conditional write drops the oldest, so trimming costs a write every few plays.
 MAX_HISTORY = 40
+HISTORY_TRIM_SLACK = 10
+
+
+def current_epoch(t: float) -> int:
+    period = REBASE_HALF_LIVES * HALF_LIFE_SECONDS
+    return int(AFFINITY_EPOCH + (t - AFFINITY_EPOCH) // period * period)
+
+
+def affinity_weight(t: float, epoch: int) -> str:
+    """Weight of one play at time t, as a DynamoDB number string."""
+    return f"{2 ** ((t - epoch) / HALF_LIFE_SECONDS):.12g}"
+
+
+def _is_condition_failure(e: ClientError) -> bool:
+    return e.response["Error"]["Code"] == "ConditionalCheckFailedException"
+
+
+def rebase_affinity(user_id: str, epoch: int) -> int:
+    """
+    Move the user's affinity values to `epoch` (if they are older) and return
+    the epoch the item is on afterwards.
+    """
+    item = dynamo_client.get_item(
+        TableName=USER_HISTORY_TABLE, Key={"userId": {"S": user_id}}, ConsistentRead=True,
+    ).get("Item", {})
+    old = int(item["affinityEpoch"]["N"]) if "affinityEpoch" in item else None
+    if old is not None and old >= epoch:
+        return old     # someone already moved it (or our clock is behind theirs)
+
+    factor = 2 ** (-(epoch - (old if old is not None else AFFINITY_EPOCH)) / HALF_LIFE_SECONDS)
+    names, values, sets = {}, {":e": {"N": str(epoch)}}, ["affinityEpoch = :e"]
+    for i, (k, v) in enumerate(a for a in item.items() if a[0].startswith(AFFINITY_PREFIX)):
+        names[f"#a{i}"] = k
+        values[f":a{i}"] = {"N": f"{float(v['N']) * factor:.12g}"}
+        sets.append(f"#a{i} = :a{i}")
+    kwargs = {}
+    if old is None:
+        kwargs["ConditionExpression"] = "attribute_not_exists(affinityEpoch)"
+    else:
+        kwargs["ConditionExpression"] = "affinityEpoch = :old"
+        values[":old"] = {"N": str(old)}
+    if names:
+        kwargs["ExpressionAttributeNames"] = names
+    try:
+        dynamo_client.update_item(
+            TableName=USER_HISTORY_TABLE,
+            Key={"userId": {"S": user_id}},
+            UpdateExpression="SET " + ", ".join(sets),
+            ExpressionAttributeValues=values,
+            **kwargs,
+        )
+    except ClientError as e:
+        if not _is_condition_failure(e):
+            raise
+        # a concurrent play rebased first; the retried ADD will see its epoch
+    return epoch
+
+
+def _play_from_av(av: dict) -> dict:
+    m = av["M"]
+    return {"genre": m["genre"]["S"], "playedAt": int(m["playedAt"]["N"])}
+
+
+def trim_history(user_id: str, length: int):
+    """Drop the oldest plays down to MAX_HISTORY, unless the list changed since we saw `length`."""
+    drop = length - MAX_HISTORY
+    try:
+        dynamo_client.update_item(
+            TableName=USER_HISTORY_TABLE,
+            Key={"userId": {"S": user_id}},
+            UpdateExpression="REMOVE " + ", ".join(f"recentPlays[{i}]" for i in range(drop)),
+            ConditionExpression="size(recentPlays) = :n",
+            ExpressionAttributeValues={":n": {"N": str(length)}},
+        )
+    except ClientError as e:
+        if not _is_condition_failure(e):
+            raise
+        # a concurrent play appended (or trimmed) first; a later play trims
+
+
+def add_play(user_id: str, genre: str, t: float) -> list:
+    """
+    ADD one play to playCount and the genre's affinity, in the item's current
+    epoch, and append it to recentPlays. Returns the last MAX_HISTORY plays.
+    """
+    epoch = current_epoch(t)
+    for _ in range(MAX_WRITE_ATTEMPTS):
+        try:
+            resp = dynamo_client.update_item(
+                TableName=USER_HISTORY_TABLE,
+                Key={"userId": {"S": user_id}},
+                UpdateExpression="ADD playCount :one, #g :w "
+                                 "SET affinityEpoch = :e, recentPlays = list_append(if_not_exists(recentPlays, :empty), :play)",
+                # a brand-new item starts in the current epoch
+                ConditionExpression="attribute_not_exists(userId) OR affinityEpoch = :e",
+                ExpressionAttributeNames={"#g": f"{AFFINITY_PREFIX}{genre}"},
+                ExpressionAttributeValues={
+                    ":one": {"N": "1"},
+                    ":w": {"N": affinity_weight(t, epoch)},
+                    ":e": {"N": str(epoch)},
+                    ":play": {"L": [{"M": {"genre": {"S": genre}, "playedAt": {"N": str(int(t))}}}]},
+                    ":empty": {"L": []},
+                },
+                ReturnValues="UPDATED_NEW",
+            )
+            plays = resp.get("Attributes", {}).get("recentPlays", {}).get("L", [])
+            if len(plays) > MAX_HISTORY + HISTORY_TRIM_SLACK:
+                trim_history(user_id, len(plays))
+            return [_play_from_av(p) for p in plays[-MAX_HISTORY:]]
+        except ClientError as e:
+            if not _is_condition_failure(e):
+                raise
+        epoch = rebase_affinity(user_id, epoch)
+    raise RuntimeError(f"Could not record play for {user_id}: affinity epoch kept changing")
+
+
 class DecimalEncoder(json.JSONEncoder):
     def default(self, obj):
         if isinstance(obj, decimal.Decimal):
@@ -37,27 +173,10 @@ def lambda_handler(event, context):
         if not genre:
             return response(400, {"error": "genre is required"})
 
-        play_entry = {
-            "genre": genre,
-            "playedAt": int(time.time())
-        }
-
-        # Append new play atomically
-        history_table.update_item(
-            Key={"userId": user_id},
-            UpdateExpression="SET recentPlays = list_append(if_not_exists(recentPlays, :empty), :new)",
-            ExpressionAttributeValues={
-                ":new": [play_entry],
-                ":empty": []
-            }
-        )
+        now = int(time.time())
 
-        # Trim if longer than MAX_HISTORY
-        item = history_table.get_item(Key={"userId": user_id}).get("Item", {})
-        history = item.get("recentPlays", [])
-        if len(history) > MAX_HISTORY:
-            history = history[-MAX_HISTORY:]
-            history_table.put_item(Item={"userId": user_id, "recentPlays": history})
+        # usually one round trip: plays only ever ADD to / append on the user's history item
+        history = add_play(user_id, genre, now)
 
         return response(200, {"message": "Play recorded", "history": history})
 
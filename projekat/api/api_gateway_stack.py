@@ -129,6 +129,15 @@ class ApiGateway(Construct):
             "PUT",
             apigw.LambdaIntegration(music_lambdas.update_music_lambda),
         )
+        upload_resource = music_resource.add_resource("upload")
+        upload_resource.add_resource("start").add_method(
+            "POST",
+            apigw.LambdaIntegration(music_lambdas.start_upload_lambda),
+        )
+        upload_resource.add_resource("complete").add_method(
+            "POST",
+            apigw.LambdaIntegration(music_lambdas.complete_upload_lambda),
+        )
         delete_batch = music_resource.add_resource("deleteBatch")
         delete_batch.add_method(
             "POST",
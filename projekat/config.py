@@ -3,4 +3,29 @@ from dotenv import load_dotenv
 
 load_dotenv()
 
-PROJECT_PREFIX = os.getenv("PROJECT_PREFIX", "MyApp")
\ No newline at end of file
+PROJECT_PREFIX = os.getenv("PROJECT_PREFIX", "MyApp")
+
+# how user feeds are stored: "rows" | "snapshot" | "packed" (see lambda/user/common/feed_store.py)
+FEED_STORAGE_MODE = os.getenv("FEED_STORAGE_MODE", "rows")
+
+# DynamoDB (through CloudFormation) creates or deletes at most one GSI per table
+# in a single stack update, so index changes on existing stacks are rolled out in
+# stages: deploy with GSI_STAGE=1, then 2, ... up to GSI_FINAL_STAGE. A new stack
+# creates its tables with every index at once, so it deploys the final stage.
+#   1  UserFeedTable keeps UserFeedScoreIndex (KEYS_ONLY)
+#      SongTable + FileKeyIndex
+#   2  UserFeedTable + UserFeedScoreSongIndex (score + song summary); get_feed reads it
+#      SongTable + SongListingIndex (listKey, written by every upload)
+#   3  UserFeedTable - UserFeedScoreIndex
+#   4  UserFeedTable + FeedMusicIndex (songRef -> userId)
+#   5  get_songs reads SongListingIndex instead of scanning SongTable. Invoke the
+#      listing backfill (music/backfill_listing.py) until it reports done first,
+#      or songs uploaded before stage 2 drop out of /music/all.
+GSI_FINAL_STAGE = 5
+GSI_STAGE = int(os.getenv("GSI_STAGE", str(GSI_FINAL_STAGE)))
+
+FEED_SCORE_INDEX = "UserFeedScoreSongIndex" if GSI_STAGE >= 2 else "UserFeedScoreIndex"
+# empty until the index exists: readers fall back to subscriber fan-out
+FEED_MUSIC_INDEX = "FeedMusicIndex" if GSI_STAGE >= 4 else ""
+# "index" once every song has a listKey (stage 5), "scan" until then
+SONG_LISTING_SOURCE = "index" if GSI_STAGE >= 5 else "scan"
@@ -1,5 +1,6 @@
 from aws_cdk import (
-    Duration, Stack,
+    Duration, Stack, RemovalPolicy,
+    aws_dynamodb as dynamodb,
     aws_sqs as sqs,
     aws_lambda as _lambda,
     aws_lambda_event_sources as lambda_events,
@@ -12,9 +13,22 @@ from projekat.config import PROJECT_PREFIX
 class FeedQueueStack(Construct):
     def __init__(self, scope: Construct, id: str, *, env_vars: dict, producer_fns: List[_lambda.Function],
                  user_feed_table=None, user_history_table=None, user_subscriptions_table=None,
-                 user_reactions_table=None, music_table=None, song_table=None, artist_info_table=None) -> None:
+                 user_reactions_table=None, music_table=None, song_table=None, artist_info_table=None,
+                 debounce_seconds: int = 30) -> None:
         super().__init__(scope, id)
 
+        # one marker per user with a recompute waiting in the queue; producers
+        # merge their requests into it, the worker drains it (see common/queue.py)
+        self.pending_table = dynamodb.Table(
+            self, "PendingRecomputeTable",
+            partition_key=dynamodb.Attribute(
+                name="userId", type=dynamodb.AttributeType.STRING
+            ),
+            time_to_live_attribute="expiresAt",
+            billing_mode=dynamodb.BillingMode.PAY_PER_REQUEST,
+            removal_policy=RemovalPolicy.DESTROY,
+        )
+
         # DLQ for failures
         dlq = sqs.Queue(
             self, "UserFeedRecomputeDLQ",
@@ -30,6 +44,8 @@ class FeedQueueStack(Construct):
             fifo=True,
             content_based_deduplication=True,
             visibility_timeout=Duration.seconds(90),
+            # the debounce window: requests made while a message waits are merged into its marker
+            delivery_delay=Duration.seconds(debounce_seconds),
             dead_letter_queue=sqs.DeadLetterQueue(
                 max_receive_count=5,
                 queue=dlq
@@ -46,6 +62,7 @@ class FeedQueueStack(Construct):
             environment = {
                 **env_vars,
                 "RECOMPUTE_SOURCE": "sqs",
+                "PENDING_RECOMPUTE_TABLE": self.pending_table.table_name,
             },
         )
 
@@ -53,8 +70,11 @@ class FeedQueueStack(Construct):
         self.worker.add_event_source(lambda_events.SqsEventSource(
             self.queue,
             batch_size=10,
+            # the worker returns batchItemFailures so only failed users are retried
+            report_batch_item_failures=True,
         ))
 
+        self.pending_table.grant_read_write_data(self.worker)
         if user_feed_table:
             user_feed_table.grant_read_write_data(self.worker)
         if user_history_table:
@@ -73,4 +93,7 @@ class FeedQueueStack(Construct):
         # set producers for this queue
         for fn in producer_fns:
             self.queue.grant_send_messages(fn)
+            self.pending_table.grant_read_write_data(fn)
             fn.add_environment("RECOMPUTE_QUEUE_URL", self.queue.queue_url)
+            fn.add_environment("PENDING_RECOMPUTE_TABLE", self.pending_table.table_name)
+            fn.add_environment("RECOMPUTE_DEBOUNCE_SECONDS", str(debounce_seconds))
@@ -1,11 +1,15 @@
 # music_lambdas.py
-from aws_cdk import Duration
+from aws_cdk import Duration, RemovalPolicy
 from aws_cdk import (
+    aws_dynamodb as dynamodb,
     aws_lambda as _lambda,
+    aws_secretsmanager as secretsmanager,
+    aws_lambda_event_sources as lambda_events,
     aws_sns as sns,
+    aws_sqs as sqs,
 )
 from constructs import Construct
-from ..config import PROJECT_PREFIX
+from ..config import PROJECT_PREFIX, FEED_STORAGE_MODE, FEED_MUSIC_INDEX, SONG_LISTING_SOURCE
 from aws_cdk import aws_iam as iam
 
 
@@ -26,12 +30,14 @@ class MusicLambdas(Construct):
         subscriptions_table,       # DynamoDB table for user subscriptions
         cognito,                   # CognitoAuth stack (needs user_pool + arn)
         notifications_topic: sns.ITopic,  # SNS topic for fan notifications
+        user_feed_table,           # DynamoDB table: USER_FEED_TABLE (PK=userId, SK=musicId)
     ):
         super().__init__(scope, id)
 
         # ---------- Common env vars shared by music handlers ----------
         env_vars_common = {
             "MUSIC_BY_GENRE_TABLE": music_table.table_name,
+            "MUSIC_ID_INDEX": "MusicIdIndex",
             "SONG_TABLE": song_table.table_name,
             "ARTIST_INFO_TABLE": artist_info_table.table_name,
             "S3_BUCKET": s3_bucket.bucket_name,
@@ -43,6 +49,90 @@ class MusicLambdas(Construct):
             "SIGNED_URL_TTL_SECONDS": "900",
         }
 
+        # ---------- New-release notification fan-out ----------
+        notification_dlq = sqs.Queue(
+            self, "ReleaseNotificationDLQ",
+            retention_period=Duration.days(14),
+        )
+        self.notification_queue = sqs.Queue(
+            self, "ReleaseNotificationQueue",
+            visibility_timeout=Duration.seconds(300),
+            dead_letter_queue=sqs.DeadLetterQueue(
+                max_receive_count=5,
+                queue=notification_dlq,
+            ),
+        )
+        # which audience chunks of a release were already published, so a retried
+        # message doesn't email the same people twice (see notify_release.py)
+        self.release_notification_table = dynamodb.Table(
+            self, "ReleaseNotificationTable",
+            partition_key=dynamodb.Attribute(
+                name="musicId", type=dynamodb.AttributeType.STRING
+            ),
+            time_to_live_attribute="expiresAt",
+            billing_mode=dynamodb.BillingMode.PAY_PER_REQUEST,
+            removal_policy=RemovalPolicy.DESTROY,
+        )
+        self.notify_release_lambda = _lambda.Function(
+            self, f"{PROJECT_PREFIX}NotifyReleaseLambda",
+            runtime=_lambda.Runtime.PYTHON_3_11,
+            handler="notify_release.lambda_handler",
+            code=_lambda.Code.from_asset("lambda/music"),
+            environment={
+                **env_vars_common,
+                "RELEASE_NOTIFICATION_TABLE": self.release_notification_table.table_name,
+            },
+            timeout=Duration.seconds(300),
+        )
+        self.notify_release_lambda.add_event_source(lambda_events.SqsEventSource(
+            self.notification_queue,
+            batch_size=10,
+            # the handler returns batchItemFailures so only failed releases are retried
+            report_batch_item_failures=True,
+        ))
+        self.release_notification_table.grant_read_write_data(self.notify_release_lambda)
+        subscriptions_table.grant_read_data(self.notify_release_lambda)
+        notifications_topic.grant_publish(self.notify_release_lambda)
+
+        # ---------- Song event fan-out (feed recomputes) ----------
+        # upload/update/delete hand one event per song to this queue; the worker
+        # finds the affected users and feeds the recompute queue (FeedQueueStack)
+        song_event_dlq = sqs.Queue(
+            self, "SongEventDLQ",
+            retention_period=Duration.days(14),
+        )
+        self.song_event_queue = sqs.Queue(
+            self, "SongEventQueue",
+            visibility_timeout=Duration.seconds(900),
+            dead_letter_queue=sqs.DeadLetterQueue(
+                max_receive_count=5,
+                queue=song_event_dlq,
+            ),
+        )
+        self.song_fanout_lambda = _lambda.Function(
+            self, f"{PROJECT_PREFIX}SongFanoutLambda",
+            runtime=_lambda.Runtime.PYTHON_3_11,
+            handler="song_fanout.lambda_handler",
+            code=_lambda.Code.from_asset("lambda/music"),
+            environment={
+                **env_vars_common,
+                "USER_FEED_TABLE": user_feed_table.table_name,
+                "FEED_STORAGE_MODE": FEED_STORAGE_MODE,
+                "FEED_MUSIC_INDEX": FEED_MUSIC_INDEX,
+            },
+            timeout=Duration.seconds(900),
+            memory_size=512,
+        )
+        self.song_fanout_lambda.add_event_source(lambda_events.SqsEventSource(
+            self.song_event_queue,
+            batch_size=5,
+            report_batch_item_failures=True,
+        ))
+        subscriptions_table.grant_read_data(self.song_fanout_lambda)
+        song_table.grant_read_data(self.song_fanout_lambda)
+        # refreshes the song summary copied into feed entries
+        user_feed_table.grant_read_write_data(self.song_fanout_lambda)
+
         # ---------- Upload ----------
         self.upload_music_lambda = _lambda.Function(
             self, f"{PROJECT_PREFIX}UploadMusicLambda",
@@ -56,22 +146,39 @@ class MusicLambdas(Construct):
         music_table.grant_write_data(self.upload_music_lambda)
         artist_info_table.grant_write_data(self.upload_music_lambda)
         s3_bucket.grant_put(self.upload_music_lambda)
-        subscriptions_table.grant_read_data(self.upload_music_lambda)
-        notifications_topic.grant_publish(self.upload_music_lambda)
-        # Cognito lookups for notifying followers / ownership checks
-        self.upload_music_lambda.add_to_role_policy(
-            iam.PolicyStatement(
-                actions=["cognito-idp:AdminGetUser", "cognito-idp:ListUsers"],
-                resources=[cognito.user_pool.user_pool_arn],
-            )
-        )
-        # Manage SNS subscriptions if your upload flow subscribes/unsubscribes users
-        self.upload_music_lambda.add_to_role_policy(
-            iam.PolicyStatement(
-                actions=["sns:Subscribe", "sns:Unsubscribe"],
-                resources=[notifications_topic.topic_arn],
-            )
+
+        # ---------- Direct-to-S3 multipart upload (start / complete) ----------
+        self.start_upload_lambda = _lambda.Function(
+            self, f"{PROJECT_PREFIX}StartUploadLambda",
+            runtime=_lambda.Runtime.PYTHON_3_11,
+            handler="multipart_upload.start_handler",
+            code=_lambda.Code.from_asset("lambda/music"),
+            environment=env_vars_common,
+            timeout=Duration.seconds(10),
         )
+        # presigned upload_part / put_object URLs are signed with this role
+        s3_bucket.grant_put(self.start_upload_lambda)
+
+        self.complete_upload_lambda = _lambda.Function(
+            self, f"{PROJECT_PREFIX}CompleteUploadLambda",
+            runtime=_lambda.Runtime.PYTHON_3_11,
+            handler="multipart_upload.complete_handler",
+            code=_lambda.Code.from_asset("lambda/music"),
+            environment=env_vars_common,
+            timeout=Duration.seconds(30),
+        )
+        song_table.grant_write_data(self.complete_upload_lambda)
+        music_table.grant_write_data(self.complete_upload_lambda)
+        artist_info_table.grant_write_data(self.complete_upload_lambda)
+        s3_bucket.grant_put(self.complete_upload_lambda)
+        s3_bucket.grant_read(self.complete_upload_lambda)
+
+        # upload paths only hand the release to the fan-out queues
+        for fn in (self.upload_music_lambda, self.complete_upload_lambda):
+            self.notification_queue.grant_send_messages(fn)
+            fn.add_environment("NOTIFICATION_QUEUE_URL", self.notification_queue.queue_url)
+            self.song_event_queue.grant_send_messages(fn)
+            fn.add_environment("SONG_EVENT_QUEUE_URL", self.song_event_queue.queue_url)
 
         # ---------- Get albums by genre ----------
         self.get_albums_by_genre_lambda = _lambda.Function(
@@ -110,6 +217,8 @@ class MusicLambdas(Construct):
         song_table.grant_read_write_data(self.delete_music_lambda)
         music_table.grant_read_write_data(self.delete_music_lambda)
         s3_bucket.grant_delete(self.delete_music_lambda)
+        self.song_event_queue.grant_send_messages(self.delete_music_lambda)
+        self.delete_music_lambda.add_environment("SONG_EVENT_QUEUE_URL", self.song_event_queue.queue_url)
 
         # ---------- Update song ----------
         self.update_music_lambda = _lambda.Function(
@@ -117,10 +226,14 @@ class MusicLambdas(Construct):
             runtime=_lambda.Runtime.PYTHON_3_11,
             handler="update_music.lambda_handler",
             code=_lambda.Code.from_asset("lambda/music"),
-            environment=env_vars_common,
+            environment={
+                **env_vars_common,
+                "SONG_EVENT_QUEUE_URL": self.song_event_queue.queue_url,
+            },
             timeout=Duration.seconds(30),
         )
         song_table.grant_read_write_data(self.update_music_lambda)
+        self.song_event_queue.grant_send_messages(self.update_music_lambda)
         music_table.grant_read_write_data(self.update_music_lambda)
         s3_bucket.grant_put(self.update_music_lambda)
         s3_bucket.grant_delete(self.update_music_lambda)
@@ -152,17 +265,40 @@ class MusicLambdas(Construct):
         s3_bucket.grant_read(self.download_song_lambda)
 
         # ---------- Get all songs ----------
+        # HMAC key for the opaque listing cursors (common/cursors.py)
+        list_cursor_secret = secretsmanager.Secret(
+            self, "ListCursorSecret",
+            generate_secret_string=secretsmanager.SecretStringGenerator(
+                exclude_punctuation=True, password_length=48,
+            ),
+        )
         self.get_all_songs_lambda = _lambda.Function(
             self, f"{PROJECT_PREFIX}GetAllSongsLambda",
             runtime=_lambda.Runtime.PYTHON_3_11,
             handler="get_songs.lambda_handler",
             code=_lambda.Code.from_asset("lambda/music"),
-            environment=env_vars_common,
+            environment={
+                **env_vars_common,
+                "LIST_CURSOR_SECRET_ARN": list_cursor_secret.secret_arn,
+                "SONG_LISTING_SOURCE": SONG_LISTING_SOURCE,
+            },
             timeout=Duration.seconds(30),
         )
         song_table.grant_read_data(self.get_all_songs_lambda)
+        list_cursor_secret.grant_read(self.get_all_songs_lambda)
         s3_bucket.grant_read(self.get_all_songs_lambda)
 
+        # ---------- listKey backfill for songs older than SongListingIndex (invoked by hand) ----------
+        self.backfill_listing_lambda = _lambda.Function(
+            self, f"{PROJECT_PREFIX}BackfillListingLambda",
+            runtime=_lambda.Runtime.PYTHON_3_11,
+            handler="backfill_listing.lambda_handler",
+            code=_lambda.Code.from_asset("lambda/music"),
+            environment=env_vars_common,
+            timeout=Duration.minutes(15),
+        )
+        song_table.grant_read_write_data(self.backfill_listing_lambda)
+
         # ---------- Signed GET for streaming ----------
         self.get_signed_music_lambda = _lambda.Function(
             self, f"{PROJECT_PREFIX}GetSignedMusicLambda",
@@ -204,11 +340,16 @@ class MusicLambdas(Construct):
             environment={
                 "SONG_TABLE": song_table.table_name,
                 "MUSIC_BY_GENRE_TABLE": music_table.table_name,
+                "MUSIC_ID_INDEX": "MusicIdIndex",
                 "ARTIST_INFO_TABLE": artist_info_table.table_name,
+                "S3_BUCKET": s3_bucket.bucket_name,
+                "SONG_EVENT_QUEUE_URL": self.song_event_queue.queue_url,
             },
             timeout=Duration.seconds(60),
         )
         song_table.grant_read_write_data(self.delete_music_batch_by_ids_lambda)
         music_table.grant_read_write_data(self.delete_music_batch_by_ids_lambda)
         artist_info_table.grant_read_write_data(self.delete_music_batch_by_ids_lambda)
+        s3_bucket.grant_delete(self.delete_music_batch_by_ids_lambda)
+        self.song_event_queue.grant_send_messages(self.delete_music_batch_by_ids_lambda)
 
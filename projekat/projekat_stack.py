@@ -23,7 +23,7 @@ from projekat.user.user_lambdas import UserLambdas
 from projekat.frontend.amplify_stack import FrontendStack
 from projekat.music.music_lambdas import MusicLambdas
 from projekat.feed_queue_stack import FeedQueueStack
-from projekat.config import PROJECT_PREFIX
+from projekat.config import PROJECT_PREFIX, FEED_STORAGE_MODE, GSI_STAGE
 
 
 class ProjekatStack(Stack):
@@ -72,6 +72,18 @@ class ProjekatStack(Stack):
             allowed_headers=["*"],
             max_age=3000,
         )
+        # Direct multipart uploads: browser PUTs parts and needs the ETag back
+        self.music_bucket.add_cors_rule(
+            allowed_methods=[s3.HttpMethods.PUT],
+            allowed_origins=["http://localhost:5173"],
+            allowed_headers=["*"],
+            exposed_headers=["ETag"],
+            max_age=3000,
+        )
+        # Parts of uploads that were never completed
+        self.music_bucket.add_lifecycle_rule(
+            abort_incomplete_multipart_upload_after=Duration.days(1),
+        )
 
         # ---------- SNS ----------
         notifications_topic = sns.Topic(
@@ -124,6 +136,18 @@ class ProjekatStack(Stack):
             billing_mode=dynamodb.BillingMode.PAY_PER_REQUEST,
         )
 
+        # musicId -> (genre, musicId) rows, so deletes find a song's index rows without a scan
+        self.music_table.add_global_secondary_index(
+            index_name="MusicIdIndex",
+            partition_key=dynamodb.Attribute(
+                name="musicId", type=dynamodb.AttributeType.STRING
+            ),
+            sort_key=dynamodb.Attribute(
+                name="genre", type=dynamodb.AttributeType.STRING
+            ),
+            projection_type=dynamodb.ProjectionType.KEYS_ONLY,
+        )
+
         self.song_table = dynamodb.Table(
             self,
             "SongTable",
@@ -133,6 +157,32 @@ class ProjekatStack(Stack):
             billing_mode=dynamodb.BillingMode.PAY_PER_REQUEST,
         )
 
+        # S3 object key -> musicId (used by transcription on S3 upload events)
+        self.song_table.add_global_secondary_index(
+            index_name="FileKeyIndex",
+            partition_key=dynamodb.Attribute(
+                name="fileKey", type=dynamodb.AttributeType.STRING
+            ),
+            projection_type=dynamodb.ProjectionType.KEYS_ONLY,
+        )
+
+        # newest-first catalog listing for /music/all (get_songs), staged after FileKeyIndex
+        if GSI_STAGE >= 2:
+            self.song_table.add_global_secondary_index(
+                index_name="SongListingIndex",
+                partition_key=dynamodb.Attribute(
+                    name="listKey", type=dynamodb.AttributeType.STRING
+                ),
+                sort_key=dynamodb.Attribute(
+                    name="createdAt", type=dynamodb.AttributeType.STRING
+                ),
+                projection_type=dynamodb.ProjectionType.INCLUDE,
+                non_key_attributes=[
+                    "title", "artistIds", "albumId", "fileUrl", "coverUrl",
+                    "fileName", "fileType", "fileSize", "updatedAt", "genres",
+                ],
+            )
+
         self.user_history_table = dynamodb.Table(
             self,
             "UserHistoryTable",
@@ -151,9 +201,53 @@ class ProjekatStack(Stack):
             sort_key=dynamodb.Attribute(
                 name="musicId", type=dynamodb.AttributeType.STRING
             ),
+            # replaced feed snapshots expire (feed_store snapshot mode)
+            time_to_live_attribute="expiresAt",
             billing_mode=dynamodb.BillingMode.PAY_PER_REQUEST,
         )
 
+        # index changes are staged across deploys, see GSI_STAGE in config.py
+        if GSI_STAGE < 3:
+            # superseded by UserFeedScoreSongIndex (projections can't change in place)
+            self.user_feed_table.add_global_secondary_index(
+                index_name="UserFeedScoreIndex",
+                partition_key=dynamodb.Attribute(
+                    name="userId", type=dynamodb.AttributeType.STRING
+                ),
+                sort_key=dynamodb.Attribute(
+                    name="score", type=dynamodb.AttributeType.NUMBER
+                ),
+                projection_type=dynamodb.ProjectionType.KEYS_ONLY,
+            )
+
+        # userId -> feed rows by score, so GET /feed is one descending query
+        # (the denormalized song summary comes along, no SongTable read)
+        if GSI_STAGE >= 2:
+            self.user_feed_table.add_global_secondary_index(
+                index_name="UserFeedScoreSongIndex",
+                partition_key=dynamodb.Attribute(
+                    name="userId", type=dynamodb.AttributeType.STRING
+                ),
+                sort_key=dynamodb.Attribute(
+                    name="score", type=dynamodb.AttributeType.NUMBER
+                ),
+                projection_type=dynamodb.ProjectionType.INCLUDE,
+                non_key_attributes=["song"],
+            )
+
+        # song -> users whose feed rows include it (refresh after update_music)
+        if GSI_STAGE >= 4:
+            self.user_feed_table.add_global_secondary_index(
+                index_name="FeedMusicIndex",
+                partition_key=dynamodb.Attribute(
+                    name="songRef", type=dynamodb.AttributeType.STRING
+                ),
+                sort_key=dynamodb.Attribute(
+                    name="userId", type=dynamodb.AttributeType.STRING
+                ),
+                projection_type=dynamodb.ProjectionType.KEYS_ONLY,
+            )
+
         # ---------- QUEUE ----------
         recompute_queue = sqs.Queue(
             self,
@@ -203,6 +297,7 @@ class ProjekatStack(Stack):
             subscriptions_table=self.subscriptions_table.table,
             cognito=cognito,
             notifications_topic=notifications_topic,
+            user_feed_table=self.user_feed_table,
         )
 
         # ---------- ARTIST LAMBDAS ----------
@@ -247,6 +342,7 @@ class ProjekatStack(Stack):
             f"{PROJECT_PREFIX}FeedQueue",
             env_vars={
                 "USER_FEED_TABLE": self.user_feed_table.table_name,
+                "FEED_STORAGE_MODE": FEED_STORAGE_MODE,
                 "USER_HISTORY_TABLE": self.user_history_table.table_name,
                 "USER_SUBSCRIPTIONS_TABLE": self.subscriptions_table.table.table_name,
                 "USER_REACTIONS_TABLE": rates_table.table_name,
@@ -258,8 +354,7 @@ class ProjekatStack(Stack):
                 subscription_lambdas.subscriptions_lambda,
                 rate_lambdas.create_rate_lambda,
                 rate_lambdas.delete_rate_lambda,
-                music_lambdas.upload_music_lambda,
-                music_lambdas.delete_music_lambda,
+                music_lambdas.song_fanout_lambda,
             ],
             user_feed_table=self.user_feed_table,
             user_history_table=self.user_history_table,
@@ -43,7 +43,35 @@ class SubscriptionsLambdas(Construct):
         notifications_topic.grant_publish(self.subscriptions_lambda)
         self.subscriptions_lambda.add_to_role_policy(
             iam.PolicyStatement(
-                actions=["sns:Subscribe", "sns:Unsubscribe"],
+                actions=["sns:Subscribe", "sns:Unsubscribe", "sns:SetSubscriptionAttributes"],
+                resources=[notifications_topic.topic_arn, f"{notifications_topic.topic_arn}:*"]
+            )
+        )
+
+        # One-off: filter policies for email subscriptions created before targeted release notifications
+        self.migrate_release_filters_lambda = _lambda.Function(
+            self, f"{PROJECT_PREFIX}MigrateReleaseFiltersLambda",
+            runtime=_lambda.Runtime.PYTHON_3_11,
+            handler="migrate_release_filters.handler",
+            code=_lambda.Code.from_asset("lambda/subscriptions"),
+            environment=env_vars,
+            timeout=Duration.minutes(15)
+        )
+        self.migrate_release_filters_lambda.add_to_role_policy(
+            iam.PolicyStatement(
+                actions=["cognito-idp:ListUsers"],
+                resources=[userpool.user_pool_arn]
+            )
+        )
+        self.migrate_release_filters_lambda.add_to_role_policy(
+            iam.PolicyStatement(
+                actions=["sns:ListSubscriptionsByTopic"],
                 resources=[notifications_topic.topic_arn]
             )
         )
+        self.migrate_release_filters_lambda.add_to_role_policy(
+            iam.PolicyStatement(
+                actions=["sns:GetSubscriptionAttributes", "sns:SetSubscriptionAttributes"],
+                resources=[f"{notifications_topic.topic_arn}:*"]
+            )
+        )
@@ -25,6 +25,8 @@ class TranscriptionStack(Construct):
             },
             timeout=cdk.Duration.minutes(15),
             memory_size=1024,
+            # events that arrive before the upload wrote the song row are retried
+            retry_attempts=2,
         )
 
         song_bucket.grant_read(self.start_fn)
@@ -1,6 +1,6 @@
 from aws_cdk import Duration, aws_lambda as _lambda
 from constructs import Construct
-from projekat.config import PROJECT_PREFIX
+from projekat.config import PROJECT_PREFIX, FEED_STORAGE_MODE, FEED_SCORE_INDEX, FEED_MUSIC_INDEX
 
 
 class UserLambdas(Construct):
@@ -42,6 +42,7 @@ class UserLambdas(Construct):
             code=_lambda.Code.from_asset("lambda/user"),
             environment={
                 "USER_FEED_TABLE": user_feed_table.table_name,
+                "FEED_STORAGE_MODE": FEED_STORAGE_MODE,
                 "USER_HISTORY_TABLE": user_history_table.table_name,
                 "USER_SUBSCRIPTIONS_TABLE": user_subscriptions_table.table_name,
                 "USER_REACTIONS_TABLE": user_reactions_table.table_name,
@@ -68,8 +69,11 @@ class UserLambdas(Construct):
             code=_lambda.Code.from_asset("lambda/user"),
             environment={
                 "USER_FEED_TABLE": user_feed_table.table_name,
+                "FEED_STORAGE_MODE": FEED_STORAGE_MODE,
                 "SONG_TABLE": song_table.table_name,
-                "S3_BUCKET": s3_bucket.bucket_name
+                "S3_BUCKET": s3_bucket.bucket_name,
+                "FEED_SCORE_INDEX": FEED_SCORE_INDEX,
+                "FEED_MUSIC_INDEX": FEED_MUSIC_INDEX,
             },
             timeout=Duration.seconds(10),
         )
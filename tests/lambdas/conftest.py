@@ -0,0 +1,39 @@
+import importlib
+import os
+import sys
+
+import pytest
+
+from tests.lambdas import fake_aws
+
+# Unit tests for the Lambda code run without AWS: boto3/botocore are replaced by
+# fake_aws before any Lambda module is imported.
+fake_aws.install()
+
+ROOT = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+LAMBDA_ROOT = os.path.join(ROOT, "lambda")
+
+
+def _forget_lambda_modules():
+    # every lambda dir has its own "common" package, so modules are re-imported per test
+    for name, module in list(sys.modules.items()):
+        path = getattr(module, "__file__", None) or ""
+        if name == "common" or name.startswith("common.") or path.startswith(LAMBDA_ROOT):
+            del sys.modules[name]
+
+
+@pytest.fixture
+def load_lambda(monkeypatch):
+    """
+    load_lambda("music", "get_songs", SONG_TABLE="songs", ...) imports a Lambda
+    module from lambda/<dir> with the given environment, freshly for this test.
+    """
+    def load(lambda_dir, module, **env):
+        for k, v in env.items():
+            monkeypatch.setenv(k, v)
+        monkeypatch.syspath_prepend(os.path.join(LAMBDA_ROOT, lambda_dir))
+        _forget_lambda_modules()
+        return importlib.import_module(module)
+
+    yield load
+    _forget_lambda_modules()
@@ -0,0 +1,116 @@
+import sys
+import types
+from decimal import Decimal
+from unittest import mock
+
+# Stand-ins for boto3/botocore, so the Lambda modules import without boto3
+# installed and without AWS credentials. Tests replace the module-level
+# clients/tables with fakes; the MagicMocks here only catch stray calls.
+
+
+class ClientError(Exception):
+    def __init__(self, error_response, operation_name):
+        super().__init__(f"{operation_name}: {error_response.get('Error', {}).get('Code')}")
+        self.response = error_response
+        self.operation_name = operation_name
+
+
+def client_error(code: str, operation: str = "Operation", message: str | None = None) -> ClientError:
+    return ClientError({"Error": {"Code": code, "Message": message or code}}, operation)
+
+
+class Config:
+    def __init__(self, **kwargs):
+        self.kwargs = kwargs
+
+
+class _Condition:
+    """Stand-in for boto3.dynamodb.conditions expressions: records the calls made on it."""
+    def __init__(self, *expr):
+        self.expr = expr
+
+    def __getattr__(self, op):
+        if op.startswith("__"):
+            raise AttributeError(op)
+        return lambda *args: _Condition(self.expr, op, *args)
+
+    def __and__(self, other):
+        return _Condition(self.expr, "and", other)
+
+    def __or__(self, other):
+        return _Condition(self.expr, "or", other)
+
+    def __eq__(self, other):
+        return isinstance(other, _Condition) and self.expr == other.expr
+
+    def __repr__(self):
+        return f"Cond{self.expr!r}"
+
+
+class TypeSerializer:
+    def serialize(self, value):
+        if value is None:
+            return {"NULL": True}
+        if isinstance(value, bool):
+            return {"BOOL": value}
+        if isinstance(value, (int, float, Decimal)):
+            return {"N": str(value)}
+        if isinstance(value, str):
+            return {"S": value}
+        if isinstance(value, (list, tuple)):
+            return {"L": [self.serialize(v) for v in value]}
+        if isinstance(value, dict):
+            return {"M": {k: self.serialize(v) for k, v in value.items()}}
+        raise TypeError(f"Unsupported type {type(value)}")
+
+
+class TypeDeserializer:
+    def deserialize(self, value):
+        (kind, v), = value.items()
+        if kind == "NULL":
+            return None
+        if kind == "N":
+            return Decimal(v)
+        if kind == "L":
+            return [self.deserialize(x) for x in v]
+        if kind == "M":
+            return {k: self.deserialize(x) for k, x in v.items()}
+        return v
+
+
+def install():
+    boto3 = types.ModuleType("boto3")
+    boto3.client = lambda *a, **k: mock.MagicMock(name=f"client({a[0] if a else ''})")
+    boto3.resource = lambda *a, **k: mock.MagicMock(name=f"resource({a[0] if a else ''})")
+    session = types.ModuleType("boto3.session")
+    session.Session = lambda *a, **k: mock.MagicMock(name="Session")
+    boto3.session = session
+    dynamodb = types.ModuleType("boto3.dynamodb")
+    conditions = types.ModuleType("boto3.dynamodb.conditions")
+    conditions.Key = lambda name: _Condition("Key", name)
+    conditions.Attr = lambda name: _Condition("Attr", name)
+    dtypes = types.ModuleType("boto3.dynamodb.types")
+    dtypes.TypeSerializer = TypeSerializer
+    dtypes.TypeDeserializer = TypeDeserializer
+    boto3.dynamodb = dynamodb
+    dynamodb.conditions = conditions
+    dynamodb.types = dtypes
+
+    botocore = types.ModuleType("botocore")
+    exceptions = types.ModuleType("botocore.exceptions")
+    exceptions.ClientError = ClientError
+    config = types.ModuleType("botocore.config")
+    config.Config = Config
+    botocore.exceptions = exceptions
+    botocore.config = config
+
+    sys.modules.update({
+        "boto3": boto3,
+        "boto3.session": session,
+        "boto3.dynamodb": dynamodb,
+        "boto3.dynamodb.conditions": conditions,
+        "boto3.dynamodb.types": dtypes,
+        "botocore": botocore,
+        "botocore.exceptions": exceptions,
+        "botocore.config": config,
+    })
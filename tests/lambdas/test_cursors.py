@@ -0,0 +1,45 @@
+from decimal import Decimal
+
+import pytest
+
+
+@pytest.fixture
+def cursors(load_lambda):
+    return load_lambda("music", "common.cursors", LIST_CURSOR_SECRET="test-secret")
+
+
+def test_round_trip(cursors):
+    payload = {"p": {"3": ["2025-01-01T00:00:00", "m1"]}, "d": [0, 5]}
+    assert cursors.decode_cursor(cursors.encode_cursor(payload)) == payload
+
+
+def test_numbers_come_back_as_decimals(cursors):
+    # DynamoDB keys with number attributes need Decimals, not floats
+    assert cursors.decode_cursor(cursors.encode_cursor({"score": 1.5})) == {"score": Decimal("1.5")}
+
+
+def test_cursor_is_opaque_base64url(cursors):
+    token = cursors.encode_cursor({"s": {"musicId": "m1"}})
+    body, tag = token.split(".")
+    assert "=" not in token and "+" not in token and "/" not in token
+    assert body and tag
+
+
+def test_tampered_body_is_rejected(cursors):
+    body, tag = cursors.encode_cursor({"s": {"musicId": "m1"}}).split(".")
+    forged = cursors._b64(b'{"s":{"musicId":"m9"}}')
+    with pytest.raises(ValueError, match="signature"):
+        cursors.decode_cursor(f"{forged}.{tag}")
+
+
+def test_cursor_from_another_key_is_rejected(cursors, monkeypatch):
+    token = cursors.encode_cursor({"s": {"musicId": "m1"}})
+    monkeypatch.setattr(cursors, "_key", b"rotated-secret")
+    with pytest.raises(ValueError):
+        cursors.decode_cursor(token)
+
+
+@pytest.mark.parametrize("token", ["", "no-dot", "%%%.%%%"])
+def test_malformed_cursor_is_rejected(cursors, token):
+    with pytest.raises(ValueError):
+        cursors.decode_cursor(token)
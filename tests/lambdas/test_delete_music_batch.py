@@ -0,0 +1,152 @@
+import json
+from unittest import mock
+
+import pytest
+
+from tests.lambdas.fake_aws import client_error
+
+
+class Writer:
+    def __init__(self, log):
+        self.log = log
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    def delete_item(self, Key):
+        self.log.append(Key)
+
+
+class FakeGenreTable:
+    """MUSIC_BY_GENRE_TABLE: rows (genre, musicId), queried by musicId through MusicIdIndex."""
+    def __init__(self, rows):
+        self.rows = set(rows)
+        self.deleted = []
+        self.queried = []
+
+    def query(self, IndexName, KeyConditionExpression):
+        assert IndexName == "MusicIdIndex"
+        music_id = KeyConditionExpression.expr[2]
+        self.queried.append(music_id)
+        return {"Items": [{"genre": g, "musicId": m} for g, m in sorted(self.rows) if m == music_id]}
+
+    def batch_writer(self):
+        return Writer(self.deleted)
+
+
+class FakeArtistTable:
+    def __init__(self, artists, conflicts=0):
+        self.artists = artists
+        self.conflicts = conflicts
+
+    def get_item(self, Key, ConsistentRead):
+        doc = self.artists.get(Key["artistId"])
+        return {"Item": {"artistId": Key["artistId"], "songs": list(doc)}} if doc is not None else {}
+
+    def update_item(self, Key, UpdateExpression, ConditionExpression, ExpressionAttributeNames, ExpressionAttributeValues):
+        if self.conflicts:
+            self.conflicts -= 1
+            self.artists[Key["artistId"]].append("uploaded-meanwhile")
+            raise client_error("ConditionalCheckFailedException", "UpdateItem")
+        assert self.artists[Key["artistId"]] == ExpressionAttributeValues[":old"]
+        self.artists[Key["artistId"]] = ExpressionAttributeValues[":ns"]
+
+
+SONGS = {
+    "m1": {"genres": ["rock", "pop"], "artistIds": ["a1"], "fileKey": "music/m1.mp3",
+           "coverUrl": "https://bucket.s3.amazonaws.com/covers/m1.jpg"},
+    "m2": {"genres": ["rock"], "artistIds": ["a1", "a2"], "fileUrl": "https://bucket.s3.amazonaws.com/music/m2.mp3"},
+    # written before songs carried their genres
+    "m3": {"artistIds": ["a2"], "fileKey": "music/m3.mp3"},
+}
+
+
+@pytest.fixture
+def batch_delete(load_lambda, monkeypatch):
+    mod = load_lambda(
+        "music", "delete_music_batch_by_ids",
+        SONG_TABLE="songs", MUSIC_BY_GENRE_TABLE="genres", ARTIST_INFO_TABLE="artists", S3_BUCKET="bucket",
+    )
+    monkeypatch.setattr(mod, "batch_get_by_id", lambda table, key, ids, **kw: {i: dict(SONGS[i]) for i in ids if i in SONGS})
+    mod.music_by_genre_table = FakeGenreTable({("rock", "m1"), ("pop", "m1"), ("rock", "m2"), ("jazz", "m3"), ("blues", "orphan")})
+    mod.artist_info_table = FakeArtistTable({"a1": ["m1", "m2", "keep"], "a2": ["m2", "m3"]})
+    mod.deleted_songs = []
+    mod.song_table = mock.MagicMock()
+    mod.song_table.batch_writer.return_value = Writer(mod.deleted_songs)
+    mod.s3 = mock.MagicMock()
+    mod.s3.delete_objects.return_value = {}
+    mod.published = []
+    monkeypatch.setattr(mod, "publish_song_events", lambda events: mod.published.extend(events) or 0)
+    return mod
+
+
+def call(mod, music_ids):
+    res = mod.lambda_handler({"httpMethod": "POST", "body": json.dumps({"musicIds": music_ids})}, None)
+    return res["statusCode"], json.loads(res["body"])
+
+
+def test_deletes_songs_index_rows_artists_and_objects(batch_delete):
+    status, body = call(batch_delete, ["m1", "m2", "m1"])
+
+    assert status == 200
+    assert body["requested"] == 2 and body["deletedSongs"] == 2
+    assert sorted((k["genre"], k["musicId"]) for k in batch_delete.music_by_genre_table.deleted) == [
+        ("pop", "m1"), ("rock", "m1"), ("rock", "m2")]
+    assert batch_delete.artist_info_table.artists == {"a1": ["keep"], "a2": ["m3"]}
+    assert sorted(k["musicId"] for k in batch_delete.deleted_songs) == ["m1", "m2"]
+
+    deleted_keys = {o["Key"] for c in batch_delete.s3.delete_objects.call_args_list for o in c.kwargs["Delete"]["Objects"]}
+    assert deleted_keys == {"music/m1.mp3", "covers/m1.jpg", "music/m2.mp3"}
+
+
+def test_queues_a_delete_event_per_song(batch_delete):
+    call(batch_delete, ["m1", "m2"])
+
+    events = {e["musicId"]: e for e in batch_delete.published}
+    assert set(events) == {"m1", "m2"}
+    assert events["m2"]["event"] == "delete_song"
+    assert events["m2"]["artistIds"] == ["a1", "a2"]
+    assert events["m1"]["genres"] == ["pop", "rock"]
+
+
+def test_per_song_artist_updates_keep_their_shape(batch_delete):
+    _, body = call(batch_delete, ["m1", "m2"])
+
+    results = {r["musicId"]: r for r in body["results"]}
+    assert results["m1"]["artistUpdates"] == [{"artistId": "a1", "removed": 1, "newSongCount": 1}]
+    assert results["m2"]["artistUpdates"] == [
+        {"artistId": "a1", "removed": 1, "newSongCount": 1},
+        {"artistId": "a2", "removed": 1, "newSongCount": 1},
+    ]
+    assert results["m1"]["deletedIndexRows"] == 2
+    # the aggregated per-artist view stays at the top level
+    assert body["artistsUpdated"] == {"a1": 2, "a2": 1}
+
+
+def test_genres_missing_from_the_song_come_from_the_music_id_index(batch_delete):
+    _, body = call(batch_delete, ["m3", "orphan", "nope"])
+
+    assert [(k["genre"], k["musicId"]) for k in batch_delete.music_by_genre_table.deleted] == [("jazz", "m3")]
+    # only the song without genres is looked up; ids without a song row are not
+    assert batch_delete.music_by_genre_table.queried == ["m3"]
+    results = {r["musicId"]: r for r in body["results"]}
+    assert results["m3"]["deletedSong"] is True and results["m3"]["deletedIndexRows"] == 1
+    assert results["orphan"] == {"musicId": "orphan", "status": "not_found"}
+    assert results["nope"] == {"musicId": "nope", "status": "not_found"}
+    assert {e["musicId"]: e["genres"] for e in batch_delete.published} == {"m3": ["jazz"]}
+
+
+def test_artist_list_is_reread_after_a_concurrent_change(batch_delete):
+    batch_delete.artist_info_table.conflicts = 1
+
+    _, body = call(batch_delete, ["m1"])
+
+    assert batch_delete.artist_info_table.artists["a1"] == ["m2", "keep", "uploaded-meanwhile"]
+    assert body["results"][0]["artistUpdates"] == [{"artistId": "a1", "removed": 1, "newSongCount": 3}]
+
+
+def test_requires_music_ids(batch_delete):
+    assert call(batch_delete, [])[0] == 400
@@ -0,0 +1,106 @@
+from decimal import Decimal
+
+import pytest
+
+
+@pytest.fixture
+def feed(load_lambda, monkeypatch):
+    feed = load_lambda("user", "feed")
+    state = {"stored": {}, "saved": None, "full": 0, "artists": set()}
+    songs = {
+        "a": {"musicId": "a", "genres": ["rock"], "artistIds": ["x"], "title": "A"},
+        "b": {"musicId": "b", "genres": ["rock"], "artistIds": ["y"], "title": "B"},
+        "c": {"musicId": "c", "genres": ["rock"], "artistIds": ["y"], "title": "C"},
+        "d": {"musicId": "d", "genres": ["jazz"], "artistIds": ["z"], "title": "D"},
+    }
+    reactions = {}
+
+    def save_feed(user_id, stored, top_rows, version):
+        state["saved"] = {r["musicId"]: r for r in top_rows}
+
+    def full_recompute(user_id):
+        state["full"] += 1
+        return -1
+
+    monkeypatch.setattr(feed, "load_feed", lambda uid: {m: dict(e) for m, e in state["stored"].items()})
+    monkeypatch.setattr(feed, "save_feed", save_feed)
+    monkeypatch.setattr(feed, "full_recompute", full_recompute)
+    monkeypatch.setattr(feed, "load_subscriptions", lambda uid: (state["artists"], {"rock"}))
+    monkeypatch.setattr(feed, "load_reactions", lambda uid: reactions)
+    monkeypatch.setattr(feed, "load_genre_affinity", lambda uid, now: {})
+    monkeypatch.setattr(feed, "batch_get_songs", lambda ids: {m: songs[m] for m in ids if m in songs})
+    monkeypatch.setattr(feed, "genre_song_ids", lambda g: tuple(m for m, s in songs.items() if g in s["genres"]))
+    monkeypatch.setattr(feed, "artist_song_ids", lambda a: tuple(m for m, s in songs.items() if a in s["artistIds"]))
+    feed.test_state, feed.test_songs, feed.test_reactions = state, songs, reactions
+    return feed
+
+
+def msg(reason, music_id):
+    return {"userId": "u1", "reason": reason, "musicId": music_id}
+
+
+def test_is_incremental(feed):
+    assert feed.is_incremental(msg("rate", "a"))
+    assert feed.is_incremental(msg("delete_song_genre", "a"))
+    assert feed.is_incremental(msg("subscribe", "genre#rock"))
+    assert not feed.is_incremental(msg("subscribe", None))
+    assert not feed.is_incremental(msg("rate", None))
+    # a song removed from the user's feed rows needs a refill from the full candidate set
+    assert not feed.is_incremental(msg("delete_song_holder", "a"))
+
+
+def test_rate_rescores_only_the_rated_song(feed):
+    feed.test_state["stored"] = {"a": {"score": Decimal(7)}, "b": {"score": Decimal(7)}}
+    feed.test_reactions["c"] = "like"
+
+    assert feed.recompute_user("u1", [msg("rate", "c")]) == 3
+
+    saved = feed.test_state["saved"]
+    assert saved["c"]["score"] == Decimal(17)
+    assert saved["c"]["song"]["title"] == "C"
+    # untouched rows are carried over as stored, without a new row to write
+    assert saved["a"] == {"musicId": "a", "score": Decimal(7)}
+    assert feed.test_state["full"] == 0
+
+
+def test_deleted_song_leaves_a_partial_feed(feed):
+    feed.test_state["stored"] = {"a": {"score": Decimal(7)}, "b": {"score": Decimal(7)}}
+
+    assert feed.recompute_user("u1", [msg("delete_song_genre", "a")]) == 1
+    assert set(feed.test_state["saved"]) == {"b"}
+
+
+def test_deleting_a_song_not_in_the_feed_changes_nothing(feed):
+    feed.test_state["stored"] = {"b": {"score": Decimal(7)}}
+
+    feed.recompute_user("u1", [msg("delete_song_artist", "a")])
+    assert set(feed.test_state["saved"]) == {"b"}
+    assert feed.test_state["full"] == 0
+
+
+def test_subscribe_adds_the_targets_songs(feed):
+    feed.test_state["stored"] = {"a": {"score": Decimal(7)}}
+    feed.test_state["artists"] = {"y"}   # the subscription row is written before the message
+
+    feed.recompute_user("u1", [msg("subscribe", "artist#y")])
+    saved = feed.test_state["saved"]
+    assert set(saved) == {"a", "b", "c"}
+    assert saved["b"]["score"] == Decimal(22)
+
+
+def test_falls_back_to_full_rebuild(feed):
+    # no stored feed yet
+    assert feed.recompute_user("u1", [msg("rate", "a")]) == -1
+
+    # removal from a full feed: the replacement row is not among the loaded songs
+    feed.test_state["stored"] = {f"s{i}": {"score": Decimal(10)} for i in range(feed.FEED_SIZE)}
+    assert feed.recompute_user("u1", [msg("delete_song_genre", "s3")]) == -1
+
+    # a stored row dropping below the floor of a full feed
+    feed.test_state["stored"]["a"] = feed.test_state["stored"].pop("s0")
+    feed.test_reactions["a"] = "dislike"
+    assert feed.recompute_user("u1", [msg("rate", "a")]) == -1
+
+    # non-incremental reasons
+    assert feed.recompute_user("u1", [msg("rate", "b"), msg("unsubscribe", "genre#rock")]) == -1
+    assert feed.test_state["full"] == 4
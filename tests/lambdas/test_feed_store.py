@@ -0,0 +1,176 @@
+from decimal import Decimal
+
+import pytest
+
+from tests.lambdas.fake_aws import client_error
+
+MODES = ["rows", "snapshot", "packed"]
+
+
+class FakeFeedTable:
+    """USER_FEED_TABLE in memory: (userId, musicId) items plus the score index."""
+    def __init__(self):
+        self.items = {}
+        self.writes = 0
+
+    def _key(self, key):
+        return key["userId"], key["musicId"]
+
+    def get_item(self, Key, ConsistentRead=False):
+        item = self.items.get(self._key(Key))
+        return {"Item": dict(item)} if item else {}
+
+    def put_item(self, Item, ConditionExpression=None, ExpressionAttributeValues=None, ReturnValues=None):
+        old = self.items.get(self._key(Item))
+        if ConditionExpression:
+            # "attribute_not_exists(a) OR a < :v"
+            attr = ConditionExpression.split("(", 1)[1].split(")", 1)[0]
+            if old and attr in old and not old[attr] < ExpressionAttributeValues[":v"]:
+                raise client_error("ConditionalCheckFailedException", "PutItem")
+        self.items[self._key(Item)] = dict(Item)
+        self.writes += 1
+        return {"Attributes": old} if ReturnValues == "ALL_OLD" and old else {}
+
+    def update_item(self, Key, UpdateExpression, ExpressionAttributeValues):
+        assert UpdateExpression == "SET expiresAt = :exp"
+        self.items.setdefault(self._key(Key), dict(Key))["expiresAt"] = ExpressionAttributeValues[":exp"]
+
+    def delete_item(self, Key):
+        self.items.pop(self._key(Key), None)
+        self.writes += 1
+
+    def batch_writer(self):
+        table = self
+
+        class Writer:
+            def __enter__(self):
+                return table
+
+            def __exit__(self, *exc):
+                return False
+        return Writer()
+
+    def query(self, KeyConditionExpression, IndexName=None, ScanIndexForward=True, Limit=None,
+              ExclusiveStartKey=None, ProjectionExpression=None):
+        user_id = KeyConditionExpression.expr[2]
+        items = [dict(it) for (uid, _), it in sorted(self.items.items()) if uid == user_id]
+        if IndexName:
+            items = [it for it in items if "score" in it]
+            items.sort(key=lambda it: (it["score"], it["musicId"]), reverse=not ScanIndexForward)
+        if ExclusiveStartKey:
+            keys = [(it["userId"], it["musicId"]) for it in items]
+            items = items[keys.index(self._key(ExclusiveStartKey)) + 1:]
+        resp = {"Items": items[:Limit] if Limit else items}
+        if Limit and len(items) > Limit:
+            last = items[Limit - 1]
+            resp["LastEvaluatedKey"] = {"userId": last["userId"], "musicId": last["musicId"], "score": last["score"]}
+        return resp
+
+
+def load_store(load_lambda, monkeypatch, mode):
+    store = load_lambda("user", "common.feed_store", FEED_STORAGE_MODE=mode)
+    table = FakeFeedTable()
+    monkeypatch.setattr(store, "_feed_table", lambda: table)
+    store.test_table = table
+    return store
+
+
+@pytest.fixture(params=MODES)
+def store(request, load_lambda, monkeypatch):
+    return load_store(load_lambda, monkeypatch, request.param)
+
+
+def row(music_id, score, title=None):
+    r = {"userId": "u1", "musicId": music_id, "score": Decimal(score), "reason": {}, "createdAt": 1}
+    if title:
+        r["song"] = {"title": title}
+    return r
+
+
+def test_save_load_and_page_through(store):
+    rows = [row(f"m{i}", i, title=f"T{i}") for i in range(5)]
+    store.save_feed("u1", store.load_feed("u1"), rows, 1)
+
+    assert {m: e["score"] for m, e in store.load_feed("u1").items()} == {f"m{i}": Decimal(i) for i in range(5)}
+
+    page, more = store.read_feed_page("u1", None, 2)
+    assert [e["musicId"] for e in page] == ["m4", "m3"] and more
+    assert page[0]["song"] == {"title": "T4"}
+    page, more = store.read_feed_page("u1", (page[-1]["score"], page[-1]["musicId"]), 10)
+    assert [e["musicId"] for e in page] == ["m2", "m1", "m0"] and not more
+
+
+def test_save_replaces_the_previous_feed(store):
+    store.save_feed("u1", store.load_feed("u1"), [row("a", 1), row("b", 2)], 1)
+    store.save_feed("u1", store.load_feed("u1"), [row("b", 3), row("c", 1)], 2)
+
+    assert {m: e["score"] for m, e in store.load_feed("u1").items()} == {"b": Decimal(3), "c": Decimal(1)}
+    page, _ = store.read_feed_page("u1", None, 10)
+    assert [e["musicId"] for e in page] == ["b", "c"]
+
+
+def test_rows_only_write_what_changed(load_lambda, monkeypatch):
+    store = load_store(load_lambda, monkeypatch, "rows")
+    store.save_feed("u1", {}, [row("a", 1), row("b", 2)], 1)
+    table = store.test_table
+    table.writes = 0
+
+    stored = store.load_feed("u1")
+    # "a" is carried over unchanged (no userId: a stored entry), "b" rescored, "c" new
+    store.save_feed("u1", stored, [{"musicId": "a", "score": Decimal(1)}, row("b", 5), row("c", 1)], 2)
+
+    assert table.writes == 2
+    assert table.items[("u1", "c")]["songRef"] == "c"
+    assert table.items[("u1", "a")]["feedVersion"] == 1
+
+
+def test_snapshot_pointer_only_moves_forward(load_lambda, monkeypatch):
+    store = load_store(load_lambda, monkeypatch, "snapshot")
+    table = store.test_table
+    store.save_feed("u1", {}, [row("a", 1)], 5)
+    store.save_feed("u1", {}, [row("b", 1)], 3)     # a slower, older recompute
+
+    assert set(store.load_feed("u1")) == {"a"}
+    assert "expiresAt" in table.items[("u1", "#v#3")]
+    store.save_feed("u1", {}, [row("c", 1)], 7)
+    assert set(store.load_feed("u1")) == {"c"}
+    assert "expiresAt" in table.items[("u1", "#v#5")]
+    assert "expiresAt" not in table.items[("u1", "#v#7")]
+
+
+def test_packed_ignores_older_versions(load_lambda, monkeypatch):
+    store = load_store(load_lambda, monkeypatch, "packed")
+    store.save_feed("u1", {}, [row("a", 1)], 5)
+    store.save_feed("u1", {}, [row("b", 1)], 3)
+
+    assert set(store.load_feed("u1")) == {"a"}
+
+
+def test_packed_fit_strips_display_fields_from_the_bottom(load_lambda, monkeypatch):
+    store = load_store(load_lambda, monkeypatch, "packed")
+    monkeypatch.setattr(store, "MAX_PACKED_BYTES", 1000)
+    entries = [[f"m{i}", Decimal(100 - i), {"song": {"title": "x" * 50}}] for i in range(12)]
+
+    fitted = store._fit_packed([list(e) for e in entries])
+
+    assert len(fitted) == 12
+    assert store._packed_size(fitted) <= 1000
+    kept = [len(e) > 2 for e in fitted]
+    # the best entries keep their fields; the stripped ones are a bottom run
+    assert kept[0] and not kept[-1] and kept == sorted(kept, reverse=True)
+    # stopped as soon as it fit: keeping one more entry's fields would not
+    first_stripped = kept.index(False)
+    restored = [list(e) for e in fitted]
+    restored[first_stripped] = entries[first_stripped]
+    assert store._packed_size(restored) > 1000
+
+
+def test_packed_fit_drops_entries_when_fields_are_not_enough(load_lambda, monkeypatch):
+    store = load_store(load_lambda, monkeypatch, "packed")
+    monkeypatch.setattr(store, "MAX_PACKED_BYTES", store.PACKED_ITEM_OVERHEAD + 40)
+
+    fitted = store._fit_packed([[f"m{i}", Decimal(i), {"t": "x"}] for i in range(10)])
+
+    assert 0 < len(fitted) < 10
+    assert all(len(e) == 2 for e in fitted)
+    assert store._packed_size(fitted) <= store.MAX_PACKED_BYTES
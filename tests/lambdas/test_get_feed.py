@@ -0,0 +1,50 @@
+import json
+from decimal import Decimal
+
+import pytest
+
+EVENT = {"requestContext": {"authorizer": {"claims": {"sub": "u1"}}}, "queryStringParameters": {"limit": "10"}}
+PAGE = [
+    {"musicId": "m1", "score": Decimal(9), "song": {"title": "One", "genres": ["rock"]}},
+    {"musicId": "m2", "score": Decimal(8), "song": {"title": "Two", "genres": ["rock"]}},
+    {"musicId": "m3", "score": Decimal(7)},     # written before song summaries
+]
+
+
+def load_get_feed(load_lambda, monkeypatch, **env):
+    get_feed = load_lambda("user", "get_feed", SONG_TABLE="songs", S3_BUCKET="bucket", **env)
+    existing = {"m1": {"musicId": "m1"}, "m3": {"musicId": "m3", "title": "Three", "genres": ["pop"]}}
+    get_feed.reads = []
+
+    def batch_get_by_id(table, key, ids, projection=None):
+        get_feed.reads.append((list(ids), projection))
+        return {i: dict(existing[i]) for i in ids if i in existing}
+
+    monkeypatch.setattr(get_feed, "read_feed_page", lambda uid, after, limit: ([dict(e) for e in PAGE], False))
+    monkeypatch.setattr(get_feed, "batch_get_by_id", batch_get_by_id)
+    monkeypatch.setattr(get_feed, "presign_from_full_url", lambda url: url)
+    return get_feed
+
+
+def titles(get_feed):
+    res = get_feed.lambda_handler(EVENT, None)
+    assert res["statusCode"] == 200
+    return [s["title"] for s in json.loads(res["body"])["songs"]]
+
+
+@pytest.mark.parametrize("env", [
+    {"FEED_STORAGE_MODE": "packed", "FEED_MUSIC_INDEX": "FeedMusicIndex"},
+    {"FEED_STORAGE_MODE": "rows", "FEED_MUSIC_INDEX": ""},
+])
+def test_deleted_songs_are_dropped_from_summarized_entries(load_lambda, monkeypatch, env):
+    get_feed = load_get_feed(load_lambda, monkeypatch, **env)
+
+    assert titles(get_feed) == ["One", "Three"]
+    assert get_feed.reads[-1] == (["m1", "m2"], ["musicId"])
+
+
+def test_row_feeds_with_feed_music_index_trust_the_summary(load_lambda, monkeypatch):
+    get_feed = load_get_feed(load_lambda, monkeypatch, FEED_STORAGE_MODE="rows", FEED_MUSIC_INDEX="FeedMusicIndex")
+
+    assert titles(get_feed) == ["One", "Two", "Three"]
+    assert get_feed.reads == [(["m3"], None)]
@@ -0,0 +1,86 @@
+import json
+import zlib
+from unittest import mock
+
+import pytest
+
+from tests.lambdas.fake_aws import client_error
+
+
+class FakeSongTable:
+    """SongTable split into scan segments by musicId, two items per page."""
+    def __init__(self, songs):
+        self.songs = songs
+
+    def scan(self, Segment, TotalSegments, ExclusiveStartKey=None, **kwargs):
+        keys = sorted(k for k in self.songs if zlib.crc32(k.encode()) % TotalSegments == Segment)
+        if ExclusiveStartKey:
+            keys = [k for k in keys if k > ExclusiveStartKey["musicId"]]
+        page = keys[:2]
+        # the listKey filter
+        items = [{"musicId": k} for k in page if self.songs[k].get("listKey") in (None, "songs")]
+        resp = {"Items": items, "ConsumedCapacity": {"CapacityUnits": 0.5}}
+        if len(keys) > 2:
+            resp["LastEvaluatedKey"] = {"musicId": page[-1]}
+        return resp
+
+    def update_item(self, Key, UpdateExpression, ConditionExpression, ExpressionAttributeValues):
+        song = self.songs.get(Key["musicId"])
+        if song is None or song.get("listKey") not in (None, ExpressionAttributeValues[":legacy"]):
+            raise client_error("ConditionalCheckFailedException", "UpdateItem")
+        song["listKey"] = ExpressionAttributeValues[":k"]
+
+
+class Context:
+    def __init__(self, calls_before_timeout):
+        self.left = calls_before_timeout
+
+    def get_remaining_time_in_millis(self):
+        self.left -= 1
+        return 60000 if self.left > 0 else 0
+
+
+@pytest.fixture
+def backfill(load_lambda, monkeypatch):
+    songs = {f"m{i:02d}": {} for i in range(30)}
+    for i in range(0, 30, 3):
+        songs[f"m{i:02d}"]["listKey"] = "songs"           # unsharded listing
+    for i in range(1, 30, 3):
+        songs[f"m{i:02d}"]["listKey"] = "songs#1"         # already done
+    table = FakeSongTable(songs)
+
+    mod = load_lambda(
+        "music", "backfill_listing",
+        SONG_TABLE="songs", MUSIC_BY_GENRE_TABLE="genres", ARTIST_INFO_TABLE="artists",
+    )
+    import common.scan
+    session = mock.MagicMock()
+    session.resource.return_value.Table.return_value = table
+    monkeypatch.setattr(common.scan.boto3.session, "Session", lambda: session)
+    mod.song_table = table
+    from common.song_records import listing_key
+    mod.expected_key = listing_key
+    return mod
+
+
+def test_backfill_shards_every_song(backfill):
+    result = backfill.lambda_handler({}, None)
+
+    assert result == {"done": True, "updated": 20}
+    for music_id, song in backfill.song_table.songs.items():
+        if int(music_id[1:]) % 3 == 1:
+            assert song["listKey"] == "songs#1"     # left alone
+        else:
+            assert song["listKey"] == backfill.expected_key(music_id)
+
+
+def test_backfill_resumes_from_its_checkpoint(backfill):
+    first = backfill.lambda_handler({}, Context(calls_before_timeout=5))
+    assert first["done"] is False and 0 < first["updated"] < 20
+
+    # the payload goes through a JSON round trip (Lambda invoke)
+    second = backfill.lambda_handler(json.loads(json.dumps({"checkpoint": first["checkpoint"]})), None)
+
+    assert second["done"] is True
+    assert first["updated"] + second["updated"] == 20
+    assert all(s["listKey"].startswith("songs#") for s in backfill.song_table.songs.values())
@@ -0,0 +1,136 @@
+import json
+import sys
+import types
+from unittest import mock
+
+import pytest
+
+from tests.lambdas.fake_aws import client_error
+
+MUSIC_ID = "11111111-2222-3333-4444-555555555555"
+KEY = "music/aaaaaaaa-bbbb-cccc-dddd-eeeeeeeeeeee-song.mp3"
+
+
+@pytest.fixture
+def mp(load_lambda, monkeypatch):
+    mp = load_lambda(
+        "music", "multipart_upload",
+        S3_BUCKET="bucket", SONG_TABLE="songs", MUSIC_BY_GENRE_TABLE="genres", ARTIST_INFO_TABLE="artists",
+    )
+    mp.s3 = mock.MagicMock()
+    mp.s3.head_object.return_value = {"Metadata": {"music-id": MUSIC_ID}, "ContentLength": 12345}
+    monkeypatch.setattr(mp, "write_song_records", mock.MagicMock())
+    # complete_handler imports notify_new_song from upload_music when it runs
+    upload_music = types.ModuleType("upload_music")
+    upload_music.notify_new_song = mock.MagicMock()
+    monkeypatch.setitem(sys.modules, "upload_music", upload_music)
+    mp.notify_new_song = upload_music.notify_new_song
+    return mp
+
+
+def complete(mp, **overrides):
+    body = {
+        "musicId": MUSIC_ID,
+        "key": KEY,
+        "uploadId": "up-1",
+        "parts": [{"partNumber": 2, "eTag": "e2"}, {"partNumber": 1, "eTag": "e1"}],
+        "title": "Song",
+        "genres": ["rock"],
+        "artistIds": ["art-1"],
+        **overrides,
+    }
+    res = mp.complete_handler({"httpMethod": "POST", "body": json.dumps(body)}, None)
+    return res["statusCode"], json.loads(res["body"])
+
+
+def test_part_size_grows_to_fit_max_parts(mp):
+    assert mp._part_size_for(1, None) == mp.DEFAULT_PART_SIZE
+    assert mp._part_size_for(1, 1) == mp.MIN_PART_SIZE
+    huge = mp.MAX_PARTS * mp.DEFAULT_PART_SIZE * 2
+    assert mp._part_size_for(huge, None) * mp.MAX_PARTS >= huge
+
+
+def test_complete_stitches_parts_and_writes_the_song(mp):
+    status, body = complete(mp)
+
+    assert status == 201
+    parts = mp.s3.complete_multipart_upload.call_args.kwargs["MultipartUpload"]["Parts"]
+    assert [p["PartNumber"] for p in parts] == [1, 2]
+
+    actions = mp.write_song_records.call_args.args[0]
+    song = actions[0]["Put"]["Item"]
+    assert song["musicId"] == {"S": MUSIC_ID}
+    assert song["fileName"] == {"S": "song.mp3"}
+    assert song["fileSize"] == {"N": "12345"}
+    assert song["listKey"]["S"].startswith("songs#")
+    assert {a["Put"]["Item"]["genre"]["S"] for a in actions[1:] if "Put" in a} == {"rock"}
+    mp.notify_new_song.assert_called_once_with(MUSIC_ID, "Song", ["art-1"], ["rock"])
+    assert body["fileUrl"] == f"https://bucket.s3.amazonaws.com/{KEY}"
+
+
+def test_failed_complete_keeps_the_parts(mp):
+    mp.s3.complete_multipart_upload.side_effect = client_error("InvalidPart", "CompleteMultipartUpload")
+
+    status, _ = complete(mp)
+
+    assert status == 400
+    # the client can retry with the right parts; the lifecycle rule cleans up abandoned uploads
+    mp.s3.abort_multipart_upload.assert_not_called()
+    mp.write_song_records.assert_not_called()
+
+
+def test_retry_after_the_upload_was_completed_writes_the_song(mp):
+    mp.s3.complete_multipart_upload.side_effect = client_error("NoSuchUpload", "CompleteMultipartUpload")
+
+    status, _ = complete(mp)
+
+    assert status == 201
+    mp.write_song_records.assert_called_once()
+    mp.notify_new_song.assert_called_once()
+
+
+def test_retry_after_the_song_was_written_still_notifies(mp):
+    mp.s3.complete_multipart_upload.side_effect = client_error("NoSuchUpload", "CompleteMultipartUpload")
+    cancelled = client_error("TransactionCanceledException", "TransactWriteItems")
+    cancelled.response["CancellationReasons"] = [{"Code": "ConditionalCheckFailed"}, {"Code": "None"}]
+    mp.write_song_records.side_effect = cancelled
+
+    status, _ = complete(mp)
+
+    assert status == 201
+    mp.notify_new_song.assert_called_once()
+
+
+def test_unknown_upload_without_an_object_is_a_bad_request(mp):
+    mp.s3.complete_multipart_upload.side_effect = client_error("NoSuchUpload", "CompleteMultipartUpload")
+    mp.s3.head_object.side_effect = client_error("404", "HeadObject")
+
+    status, _ = complete(mp)
+
+    assert status == 400
+    mp.write_song_records.assert_not_called()
+
+
+def test_object_must_belong_to_the_music_id(mp):
+    mp.s3.head_object.return_value = {"Metadata": {"music-id": "someone-else"}, "ContentLength": 1}
+
+    status, body = complete(mp)
+
+    assert status == 400
+    assert "does not match" in body["error"]
+    mp.write_song_records.assert_not_called()
+    mp.notify_new_song.assert_not_called()
+
+
+@pytest.mark.parametrize("overrides", [
+    {"key": "covers/x.jpg"},
+    {"coverKey": "music/not-a-cover"},
+    {"parts": [{"partNumber": 1}]},
+    {"genres": "rock"},
+    {"artistIds": []},
+])
+def test_complete_rejects_bad_input(mp, overrides):
+    status, _ = complete(mp, **overrides)
+
+    assert status == 400
+    mp.s3.complete_multipart_upload.assert_not_called()
@@ -0,0 +1,47 @@
+import json
+from unittest import mock
+
+import pytest
+
+
+@pytest.fixture
+def notify(load_lambda, monkeypatch):
+    mod = load_lambda(
+        "music", "notify_release",
+        NOTIFICATIONS_TOPIC_ARN="topic", SUBSCRIPTIONS_TABLE="subs", RELEASE_NOTIFICATION_TABLE="sent",
+    )
+    subscribers = {("artist", "a1"): ["u1", "u2"], ("genre", "rock"): ["u2", "u3", "u4", "u5"]}
+    monkeypatch.setattr(mod, "iter_subscriber_ids", lambda table, kind, target: iter(subscribers.get((kind, target), [])))
+    monkeypatch.setattr(mod, "AUDIENCE_PER_PUBLISH", 2)
+    mod.sns = mock.MagicMock()
+    mod.sent = set()
+    monkeypatch.setattr(mod, "sent_chunks", lambda music_id: set(mod.sent))
+    monkeypatch.setattr(mod, "mark_chunk_sent", lambda music_id, index: mod.sent.add(index))
+    return mod
+
+
+RELEASE = {"musicId": "m1", "title": "Song", "artistIds": ["a1"], "genres": ["rock"]}
+
+
+def audiences(mod):
+    return [
+        json.loads(c.kwargs["MessageAttributes"]["userId"]["StringValue"])
+        for c in mod.sns.publish.call_args_list
+    ]
+
+
+def test_release_is_published_in_addressed_chunks(notify):
+    notify.publish_release(RELEASE)
+
+    assert audiences(notify) == [["u1", "u2"], ["u3", "u4"], ["u5"]]
+    # filter policies are set at subscribe time, never from the publish path
+    notify.sns.subscribe.assert_not_called()
+    notify.sns.set_subscription_attributes.assert_not_called()
+
+
+def test_redelivery_skips_chunks_already_sent(notify):
+    notify.sent = {0, 1}
+
+    notify.publish_release(RELEASE)
+
+    assert audiences(notify) == [["u5"]]
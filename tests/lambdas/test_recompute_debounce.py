@@ -0,0 +1,173 @@
+import json
+from unittest import mock
+
+import pytest
+
+from tests.lambdas.fake_aws import client_error
+
+
+class FakePendingTable:
+    """The three marker updates common/queue.py makes, on an in-memory dict."""
+    def __init__(self):
+        self.items = {}
+        self.too_big = False
+        self.invalid = False
+
+    def update_item(self, Key, UpdateExpression, ExpressionAttributeValues, ReturnValues=None):
+        values = ExpressionAttributeValues
+        item = self.items.setdefault(Key["userId"], {})
+        old = dict(item)
+        if UpdateExpression == "SET openedAt = :now":
+            item["openedAt"] = values[":now"]
+            return {}
+        if "ADD deltas" in UpdateExpression:
+            if self.too_big:
+                raise client_error("ValidationException", "UpdateItem",
+                                   "Item size has exceeded the maximum allowed size")
+            if self.invalid:
+                raise client_error("ValidationException", "UpdateItem", "Invalid UpdateExpression")
+            item["deltas"] = item.get("deltas", set()) | values[":d"]
+        else:
+            item.pop("deltas", None)
+            item["fullRebuild"] = values[":t"]
+        item["version"] = item.get("version", 0) + values[":one"]
+        item.setdefault("openedAt", values[":now"])
+        item["expiresAt"] = values[":exp"]
+        return {"Attributes": {k: v for k, v in old.items() if k in ("openedAt", "version", "expiresAt")}}
+
+
+@pytest.fixture
+def queue(load_lambda, monkeypatch):
+    queue = load_lambda("music", "common.queue", RECOMPUTE_QUEUE_URL="queue-url", PENDING_RECOMPUTE_TABLE="pending")
+    table = FakePendingTable()
+    monkeypatch.setattr(queue, "_pending_table", lambda: table)
+    queue.sqs = mock.MagicMock()
+    queue.sqs.send_message_batch.return_value = {}
+    queue.test_table = table
+    return queue
+
+
+def sent_bodies(queue):
+    return [
+        json.loads(e["MessageBody"])
+        for call in queue.sqs.send_message_batch.call_args_list
+        for e in call.kwargs["Entries"]
+    ]
+
+
+def test_only_the_request_that_opens_the_window_sends(queue):
+    with queue.RecomputeBatch() as batch:
+        batch.add("u1", "rate", "m1")
+        batch.add("u2", "new_song_genre", "m1")
+    with queue.RecomputeBatch() as batch:
+        batch.add("u1", "rate", "m2")
+
+    assert sorted(b["userId"] for b in sent_bodies(queue)) == ["u1", "u2"]
+    deltas = {tuple(json.loads(d)) for d in queue.test_table.items["u1"]["deltas"]}
+    assert deltas == {("rate", "m1"), ("rate", "m2")}
+    assert queue.test_table.items["u1"]["version"] == 2
+
+
+def test_requests_for_the_same_song_are_coalesced(queue):
+    with queue.RecomputeBatch() as batch:
+        batch.add("u1", "rate", "m1")
+        batch.add("u1", "unsubscribe_rate", "m1")
+        batch.add("u1", "rate", "m2")
+
+    assert queue.sqs.send_message_batch.call_count == 1
+    assert {tuple(json.loads(d)) for d in queue.test_table.items["u1"]["deltas"]} == {("rate", "m1"), ("rate", "m2")}
+
+
+def test_stale_marker_is_rearmed(queue, monkeypatch):
+    queue.test_table.items["u1"] = {"openedAt": 1000, "version": 1, "deltas": set()}
+    monkeypatch.setattr(queue.time, "time", lambda: 1000 + queue.STALE_MARKER_SECONDS + 1)
+
+    with queue.RecomputeBatch() as batch:
+        batch.add("u1", "rate", "m1")
+
+    assert len(sent_bodies(queue)) == 1
+    assert queue.test_table.items["u1"]["openedAt"] == 1000 + queue.STALE_MARKER_SECONDS + 1
+
+
+def test_oversized_marker_falls_back_to_full_rebuild(queue):
+    queue.test_table.too_big = True
+
+    with queue.RecomputeBatch() as batch:
+        batch.add("u1", "rate", "m1")
+
+    marker = queue.test_table.items["u1"]
+    assert marker["fullRebuild"] is True and "deltas" not in marker
+    assert len(sent_bodies(queue)) == 1
+
+
+def test_other_validation_errors_are_not_taken_for_the_size_limit(queue):
+    queue.test_table.invalid = True
+
+    with pytest.raises(Exception, match="ValidationException"):
+        queue._mark_pending("u1", [("u1", "rate", "m1")], 1000)
+
+    assert "fullRebuild" not in queue.test_table.items["u1"]
+
+
+def test_repeats_after_a_flush_merge_into_the_open_marker(queue, monkeypatch):
+    monkeypatch.setattr(queue, "MAX_BUFFERED", 2)
+
+    with queue.RecomputeBatch() as batch:
+        batch.add("u1", "rate", "m1")
+        batch.add("u2", "rate", "m1")    # flushes
+        batch.add("u1", "rate", "m1")
+
+    assert sorted(b["userId"] for b in sent_bodies(queue)) == ["u1", "u2"]
+    assert queue.test_table.items["u1"]["version"] == 2
+
+
+def test_big_audiences_are_sent_in_batches_of_ten(queue):
+    with queue.RecomputeBatch() as batch:
+        for i in range(25):
+            batch.add(f"u{i}", "new_song_genre", "m1")
+
+    sizes = sorted(len(c.kwargs["Entries"]) for c in queue.sqs.send_message_batch.call_args_list)
+    assert sizes == [5, 10, 10]
+
+
+class FakeFeedPendingTable:
+    def __init__(self, markers):
+        self.markers = list(markers)    # what each get_item returns, in order
+        self.deletes = []
+
+    def get_item(self, Key, ConsistentRead):
+        return {"Item": self.markers.pop(0)} if self.markers else {}
+
+    def delete_item(self, Key, ConditionExpression):
+        self.deletes.append(ConditionExpression)
+        if len(self.deletes) == 1 and self.markers:
+            raise client_error("ConditionalCheckFailedException", "DeleteItem")
+
+
+@pytest.fixture
+def feed(load_lambda, monkeypatch):
+    feed = load_lambda("user", "feed", PENDING_RECOMPUTE_TABLE="pending")
+    feed.test_calls = []
+    monkeypatch.setattr(feed, "recompute_user", lambda uid, msgs: feed.test_calls.append(msgs) or len(msgs))
+    monkeypatch.setattr(feed, "invalidate_songs", lambda ids: list(ids))
+    return feed
+
+
+def test_marker_messages(feed):
+    marker = {"deltas": {json.dumps(["rate", "m1"])}, "version": 1}
+    assert feed.marker_messages("u1", marker) == [{"userId": "u1", "reason": "rate", "musicId": "m1"}]
+    assert feed.marker_messages("u1", {"fullRebuild": True})[0]["reason"] == "debounced_full"
+    assert feed.marker_messages("u1", None) == []
+
+
+def test_worker_drains_requests_added_mid_rebuild(feed, monkeypatch):
+    first = {"userId": "u1", "version": 1, "deltas": {json.dumps(["rate", "m1"])}}
+    second = {"userId": "u1", "version": 2, "deltas": {json.dumps(["rate", "m1"]), json.dumps(["rate", "m2"])}}
+    table = FakeFeedPendingTable([first, second])
+    monkeypatch.setattr(feed, "table", lambda name: table)
+
+    feed.recompute_pending("u1", [{"userId": "u1", "reason": "rate", "musicId": "m1"}])
+
+    # the first delete lost to a newer request, so the user was rebuilt a second time
+    assert len(table.deletes) == 2
+    assert [len(msgs) for msgs in feed.test_calls] == [2, 2]
@@ -0,0 +1,56 @@
+import json
+from unittest import mock
+
+import pytest
+
+from tests.lambdas.fake_aws import client_error
+
+
+@pytest.fixture
+def rp(load_lambda):
+    rp = load_lambda("user", "record_play", USER_HISTORY_TABLE="history")
+    rp.dynamo_client = mock.MagicMock()
+    return rp
+
+
+def plays_av(n):
+    return {"L": [{"M": {"genre": {"S": "rock"}, "playedAt": {"N": str(i)}}} for i in range(n)]}
+
+
+def record(rp, genre="rock"):
+    event = {
+        "body": json.dumps({"genre": genre}),
+        "requestContext": {"authorizer": {"claims": {"sub": "user-1"}}},
+    }
+    res = rp.lambda_handler(event, None)
+    return res["statusCode"], json.loads(res["body"])
+
+
+def test_play_is_appended_and_history_returned(rp):
+    rp.dynamo_client.update_item.return_value = {"Attributes": {"recentPlays": plays_av(3)}}
+
+    status, body = record(rp)
+
+    assert status == 200
+    assert body["history"] == [{"genre": "rock", "playedAt": i} for i in range(3)]
+    kwargs = rp.dynamo_client.update_item.call_args.kwargs
+    assert "list_append" in kwargs["UpdateExpression"]
+    assert kwargs["ExpressionAttributeValues"][":play"]["L"][0]["M"]["genre"] == {"S": "rock"}
+    assert rp.dynamo_client.update_item.call_count == 1
+
+
+def test_history_is_bounded_and_trimmed_past_the_slack(rp):
+    length = rp.MAX_HISTORY + rp.HISTORY_TRIM_SLACK + 1
+    rp.dynamo_client.update_item.side_effect = [
+        {"Attributes": {"recentPlays": plays_av(length)}},
+        client_error("ConditionalCheckFailedException", "UpdateItem"),
+    ]
+
+    status, body = record(rp)
+
+    assert status == 200
+    assert len(body["history"]) == rp.MAX_HISTORY
+    assert body["history"][-1]["playedAt"] == length - 1
+    trim = rp.dynamo_client.update_item.call_args.kwargs
+    assert trim["UpdateExpression"].count("recentPlays[") == length - rp.MAX_HISTORY
+    assert trim["ExpressionAttributeValues"] == {":n": {"N": str(length)}}
@@ -0,0 +1,86 @@
+import pytest
+
+
+class Recorder:
+    """RecomputeBatch stand-in: keeps the first reason per (user, song), like the real one."""
+    def __init__(self):
+        self.requests = {}
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    def add(self, user_id, reason, music_id=None):
+        self.requests.setdefault((user_id, music_id), reason)
+
+
+class FakeFeedTable:
+    def __init__(self, holders):
+        self.holders = holders
+        self.deleted = []
+        self.queried = 0
+
+    def query(self, IndexName, KeyConditionExpression, ExclusiveStartKey=None):
+        assert IndexName == "FeedMusicIndex"
+        self.queried += 1
+        return {"Items": [{"userId": u, "songRef": KeyConditionExpression.expr[2]} for u in self.holders]}
+
+    def batch_writer(self):
+        table = self
+
+        class Writer:
+            def __enter__(self):
+                return self
+
+            def __exit__(self, *exc):
+                return False
+
+            def delete_item(self, Key):
+                table.deleted.append((Key["userId"], Key["musicId"]))
+        return Writer()
+
+
+def load_fanout(load_lambda, monkeypatch, **env):
+    fanout = load_lambda(
+        "music", "song_fanout",
+        SUBSCRIPTIONS_TABLE="subs", SONG_TABLE="songs", USER_FEED_TABLE="feeds",
+        RECOMPUTE_QUEUE_URL="queue-url", PENDING_RECOMPUTE_TABLE="pending", **env,
+    )
+    fanout.batch = Recorder()
+    monkeypatch.setattr(fanout, "RecomputeBatch", lambda: fanout.batch)
+    subscribers = {("genre", "rock"): ["u2", "u3"], ("artist", "a1"): ["u3"]}
+    monkeypatch.setattr(fanout, "iter_subscriber_ids", lambda table, kind, target: iter(subscribers.get((kind, target), [])))
+    fanout.feed_table = FakeFeedTable(["u1", "u2"])
+    return fanout
+
+
+EVENT = {"event": "delete_song", "musicId": "m1", "artistIds": ["a1"], "genres": ["rock"]}
+
+
+def test_deleted_song_leaves_every_row_feed_holding_it(load_lambda, monkeypatch):
+    fanout = load_fanout(load_lambda, monkeypatch, FEED_STORAGE_MODE="rows", FEED_MUSIC_INDEX="FeedMusicIndex")
+
+    fanout.on_deleted_song(EVENT)
+
+    assert sorted(fanout.feed_table.deleted) == [("u1", "m1"), ("u2", "m1")]
+    # holders get a full rebuild to refill the slot, other subscribers an incremental removal
+    assert fanout.batch.requests == {
+        ("u1", "m1"): "delete_song_holder",
+        ("u2", "m1"): "delete_song_holder",
+        ("u3", "m1"): "delete_song_genre",
+    }
+
+
+@pytest.mark.parametrize("env", [
+    {"FEED_STORAGE_MODE": "packed", "FEED_MUSIC_INDEX": "FeedMusicIndex"},
+    {"FEED_STORAGE_MODE": "rows", "FEED_MUSIC_INDEX": ""},
+])
+def test_without_feed_music_index_only_subscribers_are_notified(load_lambda, monkeypatch, env):
+    fanout = load_fanout(load_lambda, monkeypatch, **env)
+
+    fanout.on_deleted_song(EVENT)
+
+    assert fanout.feed_table.queried == 0 and fanout.feed_table.deleted == []
+    assert set(fanout.batch.requests.values()) == {"delete_song_genre"}
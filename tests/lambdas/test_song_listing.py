@@ -0,0 +1,152 @@
+import json
+
+import pytest
+
+
+class FakeSongTable:
+    """SongTable scanned in key order, a page of `Limit` items at a time."""
+    def __init__(self, songs):
+        self.songs = sorted(songs, key=lambda s: s["musicId"])
+        self.calls = 0
+
+    def scan(self, ProjectionExpression, ExpressionAttributeNames, Limit, ExclusiveStartKey=None):
+        self.calls += 1
+        assert "transcriptText" not in ExpressionAttributeNames.values()
+        items = self.songs
+        if ExclusiveStartKey:
+            items = [s for s in items if s["musicId"] > ExclusiveStartKey["musicId"]]
+        resp = {"Items": items[:Limit]}
+        if len(items) > Limit:
+            resp["LastEvaluatedKey"] = {"musicId": items[Limit - 1]["musicId"]}
+        return resp
+
+
+def song(music_id, created_at="2025-01-01T00:00:00", listable=True):
+    s = {"musicId": music_id, "createdAt": created_at}
+    if listable:
+        s.update(title=f"title {music_id}", fileUrl=f"https://bucket.s3.amazonaws.com/music/{music_id}")
+    return s
+
+
+def load_get_songs(load_lambda, monkeypatch, source):
+    get_songs = load_lambda(
+        "music", "get_songs",
+        SONG_TABLE="songs", S3_BUCKET="bucket", LIST_CURSOR_SECRET="test-secret", SONG_LISTING_SOURCE=source,
+    )
+    monkeypatch.setattr(get_songs, "presign_from_full_url", lambda url: url and f"signed:{url}")
+    return get_songs
+
+
+def list_all(get_songs, limit):
+    """Follow nextCursor through the handler; returns the pages of musicIds."""
+    pages, cursor = [], None
+    while True:
+        params = {"limit": str(limit), **({"cursor": cursor} if cursor else {})}
+        res = get_songs.lambda_handler({"httpMethod": "GET", "queryStringParameters": params}, None)
+        assert res["statusCode"] == 200, res["body"]
+        body = json.loads(res["body"])
+        pages.append([s["musicId"] for s in body["songs"]])
+        cursor = body["nextCursor"]
+        if not cursor:
+            return pages
+
+
+@pytest.fixture
+def scanning(load_lambda, monkeypatch):
+    get_songs = load_get_songs(load_lambda, monkeypatch, "scan")
+    get_songs.song_table = FakeSongTable(
+        [song(f"m{i:02d}") for i in range(12)] + [song("m05x", listable=False), song("m07x", listable=False)]
+    )
+    return get_songs
+
+
+def test_scan_fallback_returns_full_pages_until_the_end(scanning):
+    pages = list_all(scanning, 5)
+
+    assert [len(p) for p in pages] == [5, 5, 2]
+    assert sum(pages, []) == [f"m{i:02d}" for i in range(12)]
+
+
+def test_scan_fallback_presigns_urls(scanning):
+    res = scanning.lambda_handler({"httpMethod": "GET", "queryStringParameters": {"limit": "1"}}, None)
+    first = json.loads(res["body"])["songs"][0]
+    assert first["fileUrl"].startswith("signed:https://")
+
+
+def test_tampered_cursor_is_a_bad_request(scanning):
+    res = scanning.lambda_handler({"httpMethod": "GET", "queryStringParameters": {"cursor": "abc.def"}}, None)
+    assert res["statusCode"] == 400
+
+
+class FakeListingIndex:
+    """SongListingIndex: per-listKey partitions sorted by createdAt, newest first."""
+    def __init__(self, songs, listing_key):
+        self.shards = {}
+        for s in songs:
+            self.shards.setdefault(listing_key(s["musicId"]), []).append({**s, "listKey": listing_key(s["musicId"])})
+        for items in self.shards.values():
+            items.sort(key=lambda s: (s["createdAt"], s["musicId"]), reverse=True)
+        self.queried = []
+
+    def query(self, IndexName, KeyConditionExpression, ScanIndexForward, ProjectionExpression,
+              ExpressionAttributeNames, Limit, ExclusiveStartKey=None):
+        assert IndexName == "SongListingIndex" and not ScanIndexForward
+        key = KeyConditionExpression.expr[2]
+        self.queried.append(key)
+        items = self.shards.get(key, [])
+        if ExclusiveStartKey:
+            start = (ExclusiveStartKey["createdAt"], ExclusiveStartKey["musicId"])
+            items = [s for s in items if (s["createdAt"], s["musicId"]) < start]
+        resp = {"Items": items[:Limit]}
+        if len(items) > Limit:
+            last = items[Limit - 1]
+            resp["LastEvaluatedKey"] = {"listKey": key, "createdAt": last["createdAt"], "musicId": last["musicId"]}
+        return resp
+
+
+@pytest.fixture
+def listing(load_lambda, monkeypatch):
+    get_songs = load_get_songs(load_lambda, monkeypatch, "index")
+    monkeypatch.setenv("MUSIC_BY_GENRE_TABLE", "genres")
+    monkeypatch.setenv("ARTIST_INFO_TABLE", "artists")
+    from common.song_records import listing_key
+
+    def make(songs):
+        get_songs.song_table = FakeListingIndex(songs, listing_key)
+        return get_songs
+    return make
+
+
+def test_shards_are_merged_newest_first(listing):
+    # a few songs share a timestamp, across shards
+    songs = [song(f"m{i:02d}", f"2025-01-{1 + i // 3:02d}T00:00:00") for i in range(40)]
+    songs += [song("hidden", "2025-02-01T00:00:00", listable=False)]
+    get_songs = listing(songs)
+
+    pages = list_all(get_songs, 7)
+
+    expected = [s["musicId"] for s in sorted(songs[:40], key=lambda s: (s["createdAt"], s["musicId"]), reverse=True)]
+    assert sum(pages, []) == expected
+    assert all(len(p) == 7 for p in pages[:-1])
+    assert len(get_songs.song_table.shards) > 1
+
+
+def test_finished_shards_are_not_queried_again(listing):
+    get_songs = listing([song("a", "2025-01-01T00:00:00"), song("b", "2025-01-02T00:00:00")]
+                        + [song(f"n{i}", f"2025-03-{i + 1:02d}T00:00:00") for i in range(8)])
+    shards_with_songs = len(get_songs.song_table.shards)
+
+    page, after = get_songs.list_songs(3, None)
+    assert len(page) == 3 and after is not None
+    # shards without songs (or fully returned) are finished after the first page
+    assert len(after["d"]) >= get_songs.LISTING_SHARDS - shards_with_songs
+
+    get_songs.song_table.queried.clear()
+    page, _ = get_songs.list_songs(3, after)
+    assert len(page) == 3
+    assert {int(k.rsplit("#", 1)[1]) for k in get_songs.song_table.queried}.isdisjoint(after["d"])
+
+
+def test_empty_catalog(listing):
+    get_songs = listing([])
+    assert get_songs.list_songs(10, None) == ([], None)